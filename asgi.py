@@ -0,0 +1,10 @@
+"""
+This file will start the realtime (websocket) application
+
+    uvicorn asgi:application
+"""
+
+from studyonline import create_app
+from studyonline.realtime.asgi import create_asgi_app
+
+application = create_asgi_app(create_app())
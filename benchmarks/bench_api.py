@@ -0,0 +1,86 @@
+"""
+JSON API (/api/v1) against the HTML pages showing the same rooms.
+
+Pairs each HTML listing with the API request for the same page (5 rooms),
+then streams the whole room table as JSON Lines and, for comparison, builds
+the same output from full ORM objects.
+
+    python -m benchmarks.bench_api --rooms 100000 --requests 500
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.common import BenchConfig, make_app, print_table, run_workers
+from benchmarks.datagen import generate
+from studyonline import db
+from studyonline.models import Room, User
+
+
+class ApiConfig(BenchConfig):
+    # render the home feed on every request instead of serving it cached
+    FEED_CACHE_TTL = 0
+    FEED_CACHE_STALE_TTL = 0
+
+
+def orm_jsonl(app):
+    """
+    What the stream would cost built from ORM objects: full rows, identity
+    map, creator loaded through the relationship.
+    """
+
+    with app.app_context():
+        size = 0
+        query = Room.query.options(db.joinedload(Room.creator)).order_by(Room.date_created.desc(), Room.id.desc())
+        for room in query.yield_per(1000):
+            size += len(json.dumps({
+                'id': room.id, 'topic': room.topic, 'topic_id': room.topic_id,
+                'description': room.description, 'date_created': room.date_created.isoformat() + 'Z',
+                'user_id': room.user_id, 'creator': room.creator.username, 'total_members': room.total_members,
+            })) + 1
+        return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=100000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=500, help='per worker')
+    args = parser.parse_args()
+
+    app, _ = make_app(ApiConfig)
+    generate(app, args.users, args.rooms)
+    with app.app_context():
+        username = User.query.order_by(User.room_count.desc()).first().username
+
+    pairs = [
+        ('home.html', '/'),
+        ('api rooms', '/api/v1/rooms?limit=5'),
+        ('api rooms, 2 fields', '/api/v1/rooms?limit=5&fields=id,topic'),
+        ('user_rooms.html', f'/user_rooms/{username}'),
+        ('api user rooms', f'/api/v1/users/{username}/rooms?limit=5'),
+        ('api rooms by ids', '/api/v1/rooms?ids=' + ','.join(str(n) for n in range(1, 21))),
+    ]
+    rows = []
+    for name, path in pairs:
+        action = lambda client, i, path=path: client.get(path)
+        rows.append((name, run_workers(args.workers, args.requests, lambda n: app.test_client(), action)))
+    print(f'{args.rooms} rooms, {args.workers} workers x {args.requests} requests')
+    print_table(rows, columns=('rps', 'p50_ms', 'p95_ms', 'p99_ms'))
+
+    client = app.test_client()
+    started = time.perf_counter()
+    size = sum(len(chunk) for chunk in client.get('/api/v1/rooms?format=jsonl', buffered=False).response)
+    streamed = time.perf_counter() - started
+    started = time.perf_counter()
+    orm_size = orm_jsonl(app)
+    orm = time.perf_counter() - started
+    print(f'\nall {args.rooms} rooms as JSON Lines')
+    print(f'  api stream        {streamed:6.2f}s  {args.rooms / streamed:9.0f} rows/s  {size / 1e6:.1f} MB')
+    print(f'  from ORM objects  {orm:6.2f}s  {args.rooms / orm:9.0f} rows/s  {orm_size / 1e6:.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Password verification cost at each bcrypt work factor.
+
+For every cost in --costs, reports how long one check_password() takes, the
+resulting logins per second per core, and the throughput of the bounded
+hashing pool with BCRYPT_WORKERS threads driven by --clients concurrent
+callers.
+
+    python -m benchmarks.bench_bcrypt --costs 10 11 12 13
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt as bcrypt_lib
+
+from benchmarks.common import BenchConfig, make_app
+from studyonline import bcrypt
+from studyonline.users.passwords import check_password
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--costs', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--checks', type=int, default=20, help='checks per measurement')
+    parser.add_argument('--workers', type=int, default=BenchConfig.BCRYPT_WORKERS)
+    parser.add_argument('--clients', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    class Config(BenchConfig):
+        BCRYPT_WORKERS = args.workers
+
+    app, _ = make_app(Config)
+    print(f'pool: {args.workers} bcrypt worker(s), {args.clients} concurrent callers\n')
+    print(f"{'cost':>4}  {'ms/check':>9}  {'logins/s/core':>13}  {'pool logins/s':>13}")
+    with app.app_context():
+        for cost in args.costs:
+            pw_hash = bcrypt_lib.hashpw(b'password', bcrypt_lib.gensalt(rounds=cost)).decode('utf-8')
+
+            start = time.perf_counter()
+            for _ in range(args.checks):
+                bcrypt.check_password_hash(pw_hash, 'password')
+            single = (time.perf_counter() - start) / args.checks
+
+            def login(_):
+                with app.app_context():
+                    return check_password(pw_hash, 'password')
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.clients) as callers:
+                list(callers.map(login, range(args.checks * args.clients)))
+            pooled = args.checks * args.clients / (time.perf_counter() - start)
+
+            print(f'{cost:>4}  {single * 1000:9.1f}  {1 / single:13.1f}  {pooled:13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Cost of the instrumentation layer (studyonline/instrumentation.py).
+
+Runs the same requests against an app with INSTRUMENTATION_ENABLED off and
+on (without cProfile sampling) and reports the per-request difference.
+Disabled, nothing is registered, so the "off" column is the plain app.
+
+    python -m benchmarks.bench_instrumentation --requests 2000
+"""
+
+import argparse
+
+from benchmarks.common import BenchConfig, login, make_app, print_table, run_workers, seed_users
+from studyonline import db
+from studyonline.models import Room, User
+
+
+class InstrumentedConfig(BenchConfig):
+    INSTRUMENTATION_ENABLED = True
+
+
+def measure(config_class, requests):
+    app, _ = make_app(config_class)
+    username = seed_users(app, 1, prefix='ins')[0]
+    with app.app_context():
+        user = User.query.first()
+        db.session.add_all(Room(topic='bench', description=f'room {n}', creator=user) for n in range(20))
+        db.session.commit()
+
+    def setup(n):
+        client = app.test_client()
+        login(client, username)
+        return client
+
+    rows = []
+    for name, path in (('main.home', '/'), ('rooms.room', '/room/1'), ('rooms.search', '/search?q=room')):
+        action = lambda client, i, path=path: client.get(path)
+        run_workers(1, 50, setup, action)
+        rows.append((name, run_workers(1, requests, setup, action)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+
+    off = measure(BenchConfig, args.requests)
+    on = measure(InstrumentedConfig, args.requests)
+    rows = []
+    for (name, base), (_, instrumented) in zip(off, on):
+        rows.append((name, {
+            'off_us': base['mean_ms'] * 1000,
+            'on_us': instrumented['mean_ms'] * 1000,
+            'overhead_us': (instrumented['mean_ms'] - base['mean_ms']) * 1000,
+        }))
+    print(f'mean per request over {args.requests} requests, microseconds')
+    print_table(rows, columns=('off_us', 'on_us', 'overhead_us'))
+
+
+if __name__ == '__main__':
+    main()
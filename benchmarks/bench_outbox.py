@@ -0,0 +1,123 @@
+"""
+Outgoing email through the outbox (studyonline/mail.py), against the local
+SMTP sink (benchmarks/smtp_sink.py) with --rtt of latency per SMTP reply and
+--connect-ms per new connection (TCP, TLS and login on a real server).
+
+request: POST /reset_password, which only writes the outbox row, next to
+sending the same email straight from the request over a new connection.
+
+drain: sustained send rate of --messages queued emails,
+  per message   one connection per email, what sending from requests costs
+  batched       OUTBOX_BATCH_SIZE emails per claim over one pooled connection
+  worker        the background thread draining while requests keep queueing
+
+    python -m benchmarks.bench_outbox --messages 2000 --rtt 1 --connect-ms 30
+"""
+
+import argparse
+import smtplib
+import time
+from datetime import datetime
+
+from benchmarks.common import BenchConfig, make_app, print_table, run_workers, seed_users
+from benchmarks.smtp_sink import SMTPSink
+from studyonline import db
+from studyonline.mail import drain
+from studyonline.models import OutboxMessage, User
+
+
+def queue(app, count):
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(OutboxMessage.__table__.insert(), [
+            {'recipient': f'user{n}@example.com', 'subject': 'bench', 'body': 'hello ' * 40,
+             'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'date_created': now}
+            for n in range(count)
+        ])
+        db.session.commit()
+
+
+def sent_count(app):
+    with app.app_context():
+        return OutboxMessage.query.filter_by(status='sent').count()
+
+
+def rate(name, count, seconds, sink, connections_before):
+    return (name, {'messages': count, 'seconds': seconds, 'msg_per_s': count / seconds,
+                   'connections': sink.connections - connections_before})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--batch', type=int, default=100, help='OUTBOX_BATCH_SIZE')
+    parser.add_argument('--rtt', type=float, default=1, help='milliseconds per SMTP reply')
+    parser.add_argument('--connect-ms', type=float, default=30, help='milliseconds per new connection')
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    sink = SMTPSink(port=0, delay=args.rtt / 1000, connect_delay=args.connect_ms / 1000).start()
+
+    class OutboxConfig(BenchConfig):
+        MAIL_PORT = sink.server_address[1]
+        OUTBOX_BATCH_SIZE = args.batch
+        OUTBOX_WORKER = 'off'
+
+    app, _ = make_app(OutboxConfig)
+    username = seed_users(app, 1, prefix='mail')[0]
+    email = f'{username}@example.com'
+    with app.app_context():
+        User.query.filter_by(username=username).update({'email': email})
+        db.session.commit()
+
+    # request latency
+    reset = lambda client, i: client.post('/reset_password', data={'email': email})
+    request_rows = [('POST /reset_password (queue)', run_workers(1, args.requests, lambda n: app.test_client(), reset))]
+
+    def direct(_, i):
+        with smtplib.SMTP('localhost', OutboxConfig.MAIL_PORT) as smtp:
+            smtp.sendmail('noreply@studyonline.local', [email], 'Subject: reset\r\n\r\n' + 'hello ' * 40)
+    request_rows.append(('direct SMTP send', run_workers(1, min(args.requests, 100), lambda n: None, direct)))
+    print(f'rtt {args.rtt}ms, connect {args.connect_ms}ms')
+    print_table(request_rows, columns=('requests', 'p50_ms', 'p95_ms', 'p99_ms'))
+    with app.app_context():
+        OutboxMessage.query.delete()
+        db.session.commit()
+
+    rows = []
+    # one connection per message
+    per_message = min(args.messages, 200)
+    queue(app, per_message)
+    before, started = sink.connections, time.perf_counter()
+    with app.app_context():
+        # drain() without a mailer opens (and closes) its own connection
+        while drain(app, limit=1)[0]:
+            pass
+    rows.append(rate('per message', per_message, time.perf_counter() - started, sink, before))
+
+    # batched over one pooled connection
+    queue(app, args.messages)
+    before, started = sink.connections, time.perf_counter()
+    with app.app_context():
+        sent, retried, failed = drain(app)
+    assert (sent, retried, failed) == (args.messages, 0, 0), (sent, retried, failed)
+    rows.append(rate('batched', args.messages, time.perf_counter() - started, sink, before))
+
+    # the background worker, with requests queueing at the same time
+    app.config['OUTBOX_WORKER'] = 'thread'
+    target = sent_count(app) + args.messages
+    client = app.test_client()
+    before, started = sink.connections, time.perf_counter()
+    for n in range(args.messages):
+        client.post('/reset_password', data={'email': email})
+    while sent_count(app) < target:
+        time.sleep(0.01)
+    rows.append(rate('worker', args.messages, time.perf_counter() - started, sink, before))
+
+    print(f'\nsustained send rate, batch size {args.batch}')
+    print_table(rows, columns=('messages', 'seconds', 'msg_per_s', 'connections'))
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Cost of rate limiting (studyonline/ratelimit.py).
+
+hit: Limiter.hit() alone, per backend, for keys that are under the limit
+(the path every normal request takes), in microseconds.
+
+request: mean time of a POST /login that is let through, with
+RATELIMIT_ENABLED off and on, and of one that is rejected with 429, which
+should be far cheaper than a real login since it never reaches bcrypt.
+
+    python -m benchmarks.bench_ratelimit --calls 200000 --requests 500
+"""
+
+import argparse
+import time
+
+from benchmarks.common import BenchConfig, make_app, print_table, run_workers, seed_users
+from studyonline.cache import LocalStore
+from studyonline.ratelimit import Limiter, MemoryBackend, StoreBackend
+
+
+def time_hits(limiter, calls, keys=1000):
+    started = time.perf_counter()
+    for n in range(calls):
+        limiter.hit(f'users.login:ip:10.0.{n % keys // 256}.{n % 256}', 10 ** 9, 60)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def measure_requests(enabled, requests, limit):
+    class Config(BenchConfig):
+        RATELIMIT_ENABLED = enabled
+        RATELIMITS = {'users.login': (('ip', limit, 3600), ('username', limit, 3600))}
+
+    app, _ = make_app(Config)
+    username = seed_users(app, 1, prefix='rl')[0]
+    action = lambda client, i: client.post('/login', data={'username': username, 'password': 'wrong'})
+    return run_workers(1, requests, lambda n: app.test_client(), action)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'Limiter.hit(), mean of {args.calls} calls, microseconds')
+    for name, backend in (('memory', MemoryBackend()), ('shared (LocalStore)', StoreBackend(LocalStore()))):
+        print(f'  {name:20} {time_hits(Limiter(backend), args.calls):8.2f}')
+
+    print(f'\nPOST /login with a wrong password, {args.requests} requests')
+    print_table([
+        ('limiter off', measure_requests(False, args.requests, limit=10 ** 9)),
+        ('limiter on, allowed', measure_requests(True, args.requests, limit=10 ** 9)),
+        ('limiter on, rejected', measure_requests(True, args.requests, limit=0)),
+    ], columns=('requests', 'rps', 'p50_ms', 'p95_ms'))
+
+
+if __name__ == '__main__':
+    main()
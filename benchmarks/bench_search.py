@@ -0,0 +1,53 @@
+"""
+Room search latency: full-text index vs. a naive LIKE '%term%' scan.
+
+Fills the database with --rooms synthetic rooms, then runs the same queries
+through search_rooms() (FTS5 on SQLite) and like_search_ids() (the scan the
+index replaces) and reports per-query latency percentiles.
+
+    python -m benchmarks.bench_search --rooms 300000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import make_app, percentile, seed_users
+from benchmarks.datagen import seed_rooms
+from studyonline.rooms.search import _terms, like_search_ids, search_rooms
+
+QUERIES = ['python', 'calculus physics', 'japan', 'w123', 'w77 w1999', 'chess w42', 'nomatch']
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return percentile(samples, 50) * 1000, percentile(samples, 95) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app, _ = make_app()
+    seed_users(app, 100, prefix='srch')
+    started = time.perf_counter()
+    seed_rooms(app, args.rooms)
+    print(f'seeded {args.rooms} rooms in {time.perf_counter() - started:.1f}s\n')
+
+    print(f"{'query':20}  {'fts p50':>9}  {'fts p95':>9}  {'like p50':>9}  {'like p95':>9}  (ms)")
+    with app.app_context():
+        for query in QUERIES:
+            terms = _terms(query)
+            fts = timed(lambda: search_rooms(query, page=1, per_page=5), args.repeat)
+            like = timed(lambda: like_search_ids(terms, 6, 0), max(1, args.repeat // 4))
+            print(f'{query:20}  {fts[0]:9.2f}  {fts[1]:9.2f}  {like[0]:9.2f}  {like[1]:9.2f}')
+
+
+if __name__ == '__main__':
+    main()
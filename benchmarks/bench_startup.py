@@ -0,0 +1,131 @@
+"""
+Worker startup time and memory.
+
+cold: each run is a fresh interpreter importing studyonline and calling
+create_app(), as a worker without preloading does, with LAZY_EXTENSIONS on
+and off. Reports the time and the resident memory it ends up with.
+
+preload: the app is built once in this process (the "master"), which then
+forks --workers children the way gunicorn.conf.py does. Each child serves a
+few requests and reports its memory split into what it still shares with
+the master and what it had to copy (private), with and without gc.freeze().
+
+    python -m benchmarks.bench_startup --runs 5 --workers 4
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import print_table
+
+COLD = """
+import json, resource, sys, time
+started = time.perf_counter()
+from studyonline import create_app
+from studyonline.config import Config
+class StartupConfig(Config):
+    SECRET_KEY = 'bench'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    LAZY_EXTENSIONS = %r
+create_app(StartupConfig)
+print(json.dumps({
+    'startup_ms': (time.perf_counter() - started) * 1000,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+}))
+"""
+
+
+def memory():
+    """
+    Shared and private resident memory of this process, MB (Linux).
+    """
+
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[name] = int(value.split()[0])
+    return {
+        'rss_mb': fields['Rss'] / 1024,
+        'shared_mb': (fields['Shared_Clean'] + fields['Shared_Dirty']) / 1024,
+        'private_mb': (fields['Private_Clean'] + fields['Private_Dirty']) / 1024,
+    }
+
+
+def cold(lazy, runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', COLD % lazy], check=True,
+                             capture_output=True, text=True).stdout
+        results.append(json.loads(out))
+    return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+
+def preload(workers, requests, freeze):
+    from benchmarks.common import BenchConfig, make_app
+    from studyonline import db
+
+    gc.disable()
+    app, _ = make_app(BenchConfig)
+    db.dispose_engines(app)
+    gc.collect()
+    if freeze:
+        gc.freeze()
+
+    children = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            gc.enable()
+            client = app.test_client()
+            for _ in range(requests):
+                client.get('/')
+                client.get('/login')
+            gc.collect()
+            os.write(write, json.dumps(memory()).encode())
+            os._exit(0)
+        os.close(write)
+        children.append((pid, read))
+
+    results = []
+    for pid, read in children:
+        with os.fdopen(read) as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    if freeze:
+        gc.unfreeze()
+    gc.enable()
+    return {key: statistics.mean(result[key] for result in results) for key in results[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=50, help='requests each forked worker serves')
+    args = parser.parse_args()
+
+    print(f'cold start, median of {args.runs} runs')
+    print_table([
+        ('eager', cold(False, args.runs)),
+        ('lazy', cold(True, args.runs)),
+    ], columns=('startup_ms', 'rss_mb', 'modules'))
+
+    print(f'\npreloaded master, {args.workers} forked workers, mean per worker after {args.requests} requests')
+    print_table([
+        ('fork', preload(args.workers, args.requests, freeze=False)),
+        ('fork+gc.freeze', preload(args.workers, args.requests, freeze=True)),
+    ], columns=('rss_mb', 'shared_mb', 'private_mb'))
+
+
+if __name__ == '__main__':
+    main()
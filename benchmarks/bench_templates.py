@@ -0,0 +1,117 @@
+"""
+Template compile cost: first request vs steady state, per page.
+
+Seeds one database with --rooms synthetic rooms, then for every page starts
+a fresh interpreter (a new worker) that logs in and requests the page once
+(first_ms, including compiling its templates) and --repeat more times
+(steady_ms, and tpl_ms, the render time from the Server-Timing header).
+Each page is measured three ways:
+
+off    no bytecode cache, the worker compiles everything itself
+cold   bytecode cache on but empty, the worker compiles and stores
+warm   after `flask compile-templates`, the worker only loads bytecode
+
+    python -m benchmarks.bench_templates --rooms 20000
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import BenchConfig, make_app, print_table
+from benchmarks.datagen import generate
+
+PAGES = ['/', '/about', '/login', '/register', '/room/1', '/user_rooms/{user}', '/profile/{user}',
+         '/topic/python', '/search?q=python', '/account', '/create_room']
+ANONYMOUS = {'/login', '/register'}
+
+CHILD = """
+import json, re, sys, time
+from benchmarks.bench_templates import TemplatesConfig
+from studyonline import create_app
+TemplatesConfig.SQLALCHEMY_DATABASE_URI = %(db)r
+TemplatesConfig.TEMPLATE_BYTECODE_CACHE = %(cache)r
+TemplatesConfig.TEMPLATE_CACHE_DIR = %(cache_dir)r
+app = create_app(TemplatesConfig)
+client = app.test_client()
+if %(login)r:
+    client.post('/login', data={'username': %(user)r, 'password': 'password'})
+
+def get():
+    started = time.perf_counter()
+    response = client.get(%(path)r)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert response.status_code == 200, response.status_code
+    tpl = float(re.search(r'tpl;dur=([0-9.]+)', response.headers['Server-Timing']).group(1))
+    return elapsed, tpl
+
+first, _ = get()
+steady = [get() for _ in range(%(repeat)d)]
+print(json.dumps({'first_ms': first, 'steady_ms': sorted(s[0] for s in steady)[len(steady) // 2],
+                  'tpl_ms': sorted(s[1] for s in steady)[len(steady) // 2]}))
+"""
+
+
+class TemplatesConfig(BenchConfig):
+    INSTRUMENTATION_ENABLED = True
+    # render the feed on every request rather than serving it cached
+    FEED_CACHE_TTL = 0
+    FEED_CACHE_STALE_TTL = 0
+
+
+def run_child(db, path, user, cache, cache_dir, repeat):
+    script = CHILD % {'db': db, 'cache': cache, 'cache_dir': cache_dir, 'path': path, 'user': user,
+                      'login': path not in ANONYMOUS, 'repeat': repeat}
+    out = subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--rooms', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=3, help='fresh workers per page and mode, median taken')
+    args = parser.parse_args()
+
+    app, db_path = make_app(TemplatesConfig)
+    user = generate(app, args.users, args.rooms, memberships=3)[0]
+    database = app.config['SQLALCHEMY_DATABASE_URI']
+    cache_dir = tempfile.mkdtemp(prefix='studyonline-jinja-')
+
+    def measure(path, cache, warm):
+        results = []
+        for _ in range(args.runs):
+            shutil.rmtree(cache_dir)
+            os.makedirs(cache_dir)
+            if warm:
+                # what `flask compile-templates` does at build time
+                from studyonline import create_app
+                from studyonline.template_cache import compile_all
+
+                class Warm(TemplatesConfig):
+                    SQLALCHEMY_DATABASE_URI = database
+                    TEMPLATE_BYTECODE_CACHE = True
+                    TEMPLATE_CACHE_DIR = cache_dir
+                compile_all(create_app(Warm))
+            results.append(run_child(database, path, user, cache, cache_dir, args.repeat))
+        return {key: statistics.median(result[key] for result in results) for key in results[0]}
+
+    rows = []
+    for page in PAGES:
+        path = page.format(user=user)
+        for mode, cache, warm in (('off', False, False), ('cold', True, False), ('warm', True, True)):
+            rows.append((f'{re.sub(r"[?].*", "", page)} {mode}', measure(path, cache, warm)))
+    shutil.rmtree(cache_dir)
+    print(f'{args.rooms} rooms, median of {args.runs} fresh workers, steady state over {args.repeat} requests')
+    print_table(rows, columns=('first_ms', 'steady_ms', 'tpl_ms'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Personal timelines (studyonline/timeline.py) as follow counts grow.
+
+Seeds --users users and --rooms rooms (long-tailed creators), then gives
+one reader per --following count that many random followees, plus the
+creators below, and builds their timelines. For every reader, the first
+page and a page --depth pages deep are timed two ways:
+
+join      the rooms assembled at read time, room JOIN follow ordered by date
+timeline  timeline_page(): the precomputed timeline plus the rooms pulled
+          from followed creators above TIMELINE_FANOUT_LIMIT
+
+and, on the write side, creating a room (insert, fan-out, commit) for
+creators with --followers followers; the largest is over the fan-out limit
+so its rooms are pulled instead.
+
+    python -m benchmarks.bench_timeline --users 20000 --rooms 200000
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime
+
+from benchmarks.common import BenchConfig, make_app, percentile, print_table, seed_users
+from benchmarks.datagen import seed_rooms
+from studyonline import db, timeline
+from studyonline.counters import repair
+from studyonline.models import Room, User, follow
+from studyonline.pagination import keyset_paginate
+
+
+class TimelineConfig(BenchConfig):
+    TIMELINE_FANOUT_LIMIT = 5000
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return percentile(samples, 50) * 1000
+
+
+def join_page(user_id, cursor=None):
+    query = (Room.query.options(db.joinedload(Room.creator))
+             .join(follow, follow.c.followed_id == Room.user_id)
+             .filter(follow.c.follower_id == user_id))
+    return keyset_paginate(query, Room.date_created, Room.id, cursor=cursor, per_page=5)
+
+
+def deep_cursor(page_fn, user_id, depth):
+    cursor = None
+    for _ in range(depth):
+        cursor = page_fn(user_id, cursor).next_cursor or cursor
+    return cursor
+
+
+def add_follows(follower_ids, followed_id=None, followed_ids=None):
+    now = datetime.utcnow()
+    if followed_id is not None:
+        rows = [{'follower_id': pk, 'followed_id': followed_id, 'created_at': now} for pk in follower_ids]
+    else:
+        rows = [{'follower_id': follower_ids, 'followed_id': pk, 'created_at': now} for pk in followed_ids]
+    db.session.execute(follow.insert(), rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--rooms', type=int, default=200000)
+    parser.add_argument('--following', default='10,100,1000,10000', help='followees per reader')
+    parser.add_argument('--followers', default='10,100,1000,10000', help='followers per creator')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--depth', type=int, default=10, help='pages deep for deep_ms')
+    args = parser.parse_args()
+    following = [int(n) for n in args.following.split(',')]
+    followers = [int(n) for n in args.followers.split(',')]
+
+    app, _ = make_app(TimelineConfig)
+    seed_users(app, args.users, prefix='tl')
+    seed_rooms(app, args.rooms)
+    rng = random.Random(3)
+
+    with app.app_context():
+        user_ids = [pk for pk, in db.session.query(User.id).order_by(User.id)]
+        readers = user_ids[:len(following)]
+        creators = user_ids[len(following):len(following) + len(followers)]
+        others = user_ids[len(following) + len(followers):]
+        for reader, count in zip(readers, following):
+            # every reader also follows the creators, the largest of them pulled
+            add_follows(reader, followed_ids=rng.sample(others, min(count, len(others))) + creators)
+        for creator, count in zip(creators, followers):
+            add_follows(rng.sample(others, min(count, len(others))), followed_id=creator)
+        repair()
+        timeline.stars.invalidate()
+        started = time.perf_counter()
+        for reader in readers:
+            timeline.rebuild(reader)
+        db.session.commit()
+        print(f'{args.users} users, {args.rooms} rooms, timelines built in {time.perf_counter() - started:.2f}s')
+
+        rows = []
+        for reader, count in zip(readers, following):
+            join_cursor = deep_cursor(join_page, reader, args.depth)
+            timeline_cursor = deep_cursor(timeline.timeline_page, reader, args.depth)
+            rows.append((f'following {count}', {
+                'join_ms': timed(lambda: join_page(reader), args.repeat),
+                'join_deep_ms': timed(lambda: join_page(reader, join_cursor), args.repeat),
+                'timeline_ms': timed(lambda: timeline.timeline_page(reader), args.repeat),
+                'tl_deep_ms': timed(lambda: timeline.timeline_page(reader, timeline_cursor), args.repeat),
+            }))
+        print(f'\nreading a page of 5, median of {args.repeat}, milliseconds; deep = page {args.depth + 1}')
+        print_table(rows, columns=('join_ms', 'join_deep_ms', 'timeline_ms', 'tl_deep_ms'))
+
+        rows = []
+        limit = app.config['TIMELINE_FANOUT_LIMIT']
+        for creator, count in zip(creators, followers):
+            def create():
+                room = Room(topic='bench', description='timeline bench', user_id=creator)
+                db.session.add(room)
+                db.session.flush()
+                timeline.fan_out(room)
+                db.session.commit()
+            label = f'{count} followers' + (' (pulled)' if count > limit else '')
+            rows.append((label, {'create_ms': timed(create, args.repeat)}))
+        print(f'\ncreating a room, TIMELINE_FANOUT_LIMIT {limit}, median of {args.repeat}, milliseconds')
+        print_table(rows, columns=('create_ms',))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Top topics and topic listings at scale.
+
+Fills the database with --rooms synthetic rooms, then compares the top
+topics sidebar read from the maintained Topic.room_count counters with the
+GROUP BY over all rooms it replaces, and times the /topic/<name> listing on
+its first page and deep into it (keyset cursor).
+
+    python -m benchmarks.bench_topics --rooms 1000000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import BenchConfig, make_app, percentile, print_table, seed_users
+from benchmarks.datagen import seed_rooms
+from studyonline import db
+from studyonline.models import Room
+from studyonline.rooms.topics import top_topics
+
+
+class TopicsConfig(BenchConfig):
+    QUERY_BUDGET_ENABLED = False
+    FEED_CACHE_TTL = 0
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {'p50_ms': percentile(samples, 50) * 1000, 'p95_ms': percentile(samples, 95) * 1000}
+
+
+def group_by_topics(limit=10):
+    return (db.session.query(db.func.lower(Room.topic), db.func.count(Room.id))
+            .group_by(db.func.lower(Room.topic))
+            .order_by(db.func.count(Room.id).desc())
+            .limit(limit).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app, _ = make_app(TopicsConfig)
+    seed_users(app, 100, prefix='topic')
+    started = time.perf_counter()
+    seed_rooms(app, args.rooms)
+    print(f'seeded {args.rooms} rooms in {time.perf_counter() - started:.1f}s')
+
+    with app.app_context():
+        # the counters agree with a full recount
+        assert {t.name: t.room_count for t in top_topics(100)} == dict(group_by_topics(100))
+        rows = [
+            ('GROUP BY room.topic', timed(group_by_topics, args.repeat)),
+            ('Topic.room_count', timed(top_topics, args.repeat)),
+        ]
+
+    client = app.test_client()
+    name = 'python'
+    deep = client.get(f'/topic/{name}')
+    for _ in range(200):
+        # walk 200 pages in, then time that page
+        cursor = deep.data.split(b'cursor=')[-1].split(b'"')[0].decode()
+        deep = client.get(f'/topic/{name}?cursor={cursor}')
+    rows.append(('/topic/<name> page 1', timed(lambda: client.get(f'/topic/{name}'), args.repeat)))
+    rows.append(('/topic/<name> page 200', timed(lambda: client.get(f'/topic/{name}?cursor={cursor}'), args.repeat)))
+    print_table(rows, columns=('p50_ms', 'p95_ms'))
+
+
+if __name__ == '__main__':
+    main()
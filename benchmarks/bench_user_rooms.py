@@ -0,0 +1,85 @@
+"""
+Per-user room listings with and without ix_room_user_id_date_created_id.
+
+Fills the database with --rooms synthetic rooms (creators are long-tailed,
+so the busiest user hosts a large share of them), then times, for the
+busiest user and a typical one:
+- the COUNT(*) the listings used to run vs reading User.room_count
+- the first page and a page deep into the listing (keyset cursor)
+once with the index dropped (as before the migration) and once with it.
+
+    python -m benchmarks.bench_user_rooms --rooms 1000000
+"""
+
+import argparse
+import time
+
+from benchmarks.common import make_app, percentile, print_table, seed_users
+from benchmarks.datagen import seed_rooms
+from studyonline import db
+from studyonline.models import Room, User
+from studyonline.pagination import keyset_paginate
+
+INDEX = 'ix_room_user_id_date_created_id'
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return percentile(samples, 50) * 1000
+
+
+def page(user, cursor=None):
+    return keyset_paginate(Room.query.filter_by(creator=user), Room.date_created, Room.id,
+                           cursor=cursor, per_page=5, total=user.room_count)
+
+
+def measure(user, repeat, depth):
+    cursor = None
+    for _ in range(depth):
+        cursor = page(user, cursor).next_cursor
+    return {
+        'count_ms': timed(lambda: Room.query.filter_by(creator=user).count(), repeat),
+        'counter_ms': timed(lambda: db.session.query(User.room_count).filter_by(id=user.id).scalar(), repeat),
+        'page1_ms': timed(lambda: page(user), repeat),
+        'deep_ms': timed(lambda: page(user, cursor), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rooms', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--depth', type=int, default=50, help='pages into the listing for deep_ms')
+    args = parser.parse_args()
+
+    app, _ = make_app()
+    seed_users(app, args.users, prefix='own')
+    started = time.perf_counter()
+    seed_rooms(app, args.rooms)
+    print(f'seeded {args.rooms} rooms in {time.perf_counter() - started:.1f}s')
+
+    rows = []
+    with app.app_context():
+        busiest = User.query.order_by(User.room_count.desc()).first()
+        typical = User.query.filter(User.room_count > args.depth * 5).order_by(User.room_count).first() or busiest
+        for indexed in (False, True):
+            if not indexed:
+                db.session.execute(f'DROP INDEX {INDEX}')
+            else:
+                db.session.execute(f'CREATE INDEX {INDEX} ON room (user_id, date_created, id)')
+            db.session.commit()
+            label = 'index' if indexed else 'no index'
+            for name, user in (('busiest', busiest), ('typical', typical)):
+                rows.append((f'{label}, {name} ({user.room_count} rooms)', measure(user, args.repeat, args.depth)))
+    print(f'median of {args.repeat}, milliseconds; deep = page {args.depth + 1}')
+    print_table(rows, columns=('count_ms', 'counter_ms', 'page1_ms', 'deep_ms'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Throughput of the write endpoints that used to call time.sleep().
+
+Each thread plays one synchronous gunicorn worker. A handler that sleeps for
+s seconds caps a pool of W such workers at W / s requests per second no
+matter how fast the rest of the code is; the "sleep cap" column shows that
+ceiling for the delays the handlers used to have, next to what the current
+handlers actually sustain.
+
+Every handler answers a successful write with a redirect; any other
+response is counted in the "failed" column (a form error or a 500 is quick
+and would otherwise pass for throughput) and makes the script exit non-zero.
+
+    python -m benchmarks.bench_write_handlers --workers 8 --requests 50
+"""
+
+import argparse
+import itertools
+import sys
+
+from benchmarks.common import login, make_app, print_table, run_workers, seed_users
+
+# seconds each endpoint used to block its worker for
+OLD_SLEEPS = {
+    'rooms.create_room': 1,
+    'rooms.delete_room': 1,
+    'users.register': 1,
+    'users.account': 1,
+    'users.logout': 2,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help='requests per worker')
+    args = parser.parse_args()
+
+    app, _ = make_app()
+    usernames = seed_users(app, args.workers, prefix='wr')
+    counter = itertools.count()
+
+    def logged_in(n):
+        client = app.test_client()
+        login(client, usernames[n])
+        return {'client': client, 'username': usernames[n], 'rooms': []}
+
+    def anonymous(n):
+        return {'client': app.test_client()}
+
+    def create_room(state, i):
+        return state['client'].post('/create_room', data={'topic': 'bench', 'description': f'room {i}'})
+
+    def delete_room(state, i):
+        return state['client'].get(f"/delete_room/{state['rooms'][i]}")
+
+    def register(state, i):
+        username = f'reg{next(counter):06d}'
+        return state['client'].post('/register', data={
+            'name': username,
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'password',
+            'confirm_password': 'password',
+        })
+
+    def account(state, i):
+        return state['client'].post('/account', data={
+            'name': state['username'],
+            'username': state['username'],
+            'email': f"{state['username']}@example.com",
+        })
+
+    def login_logout(state, i):
+        if login(state['client'], state['username']).status_code != 302:
+            return None
+        return state['client'].get('/logout')
+
+    def rooms_to_delete(n):
+        from studyonline import db
+        from studyonline.models import Room, User
+
+        state = logged_in(n)
+        with app.app_context():
+            user = User.query.filter_by(username=state['username']).one()
+            rooms = [Room(topic='bench', description='to delete', creator=user) for _ in range(args.requests)]
+            db.session.add_all(rooms)
+            user.room_count += len(rooms)
+            db.session.commit()
+            state['rooms'] = [room.id for room in rooms]
+        return state
+
+    scenarios = [
+        ('rooms.create_room', logged_in, create_room),
+        ('rooms.delete_room', rooms_to_delete, delete_room),
+        ('users.register', anonymous, register),
+        ('users.account', logged_in, account),
+        ('users.logout', logged_in, login_logout),
+    ]
+
+    def expect_redirect(action, failed):
+        def checked(state, i):
+            response = action(state, i)
+            if response is None or response.status_code != 302:
+                # list.append is atomic, the worker threads can share it
+                failed.append(response.status_code if response is not None else None)
+        return checked
+
+    rows = []
+    for endpoint, setup, action in scenarios:
+        failed = []
+        stats = run_workers(args.workers, args.requests, setup, expect_redirect(action, failed))
+        stats['sleep_cap'] = args.workers / OLD_SLEEPS[endpoint]
+        stats['failed'] = len(failed)
+        rows.append((endpoint, stats))
+
+    print(f'{args.workers} workers x {args.requests} requests (users.logout row includes the login)')
+    print_table(rows, columns=('requests', 'failed', 'rps', 'sleep_cap', 'p50_ms', 'p99_ms'))
+    failed_rows = [endpoint for endpoint, stats in rows if stats['failed']]
+    if failed_rows:
+        print(f"non-redirect responses from {', '.join(failed_rows)}, their rps is not throughput")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+"""
+Connection scaling of the realtime rooms (studyonline/realtime).
+
+Opens thousands of websocket connections against RealtimeApp in this
+process, driving the ASGI interface directly (no network), and reports:
+
+- how fast connections are authenticated and accepted
+- memory per idle connection (tracemalloc) and the thread count, which
+  stays flat because connections are coroutines, not threads
+- fan-out latency: time for one chat message to reach every socket in
+  the room
+
+    python -m benchmarks.bench_ws_connections --connections 5000
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+import tracemalloc
+
+from benchmarks.common import login, make_app, seed_users
+from studyonline import db
+from studyonline.models import Room, User
+from studyonline.realtime.asgi import RealtimeApp
+from studyonline.realtime.broker import InProcessBroker
+
+
+class FakeSocket:
+    """
+    The ASGI side of one websocket: events the server receives come from
+    `inbox`, events it sends are counted.
+    """
+
+    def __init__(self, cookie, room_id):
+        self.scope = {
+            'type': 'websocket',
+            'path': f'/ws/room/{room_id}',
+            'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 0),
+        }
+        self.inbox = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.closed = None
+        self.watch = None
+        self.on_watch = None
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif event['type'] == 'websocket.close':
+            self.closed = event.get('code')
+            self.accepted.set()
+        elif self.watch and self.watch in event['text']:
+            self.on_watch()
+
+
+def session_cookies(app, usernames):
+    cookies = []
+    for username in usernames:
+        client = app.test_client()
+        login(client, username)
+        cookie = client.cookie_jar._cookies['localhost.local']['/']['session']
+        cookies.append(f'session={cookie.value}')
+    return cookies
+
+
+async def run(app, cookies, room_ids, connections):
+    realtime = RealtimeApp(app, broker=InProcessBroker(app.config['REALTIME_QUEUE_SIZE']))
+    sockets = [FakeSocket(cookies[n % len(cookies)], room_ids[n % len(room_ids)])
+               for n in range(connections)]
+
+    threads_before = threading.active_count()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    start = time.perf_counter()
+    tasks = []
+    for sock in sockets:
+        tasks.append(asyncio.ensure_future(realtime(sock.scope, sock.receive, sock.send)))
+        sock.inbox.put_nowait({'type': 'websocket.connect'})
+    await asyncio.gather(*(sock.accepted.wait() for sock in sockets))
+    connect_seconds = time.perf_counter() - start
+    rejected = sum(1 for sock in sockets if sock.closed is not None)
+    # let the presence snapshots drain
+    await asyncio.sleep(0.2)
+
+    per_connection = (tracemalloc.get_traced_memory()[0] - baseline) / connections
+    tracemalloc.stop()
+    threads = threading.active_count()
+
+    # one message to the busiest room, timed until every member has it
+    room_sockets = [sock for sock in sockets if sock.scope['path'] == f'/ws/room/{room_ids[0]}']
+    done = asyncio.Event()
+    remaining = [len(room_sockets)]
+
+    def delivered():
+        remaining[0] -= 1
+        if not remaining[0]:
+            done.set()
+
+    marker = 'fan-out-marker'
+    for sock in room_sockets:
+        sock.watch, sock.on_watch = marker, delivered
+    start = time.perf_counter()
+    room_sockets[0].inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'body': marker})})
+    await done.wait()
+    fanout_seconds = time.perf_counter() - start
+
+    for sock in sockets:
+        sock.inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+    await asyncio.gather(*tasks)
+    realtime.executor.shutdown()
+
+    return {
+        'connections': connections,
+        'rejected': rejected,
+        'connect_per_s': connections / connect_seconds,
+        'kib_per_connection': per_connection / 1024,
+        'threads': f'{threads_before} -> {threads}',
+        'fanout_sockets': len(room_sockets),
+        'fanout_ms': fanout_seconds * 1000,
+        'subscribers_left': realtime.broker.subscriber_count(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--connections', type=int, default=5000)
+    parser.add_argument('--rooms', type=int, default=5)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    app, _ = make_app()
+    usernames = seed_users(app, args.users, prefix='ws')
+    with app.app_context():
+        host = User.query.first()
+        for n in range(args.rooms):
+            db.session.add(Room(topic=f'Room {n}', description='bench', creator=host))
+        db.session.commit()
+        room_ids = [room_id for (room_id,) in db.session.query(Room.id)]
+    cookies = session_cookies(app, usernames)
+
+    stats = asyncio.run(run(app, cookies, room_ids, args.connections))
+    for key, value in stats.items():
+        print(f'{key:>20}  {value:.2f}' if isinstance(value, float) else f'{key:>20}  {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Checks following (studyonline/users/follows.py) through the views with
+query budgets on, as in TestConfig, so a follow or unfollow running past
+its QUERY_BUDGETS entry raises QueryBudgetExceeded and fails the check:
+
+- following (with cold caches) and unfollowing stay within budget and
+  flash the followed user's name
+- both counters move once, following twice or unfollowing twice is a no-op
+- the followed user's newest rooms show up on /timeline and go away again
+- you can't follow yourself
+
+Exits non-zero if any check fails.
+
+    python -m benchmarks.check_follow
+"""
+
+import argparse
+import sys
+
+from flask import get_flashed_messages
+
+from benchmarks.common import BenchConfig, login, make_app, seed_users
+from studyonline import db
+from studyonline.models import Room, User
+from studyonline.query_counter import QueryBudgetExceeded
+
+
+class FollowConfig(BenchConfig):
+    QUERY_BUDGET_ENABLED = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rooms', type=int, default=30, help='rooms of the user followed')
+    args = parser.parse_args()
+
+    app, _ = make_app(FollowConfig)
+    follower, followed = seed_users(app, 2, prefix='fol')
+    with app.app_context():
+        followed_id = User.query.filter_by(username=followed).one().id
+        db.session.add_all(Room(topic='followed', description=f'room {n}', user_id=followed_id)
+                           for n in range(args.rooms))
+        db.session.commit()
+
+    client = app.test_client()
+    login(client, follower)
+    failures = []
+
+    def check(name, ok, detail=''):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f' ({detail})' if detail and not ok else ''))
+        if not ok:
+            failures.append(name)
+
+    def post(path):
+        """
+        (status, flashed messages) of a POST, or (None, error) over budget.
+        """
+
+        with client:
+            try:
+                response = client.post(path)
+            except QueryBudgetExceeded as error:
+                return None, str(error)
+            return response.status_code, get_flashed_messages()
+
+    def counts():
+        with app.app_context():
+            return {username: (user.follower_count, user.following_count)
+                    for username, user in ((name, User.query.filter_by(username=name).one())
+                                           for name in (follower, followed))}
+
+    def timeline_rooms():
+        return client.get('/timeline').get_data(as_text=True).count('href="/room/')
+
+    status, flashed = post(f'/profile/{followed}/follow')
+    check('follow within budget', status == 302, flashed)
+    check('flashes the name', flashed == [f'Following @{followed}!'], flashed)
+    check('counters moved', counts() == {follower: (0, 1), followed: (1, 0)}, counts())
+    check('rooms backfilled into the timeline', timeline_rooms() > 0)
+
+    status, flashed = post(f'/profile/{followed}/follow')
+    check('following again is a no-op', status == 302 and not flashed
+          and counts() == {follower: (0, 1), followed: (1, 0)}, (flashed, counts()))
+
+    status, flashed = post(f'/profile/{followed}/unfollow')
+    check('unfollow within budget', status == 302, flashed)
+    check('flashes the name', flashed == [f'Unfollowed @{followed}.'], flashed)
+    check('counters back', counts() == {follower: (0, 0), followed: (0, 0)}, counts())
+    check('rooms gone from the timeline', timeline_rooms() == 0)
+
+    status, flashed = post(f'/profile/{followed}/unfollow')
+    check('unfollowing again is a no-op', status == 302 and not flashed, flashed)
+
+    status, flashed = post(f'/profile/{follower}/follow')
+    check("can't follow yourself", status == 302 and flashed == ['You cannot follow yourself.']
+          and counts()[follower] == (0, 0), flashed)
+
+    print('following as expected' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+Checks the password reset flow end to end through the outbox
+(studyonline/mail.py, studyonline/users/reset.py) against the local SMTP
+sink (benchmarks/smtp_sink.py) on MAIL_PORT, 8025 in TestConfig:
+
+- POST /reset_password only queues; drain() sends the queue in batches of
+  OUTBOX_BATCH_SIZE over one SMTP connection
+- a refused send (451) is rescheduled with backoff and goes out on a
+  later drain, a permanently refused one (550) is marked failed
+- the emailed link resets the password once, then stops working because
+  the password hash it was signed with changed
+
+Exits non-zero if any check fails.
+
+    python -m benchmarks.check_password_reset
+"""
+
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.common import BenchConfig, login, make_app, seed_users
+from benchmarks.smtp_sink import SMTPSink
+from studyonline import db
+from studyonline.mail import drain
+from studyonline.models import OutboxMessage, User
+
+LINK = re.compile(r'http://localhost(/reset_password/[\w.-]+)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=2, help='OUTBOX_BATCH_SIZE')
+    args = parser.parse_args()
+
+    class ResetConfig(BenchConfig):
+        OUTBOX_BATCH_SIZE = args.batch
+
+    sink = SMTPSink(port=ResetConfig.MAIL_PORT).start()
+    app, _ = make_app(ResetConfig)
+    usernames = seed_users(app, args.users, prefix='reset')
+    client = app.test_client()
+    failures = []
+
+    def check(name, ok, detail=''):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f' ({detail})' if detail and not ok else ''))
+        if not ok:
+            failures.append(name)
+
+    def request_reset(username):
+        return client.post('/reset_password', data={'email': f'{username}@example.com'})
+
+    def outbox(recipient):
+        return OutboxMessage.query.filter_by(recipient=recipient).order_by(OutboxMessage.id.desc()).first()
+
+    # batching
+    for username in usernames:
+        request_reset(username)
+    check('requests only queue', not sink.messages)
+    connections = sink.connections
+    with app.app_context():
+        totals = drain(app)
+    check(f'{args.users} emails sent in batches of {args.batch}', totals == (args.users, 0, 0), totals)
+    check('over one SMTP connection', sink.connections - connections == 1, sink.connections - connections)
+    check('every user got a link', sorted(str(message['To']) for message in sink.messages)
+          == sorted(f'{username}@example.com' for username in usernames))
+
+    # a temporary refusal, retried with backoff
+    email = f'{usernames[0]}@example.com'
+    sink.refuse = 1
+    request_reset(usernames[0])
+    with app.app_context():
+        started = datetime.utcnow()
+        totals = drain(app)
+        row = outbox(email)
+        base = app.config['OUTBOX_RETRY_BASE']
+        check('451 reply is retried, not failed', totals == (0, 1, 0) and row.status == 'pending', totals)
+        check('after backoff', row.attempts == 1 and '451' in (row.last_error or '')
+              and started + timedelta(seconds=base * 0.5) <= row.next_attempt_at
+              <= datetime.utcnow() + timedelta(seconds=base), row.next_attempt_at)
+        check('not resent before it is due', drain(app) == (0, 0, 0))
+        row.next_attempt_at = datetime.utcnow()
+        db.session.commit()
+        totals = drain(app)
+        check('sent once due', totals == (1, 0, 0) and outbox(email).status == 'sent', totals)
+
+        sink.refuse, sink.refuse_reply = 1, '550 5.1.1 No such mailbox'
+        request_reset(usernames[1])
+        totals = drain(app)
+        check('550 reply fails the message', totals == (0, 0, 1)
+              and outbox(f'{usernames[1]}@example.com').status == 'failed', totals)
+        sink.refuse_reply = '451 4.3.0 Try again later'
+
+    # the link from the email, usable once
+    links = [LINK.search(message.get_content()) for message in sink.messages if str(message['To']) == email]
+    first, latest = links[0].group(1), links[-1].group(1)
+    check('reset form opens', client.get(latest).status_code == 200)
+    response = client.post(latest, data={'password': 'changed1', 'confirm_password': 'changed1'})
+    check('password reset', response.status_code == 302 and '/login' in response.location)
+    check('new password logs in', login(app.test_client(), usernames[0], 'changed1').status_code == 302)
+    with app.app_context():
+        password = User.query.filter_by(username=usernames[0]).one().password
+    for name, link in (('the used link', latest), ('an older link', first)):
+        response = client.post(link, data={'password': 'again123', 'confirm_password': 'again123'})
+        check(f'{name} no longer works', response.status_code == 302 and '/reset_password' in response.location)
+    with app.app_context():
+        check('password unchanged by them', User.query.filter_by(username=usernames[0]).one().password == password)
+
+    sink.stop()
+    print('password reset as expected' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
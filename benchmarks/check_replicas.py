@@ -0,0 +1,176 @@
+"""
+Checks read replica routing (studyonline/database.py) against two local
+SQLite files, one standing in for the primary and one for its replica.
+
+The replica is a copy of the primary with one room's topic changed, so
+every answer shows which database it came from, and an engine listener
+records where each statement ran. Checked:
+
+- @read_only views read from the replica
+- writes (flushes, UPDATE statements, a POST) go to the primary
+- after a commit, the rest of the request and the client's requests for
+  REPLICA_STICKY_SECONDS read from the primary, then the replica again
+- views that aren't @read_only never touch the replica
+
+Exits non-zero if any check fails.
+
+    python -m benchmarks.check_replicas
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from flask import g
+from sqlalchemy import event
+
+from benchmarks.common import BenchConfig, login, seed_users
+from studyonline import create_app, db
+from studyonline.models import Room, User
+
+REPLICA_TOPIC = 'replica copy'
+
+
+class Recorder:
+    """
+    The database file (primary or replica) of each statement executed.
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self.ran = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.ran.append(self.names.get(conn.engine.url.database, conn.engine.url.database))
+
+    def since(self, mark):
+        return set(self.ran[mark:])
+
+
+def make_apps(directory, sticky):
+    primary = os.path.join(directory, 'primary.db')
+    replica = os.path.join(directory, 'replica.db')
+
+    class ReplicaConfig(BenchConfig):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{primary}'
+        SQLALCHEMY_REPLICA_URIS = [f'sqlite:///{replica}']
+        REPLICA_STICKY_SECONDS = sticky
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        db.create_all(bind=None)
+    return app, primary, replica
+
+
+def replicate(app, primary, replica):
+    """
+    "Replication": the primary's file copied over the replica's, with every
+    pooled connection closed first so neither file is open mid-copy.
+    """
+
+    db.dispose_engines(app)
+    shutil.copyfile(primary, replica)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sticky', type=int, default=1, help='REPLICA_STICKY_SECONDS')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='studyonline-replicas-')
+    app, primary, replica = make_apps(directory, args.sticky)
+    username = seed_users(app, 1, prefix='repl')[0]
+    with app.app_context():
+        user_id = User.query.filter_by(username=username).one().id
+        room = Room(topic='primary copy', description='routing check', user_id=user_id)
+        db.session.add(room)
+        db.session.commit()
+        room_id = room.id
+        replicate(app, primary, replica)
+        # the replica now tells itself apart; nothing else writes to it
+        with db.get_engine(app, 'replica0').begin() as connection:
+            connection.execute(Room.__table__.update().where(Room.id == room_id).values(topic=REPLICA_TOPIC))
+
+    recorder = Recorder({primary: 'primary', replica: 'replica'})
+    with app.app_context():
+        for bind in (None, 'replica0'):
+            event.listen(db.get_engine(app, bind), 'before_cursor_execute', recorder)
+
+    failures = []
+
+    def check(name, ok, detail=''):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}" + (f' ({detail})' if detail and not ok else ''))
+        if not ok:
+            failures.append(name)
+
+    def topic(client):
+        response = client.get(f'/api/v1/rooms/{room_id}')
+        return response.get_json()['data']['topic']
+
+    # a fresh client, no write yet
+    client = app.test_client()
+    login(client, username)
+    mark = len(recorder.ran)
+    check('@read_only view reads the replica', topic(client) == REPLICA_TOPIC and recorder.since(mark) == {'replica'},
+          recorder.since(mark))
+
+    mark = len(recorder.ran)
+    client.get('/create_room')
+    check('other views stay on the primary', recorder.since(mark) == {'primary'}, recorder.since(mark))
+
+    # inside one request: flush and UPDATE go to the primary, and after the
+    # commit the request's reads do too
+    with app.test_request_context('/'):
+        g.db_read_only = True
+        mark = len(recorder.ran)
+        db.session.query(Room.id).filter(Room.id == room_id).all()
+        check('request reads the replica before writing', recorder.since(mark) == {'replica'}, recorder.since(mark))
+        mark = len(recorder.ran)
+        db.session.add(Room(topic='flushed', description='routing check', user_id=user_id))
+        db.session.flush()
+        check('flush goes to the primary', recorder.since(mark) == {'primary'}, recorder.since(mark))
+        mark = len(recorder.ran)
+        db.session.execute(Room.__table__.update().where(Room.id == room_id).values(description='updated'))
+        check('UPDATE statement goes to the primary', recorder.since(mark) == {'primary'}, recorder.since(mark))
+        db.session.commit()
+        mark = len(recorder.ran)
+        db.session.query(Room.id).filter(Room.id == room_id).all()
+        check('request reads the primary after its commit', recorder.since(mark) == {'primary'},
+              recorder.since(mark))
+        db.session.remove()
+
+    # a write through the app, then the same client's reads stick to the primary
+    mark = len(recorder.ran)
+    client.post('/create_room', data={'topic': 'sticky', 'description': 'routing check'})
+    check('POST writes to the primary', recorder.since(mark) == {'primary'}, recorder.since(mark))
+    with app.app_context():
+        created = db.session.query(Room.id).filter(Room.topic == 'sticky').scalar()
+        with db.get_engine(app, 'replica0').connect() as connection:
+            on_replica = connection.execute(db.select(Room.id).where(Room.id == created)).first()
+    check('the new room is only on the primary', created is not None and on_replica is None)
+
+    mark = len(recorder.ran)
+    check('client reads the primary right after writing', topic(client) != REPLICA_TOPIC
+          and recorder.since(mark) == {'primary'}, recorder.since(mark))
+
+    other = app.test_client()
+    login(other, username)
+    mark = len(recorder.ran)
+    check('another client still reads the replica', topic(other) == REPLICA_TOPIC
+          and recorder.since(mark) == {'replica'}, recorder.since(mark))
+
+    time.sleep(args.sticky + 0.2)
+    mark = len(recorder.ran)
+    check(f'back to the replica after {args.sticky}s', topic(client) == REPLICA_TOPIC
+          and recorder.since(mark) == {'replica'}, recorder.since(mark))
+
+    shutil.rmtree(directory, ignore_errors=True)
+    print('routing as expected' if not failures else f'{len(failures)} check(s) failed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Benchmarks build the real application through create_app() against a
+throw-away SQLite file, so they measure the same code paths as production
+minus the network. Run them from the repository root, e.g.
+
+    python -m benchmarks.bench_write_handlers
+"""
+
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from studyonline import create_app, db
+from studyonline.config import TestConfig
+
+
+class BenchConfig(TestConfig):
+    QUERY_BUDGET_ENABLED = False
+
+
+def make_app(config_class=BenchConfig, db_path=None, database_url=None):
+    """
+    Returns (app, db_path) with a fresh schema in a temporary SQLite file.
+    A file (not :memory:) is used so several client threads can share it.
+
+    With `database_url` (e.g. a scratch Postgres database) that database is
+    used instead, and its tables are dropped and recreated.
+    """
+
+    if database_url is None:
+        if db_path is None:
+            fd, db_path = tempfile.mkstemp(prefix='studyonline-bench-', suffix='.db')
+            os.close(fd)
+        database_url = f'sqlite:///{db_path}'
+
+    class _Config(config_class):
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    app = create_app(_Config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            # WAL lets readers run alongside the single writer, closer to how
+            # a server database behaves under concurrent workers
+            db.session.execute('PRAGMA journal_mode=WAL')
+            db.session.commit()
+    return app, db_path or database_url
+
+
+def login(client, username, password='password'):
+    return client.post('/login', data={'username': username, 'password': password})
+
+
+def run_workers(workers, requests_per_worker, setup, action, on_start=None):
+    """
+    Drives `action(state, i)` from `workers` threads, each thread standing in
+    for one synchronous WSGI worker. `setup(worker_index)` builds the
+    per-thread state (usually a logged-in test client). `on_start()` is
+    called once every setup is done, just before the threads are released.
+
+    Returns a dict with the request count, elapsed seconds, throughput and
+    latency percentiles in milliseconds.
+    """
+
+    states = [setup(n) for n in range(workers)]
+    latencies = [[] for _ in range(workers)]
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(n):
+        barrier.wait()
+        for i in range(requests_per_worker):
+            start = time.perf_counter()
+            action(states[n], i)
+            latencies[n].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    if on_start is not None:
+        on_start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = sorted(sample for per_worker in latencies for sample in per_worker)
+    return summarize(samples, elapsed)
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(sorted_samples, elapsed):
+    return {
+        'requests': len(sorted_samples),
+        'seconds': elapsed,
+        'rps': len(sorted_samples) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.mean(sorted_samples) * 1000 if sorted_samples else 0.0,
+        'p50_ms': percentile(sorted_samples, 50) * 1000,
+        'p95_ms': percentile(sorted_samples, 95) * 1000,
+        'p99_ms': percentile(sorted_samples, 99) * 1000,
+    }
+
+
+def print_table(rows, columns=('requests', 'rps', 'p50_ms', 'p95_ms', 'p99_ms')):
+    """
+    rows: list of (name, stats dict) pairs
+    """
+
+    width = max(len(name) for name, _ in rows)
+    print(f"{'':{width}}  " + '  '.join(f'{column:>10}' for column in columns))
+    for name, stats in rows:
+        cells = []
+        for column in columns:
+            value = stats[column]
+            cells.append(f'{value:>10.2f}' if isinstance(value, float) else f'{value:>10}')
+        print(f'{name:{width}}  ' + '  '.join(cells))
+
+
+def seed_users(app, count, prefix='bench', password='password'):
+    """
+    Inserts `count` users in one executemany and returns their usernames.
+    Usernames are kept within the 5-10 characters the forms accept.
+    """
+
+    from studyonline import bcrypt
+    from studyonline.models import User
+
+    hashed = bcrypt.generate_password_hash(password).decode('utf-8')
+    usernames = [f'{prefix}{n:05d}' for n in range(count)]
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {
+                'name': username,
+                'username': username,
+                'email': f'{username}@example.com',
+                'password': hashed,
+                'image_file': 'default.jpg',
+            }
+            for username in usernames
+        ])
+        db.session.commit()
+    return usernames
@@ -0,0 +1,134 @@
+"""
+Synthetic data for benchmarks: users, rooms and room memberships.
+
+Everything is generated from a seed, so two runs with the same arguments
+produce the same database. Rows go in with one executemany per batch.
+Room creators follow a long-tailed distribution (a few users host many
+rooms, most host a handful), which is what makes per-user listings
+interesting to measure.
+
+    python -m benchmarks.datagen --users 1000 --rooms 100000 --database-url postgresql://...
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, seed_users
+from studyonline import db
+from studyonline.models import Room, User, room_membership
+from studyonline.rooms import topics
+from studyonline import counters
+
+SUBJECTS = (
+    'flask django python rust golang algebra calculus physics chemistry biology '
+    'history poetry spanish french german japanese guitar piano drawing chess '
+    'statistics databases networks compilers kernels security design writing '
+    'economics finance marketing music theory geometry topology astronomy'
+).split()
+
+# a long tail of filler words so most terms are rare, like real descriptions
+FILLER = [f'w{n}' for n in range(20000)]
+
+
+def description(rng):
+    words = rng.sample(SUBJECTS, 2) + [FILLER[int(rng.paretovariate(1.2)) % len(FILLER)] for _ in range(8)]
+    rng.shuffle(words)
+    return ' '.join(words)[:100]
+
+
+def _creator(rng, user_ids):
+    return user_ids[min(len(user_ids) - 1, int(rng.paretovariate(1.1)) - 1)]
+
+
+def seed_rooms(app, count, batch=10000, seed=1):
+    """
+    Inserts `count` rooms created over the last year by the existing users.
+    """
+
+    rng = random.Random(seed)
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(count, 1)
+    with app.app_context():
+        user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+        rng.shuffle(user_ids)
+        topic_ids = topics.topic_ids(SUBJECTS)
+        for offset in range(0, count, batch):
+            rows = []
+            for n in range(offset, min(count, offset + batch)):
+                subject = rng.choice(SUBJECTS)
+                rows.append({
+                    'topic': subject,
+                    'topic_id': topic_ids[subject],
+                    'description': description(rng),
+                    'date_created': start + step * n,
+                    'user_id': _creator(rng, user_ids),
+                    'total_members': 0,
+                })
+            db.session.execute(Room.__table__.insert(), rows)
+            topics.add_rooms(row['topic_id'] for row in rows)
+            counters.add_user_rooms(row['user_id'] for row in rows)
+            db.session.commit()
+
+
+def seed_memberships(app, per_user, batch=10000, seed=2):
+    """
+    Has every user join `per_user` random rooms (other than their own) and
+    sets Room.total_members to match.
+    """
+
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    with app.app_context():
+        rooms = db.session.query(Room.id, Room.user_id).all()
+        user_ids = [row[0] for row in db.session.query(User.id)]
+        rows = []
+        for user_id in user_ids:
+            for room_id, host_id in {rooms[rng.randrange(len(rooms))] for _ in range(per_user)}:
+                if host_id != user_id:
+                    rows.append({'room_id': room_id, 'user_id': user_id, 'joined_at': now})
+            if len(rows) >= batch:
+                db.session.execute(room_membership.insert(), rows)
+                rows = []
+        if rows:
+            db.session.execute(room_membership.insert(), rows)
+        counts = (
+            db.select(db.func.count())
+            .where(room_membership.c.room_id == Room.id)
+            .scalar_subquery()
+        )
+        db.session.execute(Room.__table__.update().values(total_members=counts))
+        db.session.commit()
+
+
+def generate(app, users, rooms, memberships=0, seed=1):
+    """
+    Fills the database and returns the generated usernames.
+    """
+
+    usernames = seed_users(app, users, prefix='load')
+    if rooms:
+        seed_rooms(app, rooms, seed=seed)
+    if rooms and memberships:
+        seed_memberships(app, memberships, seed=seed + 1)
+    return usernames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=10000)
+    parser.add_argument('--memberships', type=int, default=5, help='rooms joined per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='default: a temporary SQLite file')
+    args = parser.parse_args()
+
+    app, location = make_app(database_url=args.database_url)
+    started = time.perf_counter()
+    generate(app, args.users, args.rooms, args.memberships, seed=args.seed)
+    print(f'{args.users} users, {args.rooms} rooms in {time.perf_counter() - started:.1f}s -> {location}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+A local debugging SMTP server that accepts every message and keeps it.
+
+Stands in for the real mail server when developing and testing the outbox
+(smtpd, the standard library's DebuggingServer, is gone from Python 3.12):
+
+    python -m benchmarks.smtp_sink --port 8025 --print
+    MAIL_PORT=8025 flask outbox drain --once
+
+--delay adds a pause to every command reply to stand in for a network round
+trip, --connect-delay to every new connection (TCP, TLS and login on a
+real server). Setting `refuse` to N on a running sink answers the next N
+messages with `refuse_reply` instead of accepting them, to exercise the
+outbox's retries.
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=8025, delay=0, connect_delay=0, echo=False):
+        super().__init__((host, port), SMTPHandler)
+        self.delay = delay
+        self.connect_delay = connect_delay
+        self.echo = echo
+        self.messages = []
+        self.connections = 0
+        self.refuse = 0
+        self.refuse_reply = '451 4.3.0 Try again later'
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Serves from a daemon thread, returns self.
+        """
+
+        threading.Thread(target=self.serve_forever, name='smtp-sink', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def refused(self):
+        """
+        The reply refusing this message, or None to accept it.
+        """
+
+        with self.lock:
+            if self.refuse <= 0:
+                return None
+            self.refuse -= 1
+            return self.refuse_reply
+
+    def received(self, sender, recipients, data):
+        message = message_from_bytes(data, policy=policy.default)
+        with self.lock:
+            self.messages.append(message)
+        if self.echo:
+            print(f'---- from {sender} to {", ".join(recipients)}\n{data.decode("utf-8", "replace")}', flush=True)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        with self.server.lock:
+            self.server.connections += 1
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+        self.reply('220 localhost smtp sink')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('ascii', 'replace').strip()
+            verb = command[:4].upper()
+            if verb == 'EHLO':
+                self.reply('250-localhost\r\n250 8BITMIME')
+            elif verb == 'HELO':
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                sender, recipients = command[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data == b'.\r\n':
+                        break
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                refused = self.server.refused()
+                if refused:
+                    self.reply(refused)
+                    continue
+                self.server.received(sender, recipients, b''.join(lines))
+                self.reply('250 OK queued')
+            elif verb in ('RSET', 'NOOP'):
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--delay', type=float, default=0, help='seconds before each reply')
+    parser.add_argument('--connect-delay', type=float, default=0, help='seconds before greeting a connection')
+    parser.add_argument('--print', dest='echo', action='store_true', help='print every message received')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.delay, args.connect_delay, args.echo)
+    print(f'smtp sink on {args.host}:{args.port}', flush=True)
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Stress test for room membership counters.
+
+Worker threads join and leave a handful of rooms at random, many of them
+hitting the same room at the same time, then every Room.total_members is
+compared with the real number of room_membership rows. Exits non-zero if
+any counter drifted.
+
+    python -m benchmarks.stress_membership --workers 16 --ops 300
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import make_app, seed_users
+from studyonline import db
+from studyonline.models import Room, User, room_membership
+from studyonline.rooms import membership
+
+
+def seed_rooms(app, count):
+    with app.app_context():
+        host = User.query.first()
+        db.session.execute(Room.__table__.insert(), [
+            {'topic': f'Room {n}', 'description': 'stress', 'user_id': host.id}
+            for n in range(count)
+        ])
+        db.session.commit()
+        return [room_id for (room_id,) in db.session.query(Room.id)]
+
+
+def drifted_rooms(app):
+    """
+    (room_id, total_members, actual) for every room whose counter is off.
+    """
+
+    with app.app_context():
+        actual = dict(
+            db.session.query(room_membership.c.room_id, db.func.count())
+            .group_by(room_membership.c.room_id)
+        )
+        return [
+            (room_id, total, actual.get(room_id, 0))
+            for room_id, total in db.session.query(Room.id, Room.total_members)
+            if total != actual.get(room_id, 0)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=200, help='join/leave calls per worker')
+    parser.add_argument('--rooms', type=int, default=4)
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    app, _ = make_app()
+    seed_users(app, args.users, prefix='st')
+    room_ids = seed_rooms(app, args.rooms)
+    with app.app_context():
+        user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+
+    barrier = threading.Barrier(args.workers)
+    counts = {'joined': 0, 'left': 0, 'noop': 0}
+    counts_lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(args.seed + n)
+        done = {'joined': 0, 'left': 0, 'noop': 0}
+        with app.app_context():
+            barrier.wait()
+            for _ in range(args.ops):
+                room_id = rng.choice(room_ids)
+                user_id = rng.choice(user_ids)
+                if rng.random() < 0.6:
+                    changed, kind = membership.join(room_id, user_id), 'joined'
+                else:
+                    changed, kind = membership.leave(room_id, user_id), 'left'
+                done[kind if changed else 'noop'] += 1
+            db.session.remove()
+        with counts_lock:
+            for key, value in done.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total_ops = args.workers * args.ops
+    print(f'{total_ops} operations on {args.rooms} rooms in {elapsed:.2f}s '
+          f'({total_ops / elapsed:.0f} ops/s): {counts}')
+    drift = drifted_rooms(app)
+    for room_id, total, actual in drift:
+        print(f'room {room_id}: total_members={total} but {actual} member rows')
+    print('counters consistent' if not drift else f'{len(drift)} rooms drifted')
+    return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+End-to-end load test of the main endpoints.
+
+Builds the app with create_app() and the benchmark config, fills the
+database through benchmarks.datagen (a temporary SQLite file, or
+--database-url), then drives each scenario from --workers client threads
+and reports requests per second, p50/p95/p99 latency and SQL queries per
+request.
+
+Results can be saved as a named baseline under benchmarks/baselines/ and
+later runs compared against it; a scenario whose p95 or throughput got
+worse than --tolerance, or that runs more queries per request, is reported
+as a regression and the run exits with status 1.
+
+    python -m benchmarks.suite --save-baseline sqlite-small
+    python -m benchmarks.suite --compare sqlite-small
+
+Compare runs made with the same sizes on the same machine; the stored
+arguments are checked and a mismatch is reported. Passwords are hashed at
+the test config's bcrypt cost, so users.login measures the endpoint rather
+than bcrypt (see bench_bcrypt for that).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import threading
+from datetime import datetime
+
+from sqlalchemy import event
+
+from benchmarks.common import login, make_app, print_table, run_workers
+from benchmarks.datagen import SUBJECTS, generate
+from studyonline import db
+from studyonline.models import Room
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# the arguments that change the numbers, stored with every result
+SIZE_ARGS = ('users', 'rooms', 'memberships', 'workers', 'requests', 'seed')
+
+
+class QueryCounter:
+    """
+    Counts every SQL statement the engine runs.
+    """
+
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.total = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.total += 1
+
+    def reset(self):
+        with self._lock:
+            self.total = 0
+
+
+def scenarios(app, usernames, room_ids, seed):
+    """
+    (endpoint, setup(worker), action(state, i)) for every scenario.
+    """
+
+    counter = itertools.count()
+
+    def anonymous(n):
+        return {'client': app.test_client(), 'rng': random.Random(seed + n)}
+
+    def logged_in(n):
+        state = anonymous(n)
+        state['username'] = usernames[n % len(usernames)]
+        login(state['client'], state['username'])
+        return state
+
+    def get(path):
+        def action(state, i):
+            response = state['client'].get(path(state) if callable(path) else path)
+            assert response.status_code == 200, response.status_code
+        return action
+
+    def do_login(state, i):
+        # a fresh client each time: a logged-in one is just redirected
+        response = login(app.test_client(), state['rng'].choice(usernames))
+        assert response.status_code == 302, response.status_code
+
+    def create_room(state, i):
+        response = state['client'].post('/create_room', data={
+            'topic': state['rng'].choice(SUBJECTS),
+            'description': f'load test room {next(counter)}',
+        })
+        assert response.status_code == 302, response.status_code
+
+    return [
+        ('main.home (anonymous)', anonymous, get('/')),
+        ('main.home', logged_in, get('/')),
+        ('users.login', anonymous, do_login),
+        ('users.user_rooms', logged_in,
+         get(lambda state: f"/user_rooms/{state['rng'].choice(usernames)}")),
+        ('rooms.room', logged_in, get(lambda state: f"/room/{state['rng'].choice(room_ids)}")),
+        ('rooms.search', anonymous, get(lambda state: f"/search?q={state['rng'].choice(SUBJECTS)}")),
+        ('rooms.create_room', logged_in, create_room),
+    ]
+
+
+def run(args):
+    app, location = make_app(database_url=args.database_url)
+    usernames = generate(app, args.users, args.rooms, args.memberships, seed=args.seed)
+    with app.app_context():
+        room_ids = [row[0] for row in db.session.query(Room.id)]
+        queries = QueryCounter(db.engine)
+
+    results = {}
+    for endpoint, setup, action in scenarios(app, usernames, room_ids, args.seed):
+        if args.only and not any(name in endpoint for name in args.only):
+            continue
+        # warm up caches and connections so the first requests don't skew p99
+        run_workers(1, 5, setup, action)
+        # count from after the setup (logins) to the end of the run
+        stats = run_workers(args.workers, args.requests, setup, action, on_start=queries.reset)
+        stats['queries'] = queries.total / stats['requests']
+        results[endpoint] = stats
+
+    return {
+        'meta': {
+            'args': {name: getattr(args, name) for name in SIZE_ARGS},
+            'database': 'sqlite' if args.database_url is None else args.database_url.split(':')[0],
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }, location
+
+
+def compare(current, baseline, tolerance):
+    """
+    Returns (rows for print_table, list of regression messages).
+    """
+
+    rows, regressions = [], []
+    for endpoint, stats in current['results'].items():
+        base = baseline['results'].get(endpoint)
+        if base is None:
+            continue
+        delta = {
+            'rps': stats['rps'],
+            'rps_%': (stats['rps'] / base['rps'] - 1) * 100 if base['rps'] else 0.0,
+            'p95_ms': stats['p95_ms'],
+            'p95_%': (stats['p95_ms'] / base['p95_ms'] - 1) * 100 if base['p95_ms'] else 0.0,
+            'queries': stats['queries'],
+            'base_q': base['queries'],
+        }
+        rows.append((endpoint, delta))
+        if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']:.2f} -> {stats['p95_ms']:.2f} ms")
+        if stats['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: {base['rps']:.0f} -> {stats['rps']:.0f} requests/s")
+        # cache hits make the count vary a little from run to run
+        if stats['queries'] > base['queries'] + 0.1:
+            regressions.append(f"{endpoint}: {base['queries']:.2f} -> {stats['queries']:.2f} queries/request")
+    return rows, regressions
+
+
+def baseline_path(name):
+    return os.path.join(BASELINES, f'{name}.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rooms', type=int, default=20000)
+    parser.add_argument('--memberships', type=int, default=5, help='rooms joined per user')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100, help='requests per worker per scenario')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='default: a temporary SQLite file')
+    parser.add_argument('--only', nargs='*', help='run scenarios whose name contains one of these')
+    parser.add_argument('--save-baseline', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed p95/throughput change before it counts as a regression')
+    parser.add_argument('--json', action='store_true', help='print the raw results as JSON')
+    args = parser.parse_args()
+
+    current, location = run(args)
+    print(f"{args.users} users, {args.rooms} rooms, {args.workers} workers x {args.requests} requests "
+          f"on {current['meta']['database']} ({location})")
+    print_table(list(current['results'].items()),
+                columns=('requests', 'rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries'))
+    if args.json:
+        print(json.dumps(current, indent=2))
+
+    if args.save_baseline:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(baseline_path(args.save_baseline), 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'saved baseline {args.save_baseline}')
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        if baseline['meta']['args'] != current['meta']['args']:
+            print(f"warning: baseline was run with {baseline['meta']['args']}")
+        rows, regressions = compare(current, baseline, args.tolerance)
+        print(f'\ncompared with {args.compare} ({baseline["meta"]["date"]})')
+        print_table(rows, columns=('rps', 'rps_%', 'p95_ms', 'p95_%', 'queries', 'base_q'))
+        if regressions:
+            print('\nregressions:')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print('\nno regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+gunicorn settings, picked up automatically from the working directory:
+
+    gunicorn run:app
+
+preload_app builds the app once in the master and forks the workers from
+it, so the imported modules and the app itself are shared copy-on-write
+instead of being loaded again by every worker. A worker is ready as soon as
+it is forked.
+
+Copy-on-write only helps while the pages stay untouched. The cyclic garbage
+collector writes to every object it visits, so collection is off while the
+app loads and everything created by then is frozen (gc.freeze()) out of
+the collector's reach before forking. Workers collect normally from there on.
+
+Set PRELOAD_APP=0 to have each worker import the app itself (e.g. to reload
+code with HUP), LAZY_EXTENSIONS (config.py) keeps that import small.
+"""
+
+import gc
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 * (os.cpu_count() or 1) + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+preload_app = os.environ.get('PRELOAD_APP', '1') == '1'
+
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    """
+    In the master, after the app was preloaded and before the first fork.
+    """
+
+    if not preload_app:
+        return
+    from studyonline import db
+
+    # connections opened while loading must not be shared by the workers
+    db.dispose_engines(server.app.wsgi())
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
@@ -0,0 +1,37 @@
+"""Room membership.
+
+Revision ID: 5d8a1f4c6b27
+Revises: c41e7b9a2f35
+Create Date: 2026-10-18 13:40:55.127630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8a1f4c6b27'
+down_revision = 'c41e7b9a2f35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('room_membership',
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('joined_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['room_id'], ['room.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('room_id', 'user_id')
+    )
+    op.create_index('ix_room_membership_user_id_room_id', 'room_membership', ['user_id', 'room_id'], unique=False)
+    # nobody could actually join before, start every counter at zero
+    # (no server default is added here: on SQLite that means rebuilding the
+    # room table, which would drop the full-text search triggers)
+    op.execute("UPDATE room SET total_members = 0")
+
+
+def downgrade():
+    op.drop_index('ix_room_membership_user_id_room_id', table_name='room_membership')
+    op.drop_table('room_membership')
@@ -0,0 +1,35 @@
+"""Room chat messages.
+
+Revision ID: 8e2b6d4a9c13
+Revises: 5d8a1f4c6b27
+Create Date: 2026-10-18 15:02:31.418206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b6d4a9c13'
+down_revision = '5d8a1f4c6b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('body', sa.String(length=500), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['room_id'], ['room.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_message_room_id_id', 'message', ['room_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_message_room_id_id', table_name='message')
+    op.drop_table('message')
@@ -0,0 +1,24 @@
+"""Room keyset pagination index.
+
+Revision ID: 9f3c2a7d1e04
+Revises: 4b98d32b3d81
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f3c2a7d1e04'
+down_revision = '4b98d32b3d81'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_room_date_created_id', 'room', ['date_created', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_room_date_created_id', table_name='room')
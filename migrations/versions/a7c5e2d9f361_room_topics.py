@@ -0,0 +1,108 @@
+"""Normalized room topics.
+
+Revision ID: a7c5e2d9f361
+Revises: 8e2b6d4a9c13
+Create Date: 2026-10-18 17:12:09.551830
+
+"""
+from collections import Counter
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c5e2d9f361'
+down_revision = '8e2b6d4a9c13'
+branch_labels = None
+depends_on = None
+
+
+BATCH = 1000
+
+
+def normalize(name):
+    # a copy of studyonline.rooms.topics.normalize(), which a migration can't
+    # import; SQL lower()/trim() only fold ASCII and only trim spaces, so the
+    # backfill runs in Python to give the rooms the topics the app would
+    name = (name or '').strip().lower()[:20]
+    return name or None
+
+
+def _rooms(bind, room):
+    """
+    (room id, normalized topic) of every room with a topic, streamed from a
+    server-side cursor BATCH rows at a time instead of fetched all at once.
+    """
+
+    rows = bind.execution_options(stream_results=True).execute(
+        sa.select(room.c.id, room.c.topic).where(room.c.topic.isnot(None)))
+    for partition in rows.partitions(BATCH):
+        for room_id, name in partition:
+            name = normalize(name)
+            if name is not None:
+                yield room_id, name
+
+
+def _backfill():
+    """
+    Two passes over the rooms, so only the topic names are held in memory:
+    the first counts the rooms of each normalized name and inserts the
+    topics, the second links each room to its topic, flushing the UPDATEs
+    BATCH rows per executemany as it goes.
+    """
+
+    bind = op.get_bind()
+    room = sa.table('room', sa.column('id', sa.Integer), sa.column('topic', sa.String),
+                    sa.column('topic_id', sa.Integer))
+    topic = sa.table('topic', sa.column('id', sa.Integer), sa.column('name', sa.String),
+                     sa.column('room_count', sa.Integer))
+
+    counts = Counter(name for _, name in _rooms(bind, room))
+    if not counts:
+        return
+
+    names = sorted(counts)
+    for start in range(0, len(names), BATCH):
+        bind.execute(topic.insert(), [
+            {'name': name, 'room_count': counts[name]} for name in names[start:start + BATCH]
+        ])
+    ids = {name: pk for name, pk in bind.execute(sa.select(topic.c.name, topic.c.id))}
+
+    update = room.update().where(room.c.id == sa.bindparam('room_id')).values(topic_id=sa.bindparam('topic_id'))
+    links = []
+    for room_id, name in _rooms(bind, room):
+        links.append({'room_id': room_id, 'topic_id': ids[name]})
+        if len(links) == BATCH:
+            bind.execute(update, links)
+            links = []
+    if links:
+        bind.execute(update, links)
+
+
+def upgrade():
+    op.create_table('topic',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=20), nullable=False),
+    sa.Column('room_count', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_index('ix_topic_room_count_id', 'topic', ['room_count', 'id'], unique=False)
+    # a plain ADD COLUMN: on SQLite batch mode would rebuild the room table and
+    # drop the full-text search triggers, so SQLite goes without the constraint
+    op.add_column('room', sa.Column('topic_id', sa.Integer(), nullable=True))
+    if op.get_bind().dialect.name != 'sqlite':
+        op.create_foreign_key('fk_room_topic_id_topic', 'room', 'topic', ['topic_id'], ['id'])
+
+    _backfill()
+    # after the backfill, so it isn't maintained row by row during the UPDATE
+    op.create_index('ix_room_topic_id_date_created_id', 'room', ['topic_id', 'date_created', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_room_topic_id_date_created_id', table_name='room')
+    if op.get_bind().dialect.name != 'sqlite':
+        op.drop_constraint('fk_room_topic_id_topic', 'room', type_='foreignkey')
+    op.drop_column('room', 'topic_id')
+    op.drop_index('ix_topic_room_count_id', table_name='topic')
+    op.drop_table('topic')
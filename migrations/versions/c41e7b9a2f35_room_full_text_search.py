@@ -0,0 +1,70 @@
+"""Room full-text search index.
+
+Revision ID: c41e7b9a2f35
+Revises: 9f3c2a7d1e04
+Create Date: 2026-10-18 11:02:17.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e7b9a2f35'
+down_revision = '9f3c2a7d1e04'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS room_fts USING fts5("
+    "topic, description, content='room', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS room_fts_ai AFTER INSERT ON room BEGIN "
+    "INSERT INTO room_fts(rowid, topic, description) "
+    "VALUES (new.id, new.topic, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS room_fts_ad AFTER DELETE ON room BEGIN "
+    "INSERT INTO room_fts(room_fts, rowid, topic, description) "
+    "VALUES ('delete', old.id, old.topic, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS room_fts_au AFTER UPDATE OF topic, description ON room BEGIN "
+    "INSERT INTO room_fts(room_fts, rowid, topic, description) "
+    "VALUES ('delete', old.id, old.topic, old.description); "
+    "INSERT INTO room_fts(rowid, topic, description) "
+    "VALUES (new.id, new.topic, new.description); END",
+    # index the rooms that already exist
+    "INSERT INTO room_fts(room_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS room_fts_au",
+    "DROP TRIGGER IF EXISTS room_fts_ad",
+    "DROP TRIGGER IF EXISTS room_fts_ai",
+    "DROP TABLE IF EXISTS room_fts",
+]
+
+POSTGRES_UPGRADE = [
+    "ALTER TABLE room ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(topic, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS ix_room_search_vector ON room USING gin (search_vector)",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP INDEX IF EXISTS ix_room_search_vector",
+    "ALTER TABLE room DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_dialect):
+    dialect = op.get_bind().dialect.name
+    for statement in statements_by_dialect.get(dialect, []):
+        op.execute(statement)
+
+
+def upgrade():
+    _run({'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE})
+
+
+def downgrade():
+    _run({'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE})
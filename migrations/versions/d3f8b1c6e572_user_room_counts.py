@@ -0,0 +1,34 @@
+"""Index rooms by creator, per-user room counters.
+
+Revision ID: d3f8b1c6e572
+Revises: a7c5e2d9f361
+Create Date: 2026-10-18 18:31:44.203917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8b1c6e572'
+down_revision = 'a7c5e2d9f361'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # room.user_id had no index: per-user listings ("WHERE user_id = ? ORDER BY
+    # date_created DESC, id DESC") and User.rooms scanned the whole table
+    op.create_index('ix_room_user_id_date_created_id', 'room', ['user_id', 'date_created', 'id'], unique=False)
+    op.add_column('user', sa.Column('room_count', sa.Integer(), server_default='0', nullable=False))
+
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('room_count', sa.Integer))
+    room = sa.table('room', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer))
+    op.execute(user.update().values(room_count=(
+        sa.select(sa.func.count(room.c.id)).where(room.c.user_id == user.c.id).scalar_subquery()
+    )))
+
+
+def downgrade():
+    op.drop_column('user', 'room_count')
+    op.drop_index('ix_room_user_id_date_created_id', table_name='room')
@@ -0,0 +1,41 @@
+"""Outbox table for outgoing email.
+
+Revision ID: e6a9c4f2b718
+Revises: d3f8b1c6e572
+Create Date: 2026-10-18 20:12:05.481223
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a9c4f2b718'
+down_revision = 'd3f8b1c6e572'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=120), nullable=False),
+    sa.Column('subject', sa.String(length=200), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=10), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('claimed_by', sa.String(length=32), nullable=True),
+    sa.Column('last_error', sa.String(length=200), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_message_status_next_attempt_at', 'outbox_message', ['status', 'next_attempt_at'], unique=False)
+    op.create_index('ix_outbox_message_claimed_by', 'outbox_message', ['claimed_by'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_message_claimed_by', table_name='outbox_message')
+    op.drop_index('ix_outbox_message_status_next_attempt_at', table_name='outbox_message')
+    op.drop_table('outbox_message')
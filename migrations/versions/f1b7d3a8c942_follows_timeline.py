@@ -0,0 +1,59 @@
+"""Follows, follower counters and precomputed timelines.
+
+Revision ID: f1b7d3a8c942
+Revises: e6a9c4f2b718
+Create Date: 2026-10-18 21:40:27.118035
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7d3a8c942'
+down_revision = 'e6a9c4f2b718'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('follower_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user', sa.Column('following_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('user', sa.Column('timeline_seq', sa.Integer(), server_default='0', nullable=False))
+    op.create_index('ix_user_follower_count', 'user', ['follower_count'], unique=False)
+    op.create_table('follow',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followed_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['followed_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('follower_id', 'followed_id')
+    )
+    op.create_index('ix_follow_followed_id_follower_id', 'follow', ['followed_id', 'follower_id'], unique=False)
+    # starts empty: every timeline only has the rooms created from now on,
+    # `flask rebuild-timelines` fills them from existing rooms
+    op.create_table('timeline_entry',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('slot', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('room_id', sa.Integer(), nullable=False),
+    sa.Column('creator_id', sa.Integer(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'slot')
+    )
+    op.create_index('ix_timeline_entry_user_id_date_created_room_id', 'timeline_entry', ['user_id', 'date_created', 'room_id'], unique=False)
+    op.create_index('ix_timeline_entry_user_id_creator_id', 'timeline_entry', ['user_id', 'creator_id'], unique=False)
+    op.create_index('ix_timeline_entry_room_id', 'timeline_entry', ['room_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_timeline_entry_room_id', table_name='timeline_entry')
+    op.drop_index('ix_timeline_entry_user_id_creator_id', table_name='timeline_entry')
+    op.drop_index('ix_timeline_entry_user_id_date_created_room_id', table_name='timeline_entry')
+    op.drop_table('timeline_entry')
+    op.drop_index('ix_follow_followed_id_follower_id', table_name='follow')
+    op.drop_table('follow')
+    op.drop_index('ix_user_follower_count', table_name='user')
+    op.drop_column('user', 'timeline_seq')
+    op.drop_column('user', 'following_count')
+    op.drop_column('user', 'follower_count')
@@ -7,35 +7,78 @@ The login manager contains the code that lets application and Flask-Login work t
 such as how to load a user from an ID, where to send users when they need to log in
 """
 
+import click
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from studyonline.config import Config
-from flask_migrate import Migrate
+from studyonline.database import RoutingSQLAlchemy
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 bcrypt = Bcrypt()
-migrate = Migrate()
+# Flask-Migrate, set up by init_migrate()
+migrate = None
 login_manager = LoginManager()
 login_manager.login_view = 'users.login'
 login_manager.login_message_category = 'info'
 
+def init_migrate(app):
+    """
+    Flask-Migrate imports alembic, the heaviest import we have (about half of
+    the startup time and ~10MB per process), yet only the `flask db` commands
+    use it. With LAZY_EXTENSIONS on it is only set up when the app is being
+    created by the flask command line, not in server workers.
+    """
+
+    global migrate
+    if app.config['LAZY_EXTENSIONS'] and click.get_current_context(silent=True) is None:
+        return
+    from flask_migrate import Migrate
+    if migrate is None:
+        migrate = Migrate()
+    migrate.init_app(app, db)
+
 def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
+    from studyonline import template_cache
+    template_cache.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    init_migrate(app)
     bcrypt.init_app(app)
     login_manager.init_app(app)
+    from studyonline.pagination import room_counts
+    room_counts.ttl = app.config['ROOM_COUNT_CACHE_TTL']
+    from studyonline import timeline
+    timeline.init_app(app)
+    from studyonline import query_counter
+    query_counter.init_app(app)
+    from studyonline.users.cache import user_cache
+    user_cache.init_app(app)
+    from studyonline.main.utils import init_feed_cache
+    init_feed_cache(app)
+    from studyonline import ratelimit
+    ratelimit.init_app(app)
+    from studyonline import assets
+    assets.init_app(app)
+    from studyonline import mail
+    mail.init_app(app)
     from studyonline.main.routes import main
     from studyonline.users.routes import users
     from studyonline.rooms.routes import rooms
     from studyonline.errors.handlers import errors
+    from studyonline.api.routes import api
 
     app.register_blueprint(main)
     app.register_blueprint(users)
     app.register_blueprint(rooms)
     app.register_blueprint(errors)
+    app.register_blueprint(api)
+
+    from studyonline.commands import register_commands
+    register_commands(app)
+
+    from studyonline import instrumentation
+    instrumentation.init_app(app)
 
     return app
\ No newline at end of file
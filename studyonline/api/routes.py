@@ -0,0 +1,136 @@
+from flask import Blueprint, abort, current_app, request, Response, stream_with_context
+from werkzeug.exceptions import HTTPException
+from studyonline import db
+from studyonline.database import read_only
+from studyonline.models import Room, User
+from studyonline.pagination import keyset_paginate
+from studyonline.api.utils import (ROOM_FIELDS, USER_FIELDS, JSONL, dumps, json_response, page_size,
+                                   requested_fields, requested_ids, serializer, wants_jsonl)
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# selected in front of the requested fields, for keyset pagination
+ROOM_KEYS = (Room.date_created, Room.id)
+
+
+@api.errorhandler(HTTPException)
+@api.errorhandler(404)
+def api_error(error):
+    """
+    Errors as JSON rather than the HTML error pages. 404 is named on its own
+    as the app's 404 page would otherwise be picked before this handler.
+    """
+
+    response = json_response({'error': error.name, 'message': error.description}, error.code)
+    # e.g. Allow on a 405, without the exception's own text/html Content-Type
+    response.headers.extend((name, value) for name, value in error.get_headers() if name != 'Content-Type')
+    return response
+
+
+def _room_query(fields, columns):
+    query = db.session.query(*columns)
+    if 'creator' in fields:
+        query = query.join(User, User.id == Room.user_id)
+    return query
+
+
+def _room_listing(query, fields):
+    """
+    A page of `query` as {data, next_cursor, prev_cursor}, or with
+    ?format=jsonl every room from the cursor on, streamed as JSON Lines.
+    """
+
+    cursor = request.args.get('cursor')
+    to_dict = serializer(fields, len(ROOM_KEYS))
+    if wants_jsonl():
+        return Response(stream_with_context(_stream_rooms(query, to_dict, cursor)), mimetype=JSONL)
+    rooms = keyset_paginate(query, Room.date_created, Room.id, cursor=cursor, per_page=page_size())
+    return json_response({
+        'data': [to_dict(row) for row in rooms.items],
+        'next_cursor': rooms.next_cursor,
+        'prev_cursor': rooms.prev_cursor,
+    })
+
+
+def _stream_rooms(query, to_dict, cursor):
+    """
+    Walks the listing in keyset pages of API_STREAM_BATCH rows, one query
+    each, so memory stays flat and no long-running cursor is held open.
+    """
+
+    batch = current_app.config['API_STREAM_BATCH']
+    while True:
+        rooms = keyset_paginate(query, Room.date_created, Room.id, cursor=cursor, per_page=batch)
+        if rooms.items:
+            yield ''.join(dumps(to_dict(row)) + '\n' for row in rooms.items)
+        if not rooms.has_next:
+            return
+        cursor = rooms.next_cursor
+
+
+@api.route('/rooms')
+@read_only
+def rooms():
+    """
+    Rooms newest first, or the rooms in ?ids= in that order.
+    """
+
+    fields, columns = requested_fields(ROOM_FIELDS, ROOM_KEYS)
+    query = _room_query(fields, columns)
+    ids = requested_ids()
+    if ids is None:
+        return _room_listing(query, fields)
+
+    to_dict = serializer(fields, len(ROOM_KEYS))
+    found = {row.id: row for row in query.filter(Room.id.in_(ids))} if ids else {}
+    return json_response({'data': [to_dict(found[pk]) for pk in ids if pk in found]})
+
+
+@api.route('/rooms/<int:pk>')
+@read_only
+def room(pk):
+    fields, columns = requested_fields(ROOM_FIELDS, ROOM_KEYS)
+    row = _room_query(fields, columns).filter(Room.id == pk).first()
+    if row is None:
+        abort(404, description=f'no room {pk}')
+    return json_response({'data': serializer(fields, len(ROOM_KEYS))(row)})
+
+
+@api.route('/users')
+@read_only
+def users():
+    """
+    The users in ?ids=, in that order.
+    """
+
+    ids = requested_ids()
+    if not ids:
+        abort(400, description='pass the users as ?ids=1,2,3')
+    fields, columns = requested_fields(USER_FIELDS, (User.id,))
+    to_dict = serializer(fields, 1)
+    found = {row.id: row for row in db.session.query(*columns).filter(User.id.in_(ids))}
+    return json_response({'data': [to_dict(found[pk]) for pk in ids if pk in found]})
+
+
+@api.route('/users/<string:username>')
+@read_only
+def user(username):
+    fields, columns = requested_fields(USER_FIELDS)
+    row = db.session.query(*columns).filter(User.username == username).first()
+    if row is None:
+        abort(404, description=f'no user {username}')
+    return json_response({'data': serializer(fields, 0)(row)})
+
+
+@api.route('/users/<string:username>/rooms')
+@read_only
+def user_rooms(username):
+    """
+    A user's rooms newest first, from the (user_id, date_created, id) index.
+    """
+
+    user_id = db.session.query(User.id).filter(User.username == username).scalar()
+    if user_id is None:
+        abort(404, description=f'no user {username}')
+    fields, columns = requested_fields(ROOM_FIELDS, ROOM_KEYS)
+    return _room_listing(_room_query(fields, columns).filter(Room.user_id == user_id), fields)
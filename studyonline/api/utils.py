@@ -0,0 +1,103 @@
+"""
+Serialization for the JSON API.
+
+Every resource is a mapping of public field names to columns. A request
+selects only the columns of the fields it asks for (?fields=id,topic), so
+rows come back as plain tuples from a narrow SELECT and are turned into
+dicts without building ORM objects. Output is compact JSON
+(no whitespace), or JSON Lines for streamed listings.
+"""
+
+import json
+from datetime import datetime
+from flask import abort, current_app, request, Response
+from studyonline.models import Room, User
+
+ROOM_FIELDS = {
+    'id': Room.id,
+    'topic': Room.topic,
+    'topic_id': Room.topic_id,
+    'description': Room.description,
+    'date_created': Room.date_created,
+    'user_id': Room.user_id,
+    'creator': User.username,
+    'total_members': Room.total_members,
+}
+
+# never email or password
+USER_FIELDS = {
+    'id': User.id,
+    'username': User.username,
+    'name': User.name,
+    'image_file': User.image_file,
+    'room_count': User.room_count,
+}
+
+# JSON Lines: one object per line
+JSONL = 'application/x-ndjson'
+
+
+def dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_default)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat() + 'Z'
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def requested_fields(available, required=()):
+    """
+    (fields to output, columns to select) for ?fields=, all fields by default.
+    `required` columns (e.g. the pagination keys) are always selected and
+    come first, output or not.
+    """
+
+    raw = request.args.get('fields')
+    fields = list(available) if not raw else [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown or not fields:
+        abort(400, description=f"unknown field(s): {', '.join(unknown)}; available: {', '.join(available)}")
+    columns = list(required) + [available[name].label(f'f_{name}') for name in fields]
+    return fields, columns
+
+
+def serializer(fields, offset):
+    """
+    Turns a row selected with requested_fields() into a dict, skipping the
+    `offset` required columns in front.
+    """
+
+    positions = list(enumerate(fields, offset))
+    return lambda row: {name: row[position] for position, name in positions}
+
+
+def page_size():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+
+
+def requested_ids():
+    """
+    The ?ids=1,2,3 batch, None without it.
+    """
+
+    raw = request.args.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw.split(',') if value.strip()))
+    except ValueError:
+        abort(400, description='ids must be comma separated integers')
+    if len(ids) > current_app.config['API_MAX_IDS']:
+        abort(400, description=f"at most {current_app.config['API_MAX_IDS']} ids per request")
+    return ids
+
+
+def wants_jsonl():
+    return request.args.get('format') == 'jsonl' or request.accept_mimetypes.best == JSONL
@@ -0,0 +1,166 @@
+"""
+Static asset pipeline
+
+`flask build-assets` copies every file under static/ (except user uploads)
+to static/dist/ with its content hash in the name, e.g.
+
+    css/main.css -> dist/css/main.3f9a1c2b7d4e.css
+
+along with .gz (and, if the brotli package is installed, .br) copies of
+text assets, and writes dist/manifest.json mapping the original names to the
+hashed ones. Nothing in the templates changes: url_for('static',
+filename='css/main.css') is rewritten to the hashed name when the manifest
+has it, and left alone (plain, revalidated files) when it doesn't, e.g. in
+development before the first build.
+
+A hashed file never changes, so it is served with a one year `immutable`
+Cache-Control and the browser never asks again; a new build gives a new
+name. The static view picks the precompressed variant the client accepts.
+A front-end server can do the same straight from disk (nginx gzip_static).
+
+COMPRESS_HTML additionally gzips HTML responses on the fly.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import current_app, request, send_from_directory
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+# uploads are served by users.avatar, not built
+SKIP_DIRS = {DIST, 'profile_pics'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.txt', '.json', '.html', '.map', '.ico'}
+# preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _hashed_name(relative, data):
+    stem, ext = os.path.splitext(relative)
+    return f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def build(app):
+    """
+    Builds static/dist/ and its manifest, returns the manifest.
+    Old builds are left in place so pages cached by clients keep working;
+    delete static/dist/ to clean up.
+    """
+
+    static = app.static_folder
+    dist = os.path.join(static, DIST)
+    brotli = _brotli()
+    manifest = {}
+    for root, dirs, files in os.walk(static):
+        if root == static:
+            dirs[:] = [name for name in dirs if name not in SKIP_DIRS]
+        for name in files:
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(relative, data)
+            manifest[relative] = f'{DIST}/{hashed}'
+
+            target = os.path.join(dist, hashed)
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data, quality=11))
+
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(app.static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _accepts(encoding):
+    return encoding in request.accept_encodings
+
+
+def serve_static(filename):
+    """
+    Replaces Flask's static view. Fingerprinted files get far-future
+    caching and a precompressed variant if the client accepts one.
+    """
+
+    app = current_app._get_current_object()
+    if filename not in app.extensions['assets']:
+        return app.send_static_file(filename)
+
+    mimetype = None
+    encoding = None
+    served = filename
+    for name, suffix in ENCODINGS:
+        if _accepts(name) and os.path.exists(os.path.join(app.static_folder, filename + suffix)):
+            mimetype = mimetypes.guess_type(filename)[0]
+            encoding, served = name, filename + suffix
+            break
+
+    response = send_from_directory(app.static_folder, served, mimetype=mimetype,
+                                   max_age=app.config['ASSET_MAX_AGE'])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def compress_html(response):
+    """
+    after_request: gzip HTML pages for clients that accept it.
+    """
+
+    if (response.mimetype != 'text/html' or response.status_code != 200
+            or response.direct_passthrough or 'Content-Encoding' in response.headers
+            or not _accepts('gzip')):
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=current_app.config['COMPRESS_LEVEL']))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    manifest = load_manifest(app)
+    # the hashed names, served by serve_static()
+    app.extensions['assets'] = set(manifest.values())
+
+    def fingerprint(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    if manifest:
+        app.url_defaults(fingerprint)
+        app.view_functions['static'] = serve_static
+    if app.config['COMPRESS_HTML']:
+        app.after_request(compress_html)
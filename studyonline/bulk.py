@@ -0,0 +1,293 @@
+"""
+Bulk import and export of users and rooms as CSV or JSONL.
+
+Used by the `flask data` commands (studyonline/commands.py). Files are
+streamed: rows are read, converted and inserted one chunk at a time with a
+single executemany per chunk, and exports are read back with yield_per, so
+memory stays flat however large the file is. Each chunk is committed on its
+own; a failing chunk is rolled back and stops the import, leaving the
+chunks before it in place.
+"""
+
+import csv
+import json
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy.exc import SQLAlchemyError
+from studyonline import db
+from studyonline.models import Room, User
+from studyonline.rooms import topics
+from studyonline import counters
+from studyonline.users.cache import user_cache
+
+
+class BulkError(Exception):
+    pass
+
+
+USER_FIELDS = ('id', 'name', 'username', 'email', 'image_file')
+ROOM_FIELDS = ('id', 'topic', 'description', 'date_created', 'user_id')
+
+
+def detect_format(filename, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Yields (line number, dict) pairs. CSV values are strings, empty ones None.
+    """
+
+    if fmt == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as error:
+                    raise BulkError(f'line {number}: {error}')
+                if not isinstance(row, dict):
+                    raise BulkError(f'line {number}: expected a JSON object, got {type(row).__name__}')
+                yield number, row
+    else:
+        # line 1 is the header
+        for number, row in enumerate(csv.DictReader(stream), 2):
+            yield number, {key: (value if value != '' else None) for key, value in row.items()}
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _required(number, row, key):
+    value = row.get(key)
+    if value is None:
+        raise BulkError(f'line {number}: missing {key}')
+    return value
+
+
+def _text(number, row, key, required=False):
+    value = _required(number, row, key) if required else row.get(key)
+    if value is not None and not isinstance(value, str):
+        raise BulkError(f'line {number}: {key} must be a string, not {value!r}')
+    return value
+
+
+def _int(number, key, value):
+    # bool is an int to Python, but true is no id; nor is 1.5
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise BulkError(f'line {number}: bad {key} {value!r}')
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        raise BulkError(f'line {number}: bad {key} {value!r}')
+
+
+def _optional_id(number, row):
+    value = row.get('id')
+    return _int(number, 'id', value) if value is not None else None
+
+
+def _parse_date(number, value):
+    if value is None:
+        return datetime.utcnow()
+    if not isinstance(value, str):
+        raise BulkError(f'line {number}: bad date_created {value!r}')
+    try:
+        return datetime.fromisoformat(value.rstrip('Z'))
+    except ValueError:
+        raise BulkError(f'line {number}: bad date_created {value!r}')
+
+
+def user_rows(chunk, prehashed):
+    from studyonline.users.passwords import hash_passwords
+
+    rows = []
+    for number, row in chunk:
+        password = _text(number, row, 'password', required=True)
+        if prehashed and not password.startswith('$2'):
+            raise BulkError(f'line {number}: --prehashed given but password is not a bcrypt hash')
+        rows.append({
+            'id': _optional_id(number, row),
+            'name': _required(number, row, 'name'),
+            'username': _required(number, row, 'username'),
+            'email': _required(number, row, 'email'),
+            'password': password,
+            'image_file': row.get('image_file') or 'default.jpg',
+        })
+    if not prehashed:
+        for row, pw_hash in zip(rows, hash_passwords([row['password'] for row in rows])):
+            row['password'] = pw_hash
+    return rows
+
+
+def room_rows(chunk):
+    """
+    A room's creator is given as user_id or, for files from another
+    database, as the creator's username, resolved with one query per chunk.
+    Topics are resolved (and created) per chunk as well, and the topic and
+    creator room counts moved in the chunk's transaction.
+    """
+
+    usernames = {row['creator'] for _, row in chunk
+                 if row.get('user_id') is None and isinstance(row.get('creator'), str)}
+    user_ids = {}
+    if usernames:
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)))
+
+    rows = []
+    for number, row in chunk:
+        user_id = row.get('user_id')
+        if user_id is None:
+            creator = _required(number, row, 'creator')
+            if not isinstance(creator, str) or creator not in user_ids:
+                raise BulkError(f'line {number}: no user {creator!r}')
+            user_id = user_ids[creator]
+        rows.append({
+            'id': _optional_id(number, row),
+            'topic': _text(number, row, 'topic'),
+            'description': _text(number, row, 'description'),
+            'date_created': _parse_date(number, row.get('date_created')),
+            'user_id': _int(number, 'user_id', user_id),
+            'total_members': 0,
+        })
+    ids = topics.topic_ids(filter(None, (topics.normalize(row['topic']) for row in rows)))
+    for row in rows:
+        row['topic_id'] = ids.get(topics.normalize(row['topic']))
+    topics.add_rooms(row['topic_id'] for row in rows)
+    counters.add_user_rooms(row['user_id'] for row in rows)
+    return rows
+
+
+def _insert(table, rows):
+    """
+    One executemany per shape: rows with an explicit id and rows without
+    (a NULL id is not "pick one" on every database).
+    """
+
+    with_id = [row for row in rows if row['id'] is not None]
+    without_id = [{key: value for key, value in row.items() if key != 'id'} for row in rows if row['id'] is None]
+    for batch in (with_id, without_id):
+        if batch:
+            db.session.execute(table.insert(), batch)
+    return bool(with_id)
+
+
+def _sync_sequence(table):
+    """
+    Postgres doesn't move a serial column's sequence past explicitly inserted
+    ids, so the next row inserted by the app would collide without this.
+    """
+
+    if db.engine.dialect.name != 'postgresql':
+        return
+    name = db.engine.dialect.identifier_preparer.quote(table.name)
+    db.session.execute(db.text(
+        f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), "
+        f"(SELECT COALESCE(MAX(id), 1) FROM {name}))"
+    ))
+    db.session.commit()
+
+
+class Progress:
+    """
+    Prints rows done and rows per second after each chunk through `echo`.
+    """
+
+    def __init__(self, label, echo):
+        self.label = label
+        self.echo = echo
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0.0
+
+    def add(self, rows):
+        self.rows += rows
+        self.echo(f'{self.label}: {self.rows} rows, {self.rate:.0f} rows/s')
+
+
+def import_rows(kind, stream, fmt, chunk_size=1000, prehashed=False, echo=print):
+    """
+    Inserts every row of `stream` as a User ('users') or Room ('rooms').
+    Returns the Progress, which holds the row count and rate.
+    """
+
+    table = User.__table__ if kind == 'users' else Room.__table__
+    progress = Progress(f'imported {kind}', echo)
+    explicit_ids = False
+    for chunk in chunks(read_rows(stream, fmt), chunk_size):
+        try:
+            rows = user_rows(chunk, prehashed) if kind == 'users' else room_rows(chunk)
+            explicit_ids |= _insert(table, rows)
+            db.session.commit()
+            if kind == 'rooms':
+                for user_id in {row['user_id'] for row in rows}:
+                    user_cache.invalidate(user_id)
+        except BulkError:
+            db.session.rollback()
+            raise
+        except SQLAlchemyError as error:
+            db.session.rollback()
+            raise BulkError(f'lines {chunk[0][0]}-{chunk[-1][0]}: {getattr(error, "orig", None) or error}')
+        progress.add(len(rows))
+    if explicit_ids:
+        _sync_sequence(table)
+    return progress
+
+
+def _user_export(include_passwords):
+    columns = [getattr(User, field) for field in USER_FIELDS]
+    fields = list(USER_FIELDS)
+    if include_passwords:
+        columns.append(User.password)
+        fields.append('password')
+    return fields, db.session.query(*columns).order_by(User.id)
+
+
+def _room_export():
+    columns = [getattr(Room, field) for field in ROOM_FIELDS] + [User.username]
+    query = db.session.query(*columns).join(User, User.id == Room.user_id).order_by(Room.id)
+    return list(ROOM_FIELDS) + ['creator'], query
+
+
+def export_rows(kind, stream, fmt, chunk_size=1000, include_passwords=False, echo=print):
+    """
+    Writes every User or Room to `stream`. Rooms carry their creator's
+    username as well as user_id so the file can be imported elsewhere.
+    """
+
+    if kind == 'users':
+        fields, query = _user_export(include_passwords)
+    else:
+        fields, query = _room_export()
+
+    progress = Progress(f'exported {kind}', echo)
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(fields)
+    written = 0
+    for row in query.yield_per(chunk_size):
+        values = [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        if writer is not None:
+            writer.writerow(values)
+        else:
+            stream.write(json.dumps(dict(zip(fields, values))) + '\n')
+        written += 1
+        if written == chunk_size:
+            progress.add(written)
+            written = 0
+    if written:
+        progress.add(written)
+    return progress
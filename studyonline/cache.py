@@ -0,0 +1,282 @@
+"""
+Small caching building blocks shared by the app.
+
+TTLCache     in-process LRU with per-entry expiry, thread safe
+SharedCache  the same get/set/delete interface on top of a shared store
+             (anything with redis-py's get/set(ex=)/delete, e.g. redis.Redis)
+LocalStore   an in-process stand-in for that shared store, used by tests and
+             single-process deployments
+FragmentCache  rendered HTML with stale-while-revalidate, see its docstring
+
+The caches keep hit/miss counters in `stats`.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+class TTLCache:
+    """
+    Least-recently-used cache of at most `maxsize` entries, each valid for
+    `ttl` seconds.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalStore:
+    """
+    In-process stand-in for a shared key/value store. Implements the subset of
+    the redis-py client API the app uses, so it can be swapped for a real
+    client without touching callers.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ex=None):
+        expires = time.monotonic() + ex if ex else None
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        with self._lock:
+            self._data[key] = (value, expires)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            value = int(entry[0]) + amount if entry else amount
+            self._data[key] = (str(value).encode('utf-8'), entry[1] if entry else None)
+            return value
+
+    def expire(self, key, seconds):
+        with self._lock:
+            entry = self._alive(key, time.monotonic())
+            if entry is None:
+                return False
+            self._data[key] = (entry[0], time.monotonic() + seconds)
+            return True
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedCache:
+    """
+    JSON values in a shared store under `prefix`, with the TTLCache interface.
+    """
+
+    def __init__(self, client, prefix, ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    def _key(self, key):
+        return f'{self.prefix}:{key}'
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self._key(key), json.dumps(value), ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.client.delete(self._key(key))
+
+
+def make_store(app):
+    """
+    The shared store configured by CACHE_STORE: 'local' or a redis:// url.
+    """
+
+    url = app.config['CACHE_STORE']
+    if url == 'local':
+        return LocalStore()
+    import redis
+    return redis.Redis.from_url(url)
+
+
+class FragmentCache:
+    """
+    Cache for rendered page fragments with stale-while-revalidate.
+
+    A fresh entry (younger than `ttl` and rendered at the current generation)
+    is returned as is. A stale entry, up to `stale_ttl` old, is still returned
+    to everyone except the one request that wins the key's refresh lock and
+    re-renders it, so an invalidation never makes every worker render at
+    once. With no usable entry at all, one request renders while the others
+    for the same key wait for its result instead of rendering too.
+
+    invalidate() bumps the generation. With a shared `store` (make_store())
+    the generation lives there under `generation_key`, so a write handled by
+    one worker process marks the entries of every process stale; each
+    lookup costs one GET of it. Without a store it is a per-process counter.
+    """
+
+    def __init__(self, maxsize=512, ttl=30, stale_ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.store = None
+        self.generation_key = 'fragments:generation'
+
+    def _key_lock(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = threading.Lock()
+            return lock
+
+    def generation(self):
+        if self.store is None:
+            return self._generation
+        raw = self.store.get(self.generation_key)
+        return int(raw) if raw else 0
+
+    def _lookup(self, key, now, generation):
+        """
+        Returns (value, fresh) for a usable entry, or (None, False).
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            value, created, rendered_at = entry
+            if now - created > self.stale_ttl:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return value, (now - created <= self.ttl and rendered_at == generation)
+
+    def _store(self, key, value, created, generation):
+        with self._lock:
+            self._entries[key] = (value, created, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                old_key, _ = self._entries.popitem(last=False)
+                self._locks.pop(old_key, None)
+
+    def get_or_render(self, key, render):
+        now = time.monotonic()
+        # read before rendering, an invalidate() during the render leaves
+        # the new entry stale
+        generation = self.generation()
+        value, fresh = self._lookup(key, now, generation)
+        if fresh:
+            self.stats.hits += 1
+            return value
+
+        lock = self._key_lock(key)
+        if value is not None:
+            # stale: serve it unless we are the one refreshing it
+            if not lock.acquire(blocking=False):
+                self.stats.hits += 1
+                return value
+        else:
+            lock.acquire()
+        try:
+            value, fresh = self._lookup(key, time.monotonic(), generation)
+            if fresh:
+                self.stats.hits += 1
+                return value
+            self.stats.misses += 1
+            started = time.monotonic()
+            value = render()
+            self._store(key, value, started, generation)
+            return value
+        finally:
+            lock.release()
+
+    def invalidate(self):
+        """
+        Marks every entry stale, in every process sharing the store. They
+        keep being served until re-rendered.
+        """
+
+        if self.store is not None:
+            self.store.incr(self.generation_key)
+            return
+        with self._lock:
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._locks.clear()
@@ -0,0 +1,253 @@
+"""
+flask CLI commands
+
+Registered on the app in create_app(), run them with e.g.
+
+    flask prune-avatars --dry-run
+    flask data import users users.csv --prehashed
+    flask data export rooms rooms.jsonl
+    flask build-assets
+    flask compile-templates
+    flask repair-counters --dry-run
+    flask outbox drain
+    flask rebuild-timelines --user alice
+"""
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+@click.command('prune-avatars')
+@click.option('--grace', default=3600, show_default=True,
+              help='Skip files modified within this many seconds.')
+@click.option('--dry-run', is_flag=True, help='Only list the files that would be removed.')
+@with_appcontext
+def prune_avatars(grace, dry_run):
+    """
+    Remove profile pictures no user references.
+    """
+
+    from studyonline.users.utils import prune_pictures
+
+    removed = prune_pictures(current_app._get_current_object(), grace=grace, dry_run=dry_run)
+    for name in removed:
+        click.echo(name)
+    verb = 'would remove' if dry_run else 'removed'
+    click.echo(f'{verb} {len(removed)} file(s)')
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets():
+    """
+    Fingerprint and precompress static files into static/dist/.
+    """
+
+    from studyonline.assets import build
+
+    manifest = build(current_app._get_current_object())
+    for name, hashed in sorted(manifest.items()):
+        click.echo(f'{name} -> {hashed}')
+    click.echo(f'built {len(manifest)} file(s), restart the app to pick up the manifest')
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates():
+    """
+    Compile every template into the bytecode cache.
+    """
+
+    from studyonline.template_cache import cache_dir, compile_all
+
+    app = current_app._get_current_object()
+    if not app.config['TEMPLATE_BYTECODE_CACHE']:
+        raise click.ClickException('TEMPLATE_BYTECODE_CACHE is off, nothing would be kept')
+    names, seconds = compile_all(app)
+    click.echo(f'compiled {len(names)} template(s) into {cache_dir(app)} in {seconds:.2f}s')
+
+
+@click.command('repair-counters')
+@click.option('--dry-run', is_flag=True, help='Only report the counters that are wrong.')
+@with_appcontext
+def repair_counters(dry_run):
+    """
+    Recount the denormalized room and member counters.
+    """
+
+    from studyonline.counters import repair
+    from studyonline.main.utils import rooms_changed
+    from studyonline.users.cache import user_cache
+
+    fixed, user_ids = repair(dry_run=dry_run)
+    verb = 'would fix' if dry_run else 'fixed'
+    for name, rows in fixed.items():
+        click.echo(f'{name}: {verb} {rows} row(s)')
+    if not dry_run and any(fixed.values()):
+        rooms_changed()
+        for user_id in user_ids:
+            user_cache.invalidate(user_id)
+
+
+@click.command('rebuild-timelines')
+@click.option('--user', 'username', help='Only this user (default: everyone).')
+@click.option('--chunk-size', default=500, show_default=True, help='Users per commit.')
+@with_appcontext
+def rebuild_timelines(username, chunk_size):
+    """
+    Recompute home timelines from the follows, e.g. after a bulk import.
+    """
+
+    from studyonline import db
+    from studyonline.models import User
+    from studyonline.timeline import rebuild
+
+    query = db.session.query(User.id).order_by(User.id)
+    if username:
+        query = query.filter(User.username == username)
+    user_ids = [pk for pk, in query]
+    if username and not user_ids:
+        raise click.ClickException(f'no user {username}')
+    for offset in range(0, len(user_ids), chunk_size):
+        for user_id in user_ids[offset:offset + chunk_size]:
+            rebuild(user_id)
+        db.session.commit()
+    click.echo(f'rebuilt {len(user_ids)} timeline(s)')
+
+
+@click.group('outbox')
+def outbox():
+    """
+    The outgoing email queue (see studyonline/mail.py).
+    """
+
+
+@outbox.command('drain')
+@click.option('--once', is_flag=True, help='Send what is due and exit instead of polling.')
+@with_appcontext
+def drain_outbox(once):
+    """
+    Send queued emails, for running with OUTBOX_WORKER=off.
+    """
+
+    import time
+    from studyonline.mail import Mailer, drain
+
+    app = current_app._get_current_object()
+    mailer = Mailer(app.config)
+    try:
+        while True:
+            sent, retried, failed = drain(app, mailer)
+            if sent or retried or failed:
+                click.echo(f'sent {sent}, retrying {retried}, failed {failed}')
+            if once:
+                break
+            time.sleep(app.config['OUTBOX_POLL_SECONDS'])
+            mailer.close_if_idle()
+    finally:
+        mailer.close()
+
+
+@outbox.command('status')
+@with_appcontext
+def outbox_status():
+    """
+    Count queued, sent and failed emails.
+    """
+
+    from studyonline import db
+    from studyonline.models import OutboxMessage
+
+    counts = dict(db.session.query(OutboxMessage.status, db.func.count()).group_by(OutboxMessage.status))
+    for status in ('pending', 'sent', 'failed'):
+        click.echo(f'{status}: {counts.get(status, 0)}')
+
+
+@outbox.command('prune')
+@click.option('--days', default=30, show_default=True, help='Keep sent emails younger than this.')
+@with_appcontext
+def prune_outbox(days):
+    """
+    Delete sent emails older than --days.
+    """
+
+    from datetime import datetime, timedelta
+    from studyonline import db
+    from studyonline.models import OutboxMessage
+
+    removed = OutboxMessage.query.filter(
+        OutboxMessage.status == 'sent',
+        OutboxMessage.sent_at < datetime.utcnow() - timedelta(days=days),
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    click.echo(f'removed {removed} email(s)')
+
+
+@click.group('data')
+def data():
+    """
+    Bulk import and export of users and rooms (CSV or JSONL).
+    """
+
+
+KINDS = click.Choice(['users', 'rooms'])
+FORMATS = click.Choice(['csv', 'jsonl'])
+
+
+@data.command('import')
+@click.argument('kind', type=KINDS)
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=FORMATS, help='Default: from the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per INSERT batch and commit.')
+@click.option('--prehashed', is_flag=True,
+              help='The password column already holds bcrypt hashes (users only).')
+@with_appcontext
+def import_data(kind, source, fmt, chunk_size, prehashed):
+    """
+    Stream users or rooms from SOURCE ('-' for stdin) into the database.
+
+    Users need name, username, email and password columns. Rooms need a
+    user_id or a creator (username) column. An id column keeps the ids.
+    """
+
+    from studyonline.bulk import BulkError, detect_format, import_rows
+
+    echo = lambda line: click.echo(line, err=True)
+    try:
+        progress = import_rows(kind, source, detect_format(source.name, fmt), chunk_size=chunk_size,
+                               prehashed=prehashed, echo=echo)
+    except BulkError as error:
+        raise click.ClickException(str(error))
+    echo(f'done: {progress.rows} {kind} at {progress.rate:.0f} rows/s')
+
+
+@data.command('export')
+@click.argument('kind', type=KINDS)
+@click.argument('target', type=click.File('w', encoding='utf-8', lazy=True))
+@click.option('--format', 'fmt', type=FORMATS, help='Default: from the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows fetched per round trip.')
+@click.option('--include-passwords', is_flag=True,
+              help='Export password hashes, needed to import the users elsewhere (with --prehashed).')
+@with_appcontext
+def export_data(kind, target, fmt, chunk_size, include_passwords):
+    """
+    Stream every user or room to TARGET ('-' for stdout).
+    """
+
+    from studyonline.bulk import detect_format, export_rows
+
+    echo = lambda line: click.echo(line, err=True)
+    progress = export_rows(kind, target, detect_format(target.name, fmt), chunk_size=chunk_size,
+                           include_passwords=include_passwords, echo=echo)
+    echo(f'done: {progress.rows} {kind} at {progress.rate:.0f} rows/s')
+
+
+def register_commands(app):
+    app.cli.add_command(prune_avatars)
+    app.cli.add_command(data)
+    app.cli.add_command(build_assets)
+    app.cli.add_command(compile_templates)
+    app.cli.add_command(repair_counters)
+    app.cli.add_command(outbox)
+    app.cli.add_command(rebuild_timelines)
@@ -3,4 +3,182 @@ import os
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # connection pool of each server database engine (SQLite files have none)
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT', 10))
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = True
+    # abort any statement running longer than this, 0 for no limit
+    DATABASE_STATEMENT_TIMEOUT_MS = int(os.environ.get('DATABASE_STATEMENT_TIMEOUT_MS', 0))
+    # read replicas for @read_only views, comma separated
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('SQLALCHEMY_REPLICA_URIS', '').split(',') if uri]
+    # after a write, the client reads from the primary for this long
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+    # only load Flask-Migrate (alembic) for the flask command line, see init_migrate()
+    LAZY_EXTENSIONS = os.environ.get('LAZY_EXTENSIONS', '1') == '1'
+    # seconds a cached "N Available Room(s)" total may be reused
+    ROOM_COUNT_CACHE_TTL = int(os.environ.get('ROOM_COUNT_CACHE_TTL', 60))
+    # topics in the home page sidebar
+    TOP_TOPICS = 10
+    # milliseconds before the browser fades out a flash message, 0 keeps it
+    FLASH_DISMISS_MS = int(os.environ.get('FLASH_DISMISS_MS', 4000))
+
+    # bcrypt cost (log2 rounds); hashes at another cost are upgraded on login
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    # threads hashing passwords at once, 0 hashes on the request thread
+    BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+    # profile pictures: uploads are processed by a bounded background pool
+    MAX_CONTENT_LENGTH = 8 * 1024 * 1024
+    AVATAR_SIZES = (120, 40)
+    IMAGE_PIPELINE_ASYNC = True
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    IMAGE_QUEUE_SIZE = int(os.environ.get('IMAGE_QUEUE_SIZE', 16))
+    AVATAR_MAX_AGE = 365 * 24 * 3600
+    AVATAR_LEGACY_MAX_AGE = 3600
+
+    # compiled templates are kept on disk and shared by all processes (template_cache.py)
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', '1') == '1'
+    # default <instance folder>/jinja_cache
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+    # re-read changed templates on every render: None means only in debug mode
+    TEMPLATES_AUTO_RELOAD = None
+
+    # static files built by `flask build-assets` (assets.py) are cached this long
+    ASSET_MAX_AGE = 365 * 24 * 3600
+    # gzip HTML responses on the fly (leave off behind a compressing proxy)
+    COMPRESS_HTML = os.environ.get('COMPRESS_HTML', '0') == '1'
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+
+    # shared key/value store: 'local' (in-process stand-in) or a redis:// url
+    CACHE_STORE = os.environ.get('CACHE_STORE', 'local')
+    # user_loader cache: 'memory' (per process) or 'shared' (CACHE_STORE)
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'memory')
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+    USER_CACHE_SIZE = 4096
+
+    # rendered home feed fragments, per page and viewer; a room write marks them
+    # stale in every worker process that shares CACHE_STORE
+    FEED_CACHE_TTL = int(os.environ.get('FEED_CACHE_TTL', 30))
+    FEED_CACHE_STALE_TTL = int(os.environ.get('FEED_CACHE_STALE_TTL', 300))
+    FEED_CACHE_SIZE = 512
+
+    # home timelines (timeline.py): rooms kept per user
+    TIMELINE_SIZE = int(os.environ.get('TIMELINE_SIZE', 500))
+    # rooms of creators with more followers are merged in at read time instead of fanned out
+    TIMELINE_FANOUT_LIMIT = int(os.environ.get('TIMELINE_FANOUT_LIMIT', 1000))
+    # newest rooms of a user copied to a new follower's timeline
+    TIMELINE_BACKFILL = 20
+    # seconds the list of those creators is cached
+    TIMELINE_CELEBRITY_TTL = int(os.environ.get('TIMELINE_CELEBRITY_TTL', 60))
+
+    # POSTs over these limits get 429 before any query or password check (ratelimit.py)
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') == '1'
+    # counters: 'memory' (per process) or 'shared' (CACHE_STORE)
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'memory')
+    # endpoint: ((scope, requests, seconds), ...), scope is 'ip', 'username' or 'route'
+    RATELIMITS = {
+        'users.login': (('ip', 20, 60), ('username', 5, 60)),
+        'users.register': (('ip', 5, 600),),
+        'rooms.search_email': (('ip', 20, 60),),
+        'users.reset_request': (('ip', 5, 600),),
+        'users.reset_token': (('ip', 10, 600),),
+    }
+
+    # outgoing mail is queued in the outbox table and sent in the background (mail.py)
+    MAIL_SERVER = os.environ.get('MAIL_SERVER', 'localhost')
+    MAIL_PORT = int(os.environ.get('MAIL_PORT', 25))
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', '0') == '1'
+    MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
+    MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'StudyOnline <noreply@studyonline.local>')
+    MAIL_TIMEOUT = 10
+    # the pooled SMTP connection is closed after this many seconds without mail
+    MAIL_IDLE_TIMEOUT = 60
+    # 'thread' sends from a background thread in every app process, 'off' leaves it to `flask outbox drain`
+    OUTBOX_WORKER = os.environ.get('OUTBOX_WORKER', 'thread')
+    # messages claimed and sent per connection round
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+    # how often an idle worker looks for due retries
+    OUTBOX_POLL_SECONDS = 30
+    # claimed messages of a worker that died are retried after this long
+    OUTBOX_LEASE_SECONDS = 300
+    # retries back off OUTBOX_RETRY_BASE * 2^(attempt - 1) seconds, up to OUTBOX_RETRY_MAX
+    OUTBOX_RETRY_BASE = 30
+    OUTBOX_RETRY_MAX = 3600
+    OUTBOX_MAX_ATTEMPTS = 8
+    # password reset links expire after this many seconds
+    PASSWORD_RESET_MAX_AGE = int(os.environ.get('PASSWORD_RESET_MAX_AGE', 1800))
+
+    # JSON API (/api/v1)
+    API_PAGE_SIZE = 20
+    API_MAX_PAGE_SIZE = 100
+    API_MAX_IDS = 100
+    # rows per query when streaming JSON Lines
+    API_STREAM_BATCH = 1000
+
+    # realtime rooms (asgi.py): pub/sub broker, 'memory' or a redis:// url
+    REALTIME_BROKER = os.environ.get('REALTIME_BROKER', 'memory')
+    # messages buffered per connection before a slow client is dropped
+    REALTIME_QUEUE_SIZE = 64
+    # threads doing the database work (auth, saving messages) for all sockets
+    REALTIME_DB_WORKERS = int(os.environ.get('REALTIME_DB_WORKERS', 4))
+    REALTIME_MESSAGE_MAX = 500
+    REALTIME_HISTORY_PAGE = 50
+
+    # per-request timings, SQL and template stats at METRICS_PATH (instrumentation.py)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '0') == '1'
+    INSTRUMENTATION_SERVER_TIMING = True
+    METRICS_PATH = '/metrics'
+    # if set, the metrics endpoints want "Authorization: Bearer <token>"; if not,
+    # they only answer requests from loopback
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+    SLOW_QUERY_SAMPLES = 50
+    # fraction of requests run under cProfile, dumped to PROFILE_DIR/<endpoint>/
+    # (default <instance folder>/profiles)
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    # endpoints to profile, empty for all
+    PROFILE_ENDPOINTS = ()
+
+    # fail a request that runs more SQL queries than its endpoint budget
+    QUERY_BUDGET_ENABLED = False
+    QUERY_BUDGET_DEFAULT = 10
+    QUERY_BUDGETS = {
+        'main.home': 5,
+        'main.timeline': 6,
+        'users.user_rooms': 3,
+        # the user lookup, follow row, two counters and the timeline backfill
+        'users.follow': 10,
+        'users.unfollow': 5,
+        'rooms.search_email': 3,
+        'rooms.room': 4,
+        'rooms.search': 3,
+        'rooms.topic': 3,
+        'api.rooms': 1,
+        'api.room': 1,
+        'api.users': 1,
+        'api.user': 1,
+        'api.user_rooms': 2,
+    }
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'testing'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+    BCRYPT_LOG_ROUNDS = 4
+    QUERY_BUDGET_ENABLED = True
+    IMAGE_PIPELINE_ASYNC = False
+    USER_CACHE_BACKEND = 'shared'
+    RATELIMIT_ENABLED = False
+    TEMPLATE_BYTECODE_CACHE = False
+    # nothing is sent until mail.drain() runs, against a local debugging
+    # server (python -m benchmarks.smtp_sink); benchmarks.check_password_reset
+    # runs the reset flow against it
+    OUTBOX_WORKER = 'off'
+    MAIL_PORT = 8025
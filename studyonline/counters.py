@@ -0,0 +1,85 @@
+"""
+Denormalized counters
+
+Counts that pages show are stored next to the rows they describe instead of
+being recounted on every request:
+
+Room.total_members  rooms joined, rooms/membership.py
+Topic.room_count    rooms per topic, rooms/topics.py
+User.room_count     rooms a user created, bumped here by create_room,
+                    delete_room and bulk imports
+User.follower_count,
+User.following_count  follows, users/follows.py
+
+Each one is moved with an atomic UPDATE ... SET n = n + delta in the same
+transaction as the write it counts. repair() (`flask repair-counters`)
+recounts all of them from the source tables, for after a manual fix in the
+database or an import that bypassed the app.
+"""
+
+from collections import Counter
+from studyonline import db
+from studyonline.models import Room, Topic, User, follow, room_membership
+
+
+def bump_user_rooms(user_id, delta):
+    db.session.execute(
+        User.__table__.update()
+        .where(User.id == user_id)
+        .values(room_count=User.room_count + delta)
+    )
+
+
+def add_user_rooms(user_ids):
+    """
+    Counts rooms inserted in bulk, one UPDATE per distinct creator.
+    Returns the ids of the users changed, whose user_cache entries are stale.
+    """
+
+    counts = Counter(user_ids)
+    for user_id, count in counts.items():
+        bump_user_rooms(user_id, count)
+    return list(counts)
+
+
+def _recounts():
+    """
+    (name, table, counter column, correct value) of every counter.
+    """
+
+    return [
+        ('user.room_count', User.__table__, User.room_count,
+         db.select(db.func.count(Room.id)).where(Room.user_id == User.id).scalar_subquery()),
+        ('topic.room_count', Topic.__table__, Topic.room_count,
+         db.select(db.func.count(Room.id)).where(Room.topic_id == Topic.id).scalar_subquery()),
+        ('room.total_members', Room.__table__, Room.total_members,
+         db.select(db.func.count()).where(room_membership.c.room_id == Room.id).scalar_subquery()),
+        ('user.follower_count', User.__table__, User.follower_count,
+         db.select(db.func.count()).where(follow.c.followed_id == User.id).scalar_subquery()),
+        ('user.following_count', User.__table__, User.following_count,
+         db.select(db.func.count()).where(follow.c.follower_id == User.id).scalar_subquery()),
+    ]
+
+
+def repair(dry_run=False):
+    """
+    Sets every counter that disagrees with a recount. Returns
+    ({counter: rows that were (or, with dry_run, would be) fixed},
+    ids of the users changed, whose user_cache entries are stale).
+    Each counter is one set-based UPDATE, using the indexes on the
+    foreign keys for the recount.
+    """
+
+    fixed = {}
+    user_ids = set()
+    for name, table, column, correct in _recounts():
+        wrong = db.func.coalesce(column, -1) != correct
+        if dry_run:
+            fixed[name] = db.session.query(db.func.count()).select_from(table).filter(wrong).scalar()
+            continue
+        if table is User.__table__:
+            user_ids.update(pk for pk, in db.session.query(User.id).filter(wrong))
+        fixed[name] = db.session.execute(table.update().where(wrong).values({column.key: correct})).rowcount
+    if not dry_run:
+        db.session.commit()
+    return fixed, sorted(user_ids)
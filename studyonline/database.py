@@ -0,0 +1,182 @@
+"""
+Database engine setup: pooling, statement timeouts and read replicas.
+
+RoutingSQLAlchemy is the Flask-SQLAlchemy extension the app uses as `db`.
+
+Pooling: every server database engine (primary and replicas) gets the
+DATABASE_POOL_* settings. SQLite keeps Flask-SQLAlchemy's defaults, as a
+file database has no pool to size.
+
+Statement timeouts: DATABASE_STATEMENT_TIMEOUT_MS is set on each new
+connection (statement_timeout on Postgres, MAX_EXECUTION_TIME for MySQL
+SELECTs). SQLite has no such setting, so a progress handler interrupts a
+statement that runs past it.
+
+Read replicas: SQLALCHEMY_REPLICA_URIS become binds replica0, replica1, ...
+Views wrapped in @read_only send their reads to one replica (picked per
+request), everything else uses the primary. Writes always go to the primary,
+and once a request commits a write, that request and the same client's
+requests for the next REPLICA_STICKY_SECONDS read from the primary too, so
+users see their own changes despite replication lag.
+
+Two SQLite files can stand in for a primary and a replica in tests: point
+SQLALCHEMY_DATABASE_URI and SQLALCHEMY_REPLICA_URIS at them and copy the
+primary's file over the replica's to "replicate". create_all() only builds
+tables on the primary. python -m benchmarks.check_replicas does exactly
+that and checks the routing.
+"""
+
+import random
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_PREFIX = 'replica'
+# Flask session key holding the time until which this client reads from the primary
+STICKY_KEY = '_db_primary_until'
+
+
+def replica_binds(app):
+    return [key for key in (app.config.get('SQLALCHEMY_BINDS') or {}) if key.startswith(REPLICA_PREFIX)]
+
+
+def read_only(view):
+    """
+    Marks a view as only reading, so its queries may go to a replica.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _reads_from_primary():
+    if not has_request_context() or not g.get('db_read_only') or g.get('db_wrote'):
+        return True
+    return session.get(STICKY_KEY, 0) > time.time()
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self.info['replicas'] = [db.get_engine(self.app, key) for key in replica_binds(self.app)]
+
+    def get_bind(self, mapper=None, clause=None):
+        if (self._flushing or isinstance(clause, UpdateBase)
+                or not self.info.get('replicas') or _reads_from_primary()):
+            return super().get_bind(mapper, clause)
+        if 'replica' not in self.info:
+            self.info['replica'] = random.choice(self.info['replicas'])
+        return self.info['replica']
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(db_session, flush_context):
+    db_session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(db_session):
+    if db_session.info.pop('wrote', False) and has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _rolled_back(db_session):
+    db_session.info.pop('wrote', None)
+
+
+def _statement_timeout(engine, timeout_ms):
+    dialect = engine.dialect.name
+    if dialect == 'sqlite':
+        @event.listens_for(engine, 'connect')
+        def _connect(dbapi_connection, connection_record):
+            deadline = connection_record.info['statement_deadline'] = [None]
+            # called every 1000 SQLite VM steps, a non-zero return aborts the statement
+            dbapi_connection.set_progress_handler(
+                lambda: deadline[0] is not None and time.monotonic() > deadline[0], 1000
+            )
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def _start(conn, cursor, statement, parameters, context, executemany):
+            conn.info['statement_deadline'][0] = time.monotonic() + timeout_ms / 1000
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _done(conn, cursor, statement, parameters, context, executemany):
+            conn.info['statement_deadline'][0] = None
+        return
+
+    if dialect == 'postgresql':
+        setting = f'SET statement_timeout = {int(timeout_ms)}'
+    elif dialect == 'mysql':
+        setting = f'SET SESSION MAX_EXECUTION_TIME = {int(timeout_ms)}'
+    else:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(setting)
+        cursor.close()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def init_app(self, app):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for n, uri in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+            binds[f'{REPLICA_PREFIX}{n}'] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+        super().init_app(app)
+        if replica_binds(app):
+            app.after_request(_remember_write)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        if sa_url.get_backend_name() != 'sqlite':
+            options.setdefault('pool_size', app.config['DATABASE_POOL_SIZE'])
+            options.setdefault('max_overflow', app.config['DATABASE_MAX_OVERFLOW'])
+            options.setdefault('pool_timeout', app.config['DATABASE_POOL_TIMEOUT'])
+            options.setdefault('pool_recycle', app.config['DATABASE_POOL_RECYCLE'])
+            options.setdefault('pool_pre_ping', app.config['DATABASE_POOL_PRE_PING'])
+        # not an engine option, create_engine() takes it back out
+        options['statement_timeout_ms'] = app.config['DATABASE_STATEMENT_TIMEOUT_MS']
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        timeout_ms = engine_opts.pop('statement_timeout_ms', 0)
+        engine = super().create_engine(sa_url, engine_opts)
+        if timeout_ms:
+            _statement_timeout(engine, timeout_ms)
+        return engine
+
+    def dispose_engines(self, app):
+        """
+        Closes the pooled connections of all the app's engines. A pre-fork
+        master calls it so no connection is shared with its workers.
+        """
+
+        with app.app_context():
+            for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+                self.get_engine(app, bind).dispose()
+
+
+def _remember_write(response):
+    if g.get('db_wrote'):
+        session[STICKY_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
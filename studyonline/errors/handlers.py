@@ -1,16 +1,35 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request
+from studyonline.api.routes import api, api_error
 
 errors = Blueprint('errors', __name__)
 
+
+def _api_request():
+    # routing errors (no such url, wrong method) happen before any blueprint
+    # is picked, so api_error can't catch them for the API's urls
+    return request.path.startswith(api.url_prefix + '/')
+
 @errors.app_errorhandler(500)
 def error_500(error):
     return render_template('errors/500.html'), 500
 
 @errors.app_errorhandler(404)
 def error_404(error):
+    if _api_request():
+        return api_error(error)
     return render_template('errors/404.html'), 404
 
+@errors.app_errorhandler(405)
+def error_405(error):
+    if _api_request():
+        return api_error(error)
+    return error
+
 @errors.app_errorhandler(403)
 def error_403(error):
     return render_template('errors/403.html'), 403
 
+
+@errors.app_errorhandler(429)
+def error_429(error):
+    return render_template('errors/429.html'), 429, {'Retry-After': str(error.retry_after or 60)}
@@ -0,0 +1,300 @@
+"""
+Per-request instrumentation
+
+With INSTRUMENTATION_ENABLED set, every request records:
+- wall time, per endpoint, as a latency histogram
+- the number and total time of its SQL statements (SQLAlchemy
+  before/after_cursor_execute engine events)
+- time spent rendering templates (a jinja Template subclass, as Flask's
+  template signals need blinker)
+- statements slower than SLOW_QUERY_MS, kept as samples with their SQL
+  (never their parameters)
+
+The numbers are served in the Prometheus text format at METRICS_PATH, the
+slow query samples as JSON below it, and each response carries them in a
+Server-Timing header for the browser's network panel. A fraction
+(PROFILE_SAMPLE_RATE) of requests can also be run under cProfile, with
+the stats dumped to PROFILE_DIR/<endpoint>/.
+
+Metrics are per process: with several workers, scrape each one or run
+the metrics on a single worker. With it disabled nothing is registered
+at all, so there is no overhead.
+
+The metrics endpoints want "Authorization: Bearer <METRICS_TOKEN>". With
+no token configured they only answer direct requests from the machine
+itself (loopback, no X-Forwarded-For), and 404 for everyone else; the
+slow query samples hold raw SQL.
+"""
+
+import cProfile
+import hmac
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from flask import abort, current_app, g, jsonify, request, Response
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# request latency histogram buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """
+    What one request did so far, kept in g.instrumentation.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.template_time = 0.0
+        self.profiler = None
+
+
+class Metrics:
+    """
+    Process-wide totals, rendered by exposition().
+    """
+
+    def __init__(self, slow_samples=50):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.latency = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.latency_sum = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.query_time = defaultdict(float)
+        self.templates = defaultdict(int)
+        self.template_time = defaultdict(float)
+        self.slow_queries = deque(maxlen=slow_samples)
+        self.slow_query_count = defaultdict(int)
+
+    def observe_request(self, endpoint, method, status, stats, elapsed):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            counts = self.latency[endpoint]
+            for n, bound in enumerate(BUCKETS):
+                if elapsed <= bound:
+                    counts[n] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self.latency_sum[endpoint] += elapsed
+            self.queries[endpoint] += stats.queries
+            self.query_time[endpoint] += stats.query_time
+
+    def observe_template(self, name, elapsed):
+        with self._lock:
+            self.templates[name] += 1
+            self.template_time[name] += elapsed
+
+    def observe_slow_query(self, endpoint, statement, elapsed):
+        with self._lock:
+            self.slow_query_count[endpoint] += 1
+            self.slow_queries.append({
+                'endpoint': endpoint,
+                'ms': round(elapsed * 1000, 3),
+                'statement': statement,
+                'at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            })
+
+    def exposition(self, caches=()):
+        """
+        Everything in the Prometheus text format. `caches` is a list of
+        (name, CacheStats) pairs.
+        """
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            family('studyonline_requests_total', 'counter', 'Requests handled.')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'studyonline_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+            family('studyonline_request_duration_seconds', 'histogram', 'Request wall time.')
+            for endpoint, counts in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'studyonline_request_duration_seconds_bucket'
+                                 f'{_labels(endpoint=endpoint, le=bound)} {cumulative}')
+                lines.append(f'studyonline_request_duration_seconds_sum{_labels(endpoint=endpoint)} '
+                             f'{self.latency_sum[endpoint]:.6f}')
+                lines.append(f'studyonline_request_duration_seconds_count{_labels(endpoint=endpoint)} {cumulative}')
+
+            family('studyonline_db_queries_total', 'counter', 'SQL statements run by requests.')
+            for endpoint, count in sorted(self.queries.items()):
+                lines.append(f'studyonline_db_queries_total{_labels(endpoint=endpoint)} {count}')
+            family('studyonline_db_query_seconds_total', 'counter', 'Time spent in SQL statements.')
+            for endpoint, seconds in sorted(self.query_time.items()):
+                lines.append(f'studyonline_db_query_seconds_total{_labels(endpoint=endpoint)} {seconds:.6f}')
+            family('studyonline_db_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_MS.')
+            for endpoint, count in sorted(self.slow_query_count.items()):
+                lines.append(f'studyonline_db_slow_queries_total{_labels(endpoint=endpoint)} {count}')
+
+            family('studyonline_template_renders_total', 'counter', 'Top-level template renders.')
+            for name, count in sorted(self.templates.items()):
+                lines.append(f'studyonline_template_renders_total{_labels(template=name)} {count}')
+            family('studyonline_template_render_seconds_total', 'counter', 'Time spent rendering templates.')
+            for name, seconds in sorted(self.template_time.items()):
+                lines.append(f'studyonline_template_render_seconds_total{_labels(template=name)} {seconds:.6f}')
+
+        family('studyonline_cache_requests_total', 'counter', 'Cache lookups by result.')
+        for name, stats in caches:
+            lines.append(f'studyonline_cache_requests_total{_labels(cache=name, result="hit")} {stats.hits}')
+            lines.append(f'studyonline_cache_requests_total{_labels(cache=name, result="miss")} {stats.misses}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _metrics():
+    return current_app.extensions['instrumentation']
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+class TimedTemplate(Template):
+    """
+    Times render(). Included and extended templates are part of the
+    template that pulls them in.
+    """
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats = g.get('instrumentation') if g else None
+            if stats is not None:
+                stats.template_time += elapsed
+                _metrics().observe_template(self.name or '<string>', elapsed)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if g and 'instrumentation' in g:
+        conn.info.setdefault('instrumentation_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('instrumentation_started')
+    if not started or not g or 'instrumentation' not in g:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = g.instrumentation
+    stats.queries += 1
+    stats.query_time += elapsed
+    if elapsed * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        _metrics().observe_slow_query(_endpoint(), statement, elapsed)
+        current_app.logger.warning('slow query (%.1f ms) in %s: %s', elapsed * 1000, _endpoint(), statement)
+
+
+def _start_request():
+    stats = g.instrumentation = RequestStats()
+    rate = current_app.config['PROFILE_SAMPLE_RATE']
+    if rate and random.random() < rate:
+        endpoints = current_app.config['PROFILE_ENDPOINTS']
+        if not endpoints or _endpoint() in endpoints:
+            stats.profiler = cProfile.Profile()
+            stats.profiler.enable()
+
+
+def _dump_profile(profiler):
+    profiler.disable()
+    root = current_app.config['PROFILE_DIR'] or os.path.join(current_app.instance_path, 'profiles')
+    directory = os.path.join(root, _endpoint())
+    os.makedirs(directory, exist_ok=True)
+    filename = f'{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}.prof'
+    profiler.dump_stats(os.path.join(directory, filename))
+
+
+def _finish_request(response):
+    stats = g.pop('instrumentation', None)
+    if stats is None:
+        return response
+    if stats.profiler is not None:
+        _dump_profile(stats.profiler)
+    elapsed = time.perf_counter() - stats.started
+    _metrics().observe_request(_endpoint(), request.method, response.status_code, stats, elapsed)
+    if current_app.config['INSTRUMENTATION_SERVER_TIMING']:
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={stats.query_time * 1000:.2f};desc="{stats.queries} queries", '
+            f'tpl;dur={stats.template_time * 1000:.2f}, '
+            f'app;dur={elapsed * 1000:.2f}'
+        )
+    return response
+
+
+LOOPBACK = ('127.0.0.1', '::1')
+
+
+def _check_token():
+    token = current_app.config['METRICS_TOKEN']
+    if not token:
+        # a request through a proxy on this machine comes from loopback too
+        if request.remote_addr not in LOOPBACK or 'X-Forwarded-For' in request.headers:
+            abort(404)
+        return
+    supplied = request.headers.get('Authorization', '').encode('utf-8')
+    if not hmac.compare_digest(supplied, f'Bearer {token}'.encode('utf-8')):
+        abort(403)
+
+
+def metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+
+    from studyonline.main.utils import feed_cache
+    from studyonline.pagination import room_counts
+    from studyonline.users.cache import user_cache
+
+    _check_token()
+    caches = [('user', user_cache.stats), ('feed', feed_cache.stats), ('room_count', room_counts.stats)]
+    return Response(_metrics().exposition(caches), mimetype='text/plain; version=0.0.4')
+
+
+def slow_queries():
+    """
+    The most recent slow statements, newest first.
+    """
+
+    _check_token()
+    return jsonify(slow_queries=list(reversed(_metrics().slow_queries)))
+
+
+def init_app(app):
+    """
+    Hooks the instrumentation into the app when INSTRUMENTATION_ENABLED is
+    set. With it disabled nothing is registered.
+    """
+
+    if not app.config.get('INSTRUMENTATION_ENABLED'):
+        return
+    app.extensions['instrumentation'] = Metrics(app.config['SLOW_QUERY_SAMPLES'])
+    for name, listener in (('before_cursor_execute', _before_cursor_execute),
+                           ('after_cursor_execute', _after_cursor_execute)):
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    path = app.config['METRICS_PATH']
+    app.add_url_rule(path, 'metrics', metrics)
+    app.add_url_rule(f'{path}/slow_queries', 'slow_queries', slow_queries)
@@ -0,0 +1,285 @@
+"""
+Outgoing email through an outbox table
+
+Requests never talk to the SMTP server. send_email() inserts an
+OutboxMessage row and commits, which takes as long as any other small write,
+and nudges the outbox worker. The worker drains the table in batches of
+OUTBOX_BATCH_SIZE over one SMTP connection that is kept open between batches
+(closed after MAIL_IDLE_TIMEOUT seconds without mail), so a burst of emails
+costs one connect, TLS handshake and login instead of one per message.
+
+Claiming: a worker selects due rows, then stamps them with its own claim
+token and pushes next_attempt_at out by OUTBOX_LEASE_SECONDS in one UPDATE
+that only matches rows still unclaimed. Several workers (one per app process,
+or `flask outbox drain`) can therefore share the table without sending a
+message twice; rows of a worker that died mid-batch become due again when
+the lease runs out. Delivery is at least once: a crash between the SMTP
+send and the commit marking the row sent resends it.
+
+Failures: a temporary error (4xx reply, dropped connection) reschedules the
+message with exponential backoff, OUTBOX_RETRY_BASE * 2^(attempts - 1)
+seconds with jitter, capped at OUTBOX_RETRY_MAX. A permanent error (5xx)
+or OUTBOX_MAX_ATTEMPTS attempts marks it 'failed'. When the connection
+itself fails the rest of the batch is handed back untouched.
+
+OUTBOX_WORKER = 'thread' runs the worker as a daemon thread in each app
+process, started by its first request (never in a preloading master);
+'off' leaves sending to `flask outbox drain`.
+"""
+
+import os
+import random
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from flask import current_app
+from studyonline import db
+from studyonline.models import OutboxMessage
+
+def send_email(recipient, subject, body):
+    """
+    Queues an email: adds it to the outbox, commits and wakes the worker.
+    """
+
+    message = OutboxMessage(recipient=recipient, subject=subject, body=body)
+    db.session.add(message)
+    db.session.commit()
+    worker.wake(current_app._get_current_object())
+    return message
+
+
+class Mailer:
+    """
+    One pooled SMTP connection, opened on first use and reopened after an
+    error or a server-side disconnect.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._smtp = None
+        self._last_used = 0
+
+    def _connect(self):
+        config = self.config
+        smtp = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT'])
+        try:
+            if config['MAIL_USE_TLS']:
+                smtp.starttls()
+            if config['MAIL_USERNAME']:
+                smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def send(self, message):
+        """
+        Sends on the open connection. A connection that was sitting idle may
+        have been dropped by the server, that case is retried once on a
+        fresh one.
+        """
+
+        reused = self._smtp is not None
+        if not reused:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            if not reused:
+                raise
+            self._smtp = self._connect()
+            self._smtp.send_message(message)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+    def close_if_idle(self):
+        if self._smtp is not None and time.monotonic() - self._last_used >= self.config['MAIL_IDLE_TIMEOUT']:
+            self.close()
+
+
+def _email(config, row):
+    message = EmailMessage()
+    message['From'] = config['MAIL_DEFAULT_SENDER']
+    message['To'] = row.recipient
+    message['Subject'] = row.subject
+    message.set_content(row.body)
+    return message
+
+
+def _backoff(config, attempts):
+    delay = min(config['OUTBOX_RETRY_BASE'] * 2 ** (attempts - 1), config['OUTBOX_RETRY_MAX'])
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def _permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _connection_lost(error):
+    """
+    The connection is gone rather than this message refused. SMTPException
+    subclasses OSError, so socket errors are told apart from SMTP replies.
+    """
+
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def claim(config, size=None, now=None):
+    """
+    Claims up to `size` (default OUTBOX_BATCH_SIZE) due messages for this
+    worker, oldest first.
+    """
+
+    now = now or datetime.utcnow()
+    token = uuid.uuid4().hex
+    due = (db.session.query(OutboxMessage.id)
+           .filter(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+           .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+           .limit(size or config['OUTBOX_BATCH_SIZE'])
+           .with_for_update(skip_locked=True))
+    ids = [pk for pk, in due]
+    if not ids:
+        db.session.commit()
+        return []
+    OutboxMessage.query.filter(
+        OutboxMessage.id.in_(ids),
+        OutboxMessage.status == 'pending',
+        OutboxMessage.next_attempt_at <= now,
+    ).update({
+        'claimed_by': token,
+        'next_attempt_at': now + timedelta(seconds=config['OUTBOX_LEASE_SECONDS']),
+    }, synchronize_session=False)
+    db.session.commit()
+    return OutboxMessage.query.filter_by(claimed_by=token, status='pending').order_by(OutboxMessage.id).all()
+
+
+def send_batch(config, mailer, rows):
+    """
+    Sends claimed rows and records the outcome of each in one commit.
+    Returns (sent, retried, failed) counts.
+    """
+
+    sent, retried, failed = [], 0, 0
+    released = []
+    for index, row in enumerate(rows):
+        try:
+            mailer.send(_email(config, row))
+        except Exception as error:
+            now = datetime.utcnow()
+            row.attempts += 1
+            row.claimed_by = None
+            row.last_error = f'{type(error).__name__}: {error}'[:200]
+            if _permanent(error) or row.attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+                row.status = 'failed'
+                failed += 1
+            else:
+                row.next_attempt_at = now + _backoff(config, row.attempts)
+                retried += 1
+            if _connection_lost(error):
+                # no point trying the rest on a broken connection
+                mailer.close()
+                released = rows[index + 1:]
+                break
+        else:
+            sent.append(row)
+
+    now = datetime.utcnow()
+    for row in sent:
+        row.status, row.sent_at, row.claimed_by, row.last_error = 'sent', now, None, None
+    for row in released:
+        row.claimed_by = None
+        row.next_attempt_at = now + timedelta(seconds=config['OUTBOX_RETRY_BASE'])
+    db.session.commit()
+    return len(sent), retried + len(released), failed
+
+
+def drain(app, mailer=None, limit=None):
+    """
+    Sends due messages batch by batch until none are left (or `limit`
+    messages were handled). Needs an app context. Returns (sent, retried,
+    failed) totals.
+    """
+
+    own = mailer is None
+    mailer = mailer or Mailer(app.config)
+    totals = [0, 0, 0]
+    try:
+        while limit is None or sum(totals) < limit:
+            size = app.config['OUTBOX_BATCH_SIZE']
+            rows = claim(app.config, size if limit is None else min(size, limit - sum(totals)))
+            if not rows:
+                break
+            sent, retried, failed = send_batch(app.config, mailer, rows)
+            totals = [totals[0] + sent, totals[1] + retried, totals[2] + failed]
+            if retried and not sent:
+                # nothing getting through, leave the rest for the next round
+                break
+    finally:
+        if own:
+            mailer.close()
+    return tuple(totals)
+
+
+class OutboxWorker:
+    """
+    The background sender of one app process. Sleeps until woken by
+    send_email() or for OUTBOX_POLL_SECONDS, then drains the outbox.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, app):
+        if app.config['OUTBOX_WORKER'] != 'thread':
+            return
+        with self._lock:
+            # a thread doesn't survive fork(), a forked child starts its own
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(app,), name='outbox-worker', daemon=True)
+            self._thread.start()
+
+    def wake(self, app):
+        self.start(app)
+        self._wake.set()
+
+    def _run(self, app):
+        mailer = Mailer(app.config)
+        while True:
+            try:
+                with app.app_context():
+                    drain(app, mailer)
+            except Exception:
+                app.logger.exception('outbox drain failed')
+                mailer.close()
+            self._wake.wait(app.config['OUTBOX_POLL_SECONDS'])
+            self._wake.clear()
+            mailer.close_if_idle()
+
+
+worker = OutboxWorker()
+
+
+def init_app(app):
+    if app.config['OUTBOX_WORKER'] == 'thread':
+        app.before_first_request(lambda: worker.start(app))
@@ -1,17 +1,64 @@
-from flask import Blueprint, request, render_template
+from flask import Blueprint, current_app, request, render_template
+from flask_login import current_user, login_required
+from markupsafe import Markup
+from studyonline import db
+from studyonline.database import read_only
 from studyonline.models import Room
+from studyonline.pagination import keyset_paginate, room_counts, decode_cursor, encode_cursor
+from studyonline.main.utils import feed_cache
+from studyonline.rooms import membership, topics
+from studyonline.timeline import timeline_page
+from studyonline.rooms.forms import MembershipForm
 
 main = Blueprint('main', __name__)
 
+def render_feed(cursor):
+    """
+    Renders the room list and the "Top Topics" sidebar of one home page.
+    """
+
+    total = room_counts.get('rooms', lambda: db.session.query(db.func.count(Room.id)).scalar())
+    query = Room.query.options(db.joinedload(Room.creator))
+    rooms = keyset_paginate(query, Room.date_created, Room.id, cursor=cursor, per_page=5, total=total)
+    joined = set()
+    if current_user.is_authenticated:
+        joined = membership.joined_room_ids(current_user.id, [room.id for room in rooms.items])
+    return (
+        render_template('home_topics.html', topics=topics.top_topics(current_app.config['TOP_TOPICS'])),
+        render_template('home_feed.html', rooms=rooms, joined=joined)
+    )
+
 @main.route('/')
+@read_only
 def home():
     """
     Home Page/ Landing Page
+    The feed fragments are cached per page and viewer (anonymous visitors all
+    share one entry) and marked stale whenever a room is written.
     """
     
-    page = request.args.get('page', 1, type=int)
-    rooms = Room.query.order_by(Room.date_created.desc()).paginate(per_page=5, page=page)
-    return render_template('home.html', title='Home', rooms=rooms)
+    # keyed on the decoded position, so a garbage or re-encoded cursor can't
+    # make a new entry (and a render) of its own
+    position = decode_cursor(request.args.get('cursor'))
+    cursor = encode_cursor(*position) if position else None
+    viewer = current_user.get_id() if current_user.is_authenticated else None
+    topics, feed = feed_cache.get_or_render(('home', cursor, viewer), lambda: render_feed(cursor))
+    return render_template('home.html', title='Home', topics=Markup(topics), feed=Markup(feed),
+                           membership_form=MembershipForm())
+
+@main.route('/timeline')
+@login_required
+@read_only
+def timeline():
+    """
+    Rooms of the users the current user follows, and their own, newest first.
+    Read from the precomputed timeline, see studyonline/timeline.py.
+    """
+
+    rooms = timeline_page(current_user.id, cursor=request.args.get('cursor'), per_page=5)
+    joined = membership.joined_room_ids(current_user.id, [room.id for room in rooms.items])
+    return render_template('timeline.html', title='Timeline', rooms=rooms, joined=joined,
+                           membership_form=MembershipForm())
 
 @main.route('/about')
 def about():
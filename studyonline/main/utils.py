@@ -0,0 +1,23 @@
+from studyonline.cache import FragmentCache, make_store
+from studyonline.pagination import room_counts
+
+feed_cache = FragmentCache()
+
+
+def init_feed_cache(app):
+    feed_cache.maxsize = app.config['FEED_CACHE_SIZE']
+    feed_cache.ttl = app.config['FEED_CACHE_TTL']
+    feed_cache.stale_ttl = app.config['FEED_CACHE_STALE_TTL']
+    # invalidations reach every worker process through CACHE_STORE
+    feed_cache.store = make_store(app)
+    feed_cache.generation_key = 'feed:generation'
+
+
+def rooms_changed():
+    """
+    Called by the room write paths after they commit.
+    Room totals are recounted and cached home feed pages are marked stale.
+    """
+
+    room_counts.invalidate()
+    feed_cache.invalidate()
@@ -6,9 +6,40 @@ from flask_login import UserMixin
 def load_user(user_id):
     """
     returns user object from the user ID stored in the session.
+    Served from user_cache when possible, see studyonline/users/cache.py
     """
 
-    return User.query.get(int(user_id))
+    from studyonline.users.cache import user_cache
+    return user_cache.get(int(user_id))
+
+room_membership = db.Table(
+        'room_membership',
+        db.Column('room_id', db.Integer, db.ForeignKey('room.id'), primary_key=True),
+        db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+        db.Column('joined_at', db.DateTime, nullable=False, default=datetime.utcnow),
+        # the primary key (room_id, user_id) answers "members of room X" and this
+        # index answers "rooms I've joined", both without touching the table
+        db.Index('ix_room_membership_user_id_room_id', 'user_id', 'room_id')
+)
+"""
+association table between user and room, one row per member of a room.
+Room.total_members is a counter kept in step with it (see rooms/membership.py).
+"""
+
+follow = db.Table(
+        'follow',
+        db.Column('follower_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+        db.Column('followed_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+        db.Column('created_at', db.DateTime, nullable=False, default=datetime.utcnow),
+        # the primary key (follower_id, followed_id) answers "who do I follow"
+        # and this index "who follows X", which the timeline fan-out reads
+        db.Index('ix_follow_followed_id_follower_id', 'followed_id', 'follower_id')
+)
+"""
+association table between users, one row per follower of a user.
+User.follower_count and User.following_count are counters kept in step with
+it (see users/follows.py).
+"""
 
 class User(db.Model, UserMixin):
     """
@@ -20,6 +51,11 @@ class User(db.Model, UserMixin):
     lazy argument tells SQLAlchemy when to load data from a database.
     lazy argument is set to dynamic, which returns a query object, which can be refined further before loading the data.
     By default uselist is True.
+    room_count is the number of rooms the user created, see studyonline/counters.py.
+    following are the users this user follows (followers the other way round),
+    follower_count and following_count their counts, see users/follows.py.
+    timeline_seq numbers the entries pushed to the user's timeline, see timeline.py.
+    (follower_count) is indexed to find the creators whose rooms aren't fanned out.
     """
 
     id = db.Column(
@@ -54,6 +90,41 @@ class User(db.Model, UserMixin):
             backref='creator', 
             lazy=True
     )
+    room_count = db.Column(
+            db.Integer,
+            nullable=False,
+            default=0,
+            server_default='0'
+    )
+    following = db.relationship(
+            'User',
+            secondary=follow,
+            primaryjoin=(follow.c.follower_id == id),
+            secondaryjoin=(follow.c.followed_id == id),
+            lazy='dynamic',
+            backref=db.backref('followers', lazy='dynamic')
+    )
+    follower_count = db.Column(
+            db.Integer,
+            nullable=False,
+            default=0,
+            server_default='0'
+    )
+    following_count = db.Column(
+            db.Integer,
+            nullable=False,
+            default=0,
+            server_default='0'
+    )
+    timeline_seq = db.Column(
+            db.Integer,
+            nullable=False,
+            default=0,
+            server_default='0'
+    )
+    __table_args__ = (
+            db.Index('ix_user_follower_count', 'follower_count'),
+    )
     
     """
     string representation of objects
@@ -68,6 +139,11 @@ class Room(db.Model):
     room - table
     A room will have [topic, description]. [id, date_created, user_id] will be populated automatically.
     Room belongs to a user (user_id as foreign key)
+    (date_created, id) is indexed for keyset pagination of room listings.
+    members are the users who joined, total_members is their count.
+    topic keeps what the creator typed, topic_id links the normalized Topic
+    and (topic_id, date_created, id) is indexed for the /topic/<name> listing,
+    (user_id, date_created, id) for the listings of one user's rooms.
     """
 
     id = db.Column(
@@ -90,14 +166,216 @@ class Room(db.Model):
             db.ForeignKey('user.id'), 
             nullable=False
     )
-    #members = db.relationship('User') 
+    members = db.relationship(
+            'User',
+            secondary=room_membership,
+            lazy='dynamic',
+            backref=db.backref('joined_rooms', lazy='dynamic')
+    )
     total_members = db.Column(
             db.Integer, 
-            default=0
+            default=0,
+            server_default='0'
+    )
+    topic_id = db.Column(
+            db.Integer,
+            db.ForeignKey('topic.id')
+    )
+    __table_args__ = (
+            db.Index('ix_room_date_created_id', 'date_created', 'id'),
+            db.Index('ix_room_topic_id_date_created_id', 'topic_id', 'date_created', 'id'),
+            db.Index('ix_room_user_id_date_created_id', 'user_id', 'date_created', 'id'),
     )
     
     """
     string representation of objects
     """
     def __repr__(self):
-        return f"Room('{self.topic}', '{self.date_created}')"
\ No newline at end of file
+        return f"Room('{self.topic}', '{self.date_created}')"
+
+class Topic(db.Model):
+    """
+    topic - table
+    One row per normalized room topic (see rooms/topics.py).
+    room_count is the number of rooms with the topic, kept in step by the
+    room write paths; (room_count, id) is indexed for the top topics sidebar.
+    """
+
+    id = db.Column(
+            db.Integer,
+            primary_key=True
+    )
+    name = db.Column(
+            db.String(20),
+            unique=True,
+            nullable=False
+    )
+    room_count = db.Column(
+            db.Integer,
+            nullable=False,
+            default=0,
+            server_default='0'
+    )
+    __table_args__ = (
+            db.Index('ix_topic_room_count_id', 'room_count', 'id'),
+    )
+
+    """
+    string representation of objects
+    """
+    def __repr__(self):
+        return f"Topic('{self.name}', '{self.room_count}')"
+
+class TimelineEntry(db.Model):
+    """
+    timeline_entry - table
+    The precomputed home timeline of a user (see studyonline/timeline.py):
+    one row per room pushed to it, at most TIMELINE_SIZE rows per user. slot
+    is the position in that ring, the next push overwrites the oldest.
+    date_created is the room's, copied so the timeline is read in order from
+    the (user_id, date_created, room_id) index alone; (user_id, creator_id)
+    finds the entries to drop on unfollow, (room_id) those of a deleted room.
+    """
+
+    user_id = db.Column(
+            db.Integer,
+            db.ForeignKey('user.id'),
+            primary_key=True
+    )
+    slot = db.Column(
+            db.Integer,
+            primary_key=True,
+            autoincrement=False
+    )
+    room_id = db.Column(
+            db.Integer,
+            nullable=False
+    )
+    creator_id = db.Column(
+            db.Integer,
+            nullable=False
+    )
+    date_created = db.Column(
+            db.DateTime,
+            nullable=False
+    )
+    __table_args__ = (
+            db.Index('ix_timeline_entry_user_id_date_created_room_id', 'user_id', 'date_created', 'room_id'),
+            db.Index('ix_timeline_entry_user_id_creator_id', 'user_id', 'creator_id'),
+            db.Index('ix_timeline_entry_room_id', 'room_id'),
+    )
+
+    """
+    string representation of objects
+    """
+    def __repr__(self):
+        return f"TimelineEntry('{self.user_id}', '{self.room_id}')"
+
+class Message(db.Model):
+    """
+    message - table
+    Chat messages posted in a room over the realtime connection (studyonline/realtime).
+    (room_id, id) is indexed so a room's history pages backwards by id.
+    """
+
+    id = db.Column(
+            db.Integer,
+            primary_key=True
+    )
+    room_id = db.Column(
+            db.Integer,
+            db.ForeignKey('room.id'),
+            nullable=False
+    )
+    user_id = db.Column(
+            db.Integer,
+            db.ForeignKey('user.id'),
+            nullable=False
+    )
+    body = db.Column(
+            db.String(500),
+            nullable=False
+    )
+    date_created = db.Column(
+            db.DateTime,
+            nullable=False,
+            default=datetime.utcnow
+    )
+    author = db.relationship('User')
+    __table_args__ = (
+            db.Index('ix_message_room_id_id', 'room_id', 'id'),
+    )
+
+    """
+    string representation of objects
+    """
+    def __repr__(self):
+        return f"Message('{self.room_id}', '{self.date_created}')"
+
+class OutboxMessage(db.Model):
+    """
+    outbox_message - table
+    Outgoing emails, written in the request's transaction and sent later by
+    the outbox worker (see studyonline/mail.py). status is 'pending' until
+    sent ('sent') or given up on ('failed'). A worker claims pending rows by
+    stamping claimed_by and pushing next_attempt_at out by a lease;
+    (status, next_attempt_at) is indexed for finding the rows that are due.
+    """
+
+    id = db.Column(
+            db.Integer,
+            primary_key=True
+    )
+    recipient = db.Column(
+            db.String(120),
+            nullable=False
+    )
+    subject = db.Column(
+            db.String(200),
+            nullable=False
+    )
+    body = db.Column(
+            db.Text,
+            nullable=False
+    )
+    status = db.Column(
+            db.String(10),
+            nullable=False,
+            default='pending',
+            server_default='pending'
+    )
+    attempts = db.Column(
+            db.Integer,
+            nullable=False,
+            default=0,
+            server_default='0'
+    )
+    next_attempt_at = db.Column(
+            db.DateTime,
+            nullable=False,
+            default=datetime.utcnow
+    )
+    claimed_by = db.Column(
+            db.String(32)
+    )
+    last_error = db.Column(
+            db.String(200)
+    )
+    date_created = db.Column(
+            db.DateTime,
+            nullable=False,
+            default=datetime.utcnow
+    )
+    sent_at = db.Column(
+            db.DateTime
+    )
+    __table_args__ = (
+            db.Index('ix_outbox_message_status_next_attempt_at', 'status', 'next_attempt_at'),
+            db.Index('ix_outbox_message_claimed_by', 'claimed_by'),
+    )
+
+    """
+    string representation of objects
+    """
+    def __repr__(self):
+        return f"OutboxMessage('{self.recipient}', '{self.status}')"
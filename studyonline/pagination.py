@@ -0,0 +1,165 @@
+"""
+Keyset (cursor) pagination
+
+OFFSET pagination makes the database walk and throw away every row before the
+requested page, and Flask-SQLAlchemy's paginate() adds a COUNT(*) on top of it.
+Keyset pagination remembers the (date_created, id) of the last row shown and
+asks for the rows that come after it, which is a single index range scan on
+ix_room_date_created_id no matter how deep the page is.
+
+Cursors are opaque to the client: urlsafe base64 of [direction, sort value, id].
+"""
+
+import json
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from threading import Lock
+from sqlalchemy import and_, or_
+from studyonline.cache import CacheStats
+
+NEXT = 'n'
+PREV = 'p'
+
+
+def encode_cursor(direction, sort_value, pk):
+    """
+    Packs a position in the listing into an opaque url-safe string.
+    """
+
+    payload = json.dumps([direction, sort_value.isoformat(), pk], separators=(',', ':'))
+    return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Reverse of encode_cursor(). Returns None for a missing or tampered cursor,
+    in which case the listing simply starts from the first page.
+    """
+
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, sort_value, pk = json.loads(urlsafe_b64decode(padded.encode('ascii')))
+        if direction not in (NEXT, PREV):
+            return None
+        return direction, datetime.fromisoformat(sort_value), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of a keyset paginated listing.
+    Mirrors the attributes of Flask-SQLAlchemy's Pagination that the templates
+    use (items, total, has_next, has_prev) so they stay familiar.
+    """
+
+    def __init__(self, items, has_next, has_prev, sort_column, id_column, total=None):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.total = total
+        self._sort_key = sort_column.key
+        self._id_key = id_column.key
+
+    def _cursor(self, direction, item):
+        return encode_cursor(direction, getattr(item, self._sort_key), getattr(item, self._id_key))
+
+    @property
+    def next_cursor(self):
+        if not (self.has_next and self.items):
+            return None
+        return self._cursor(NEXT, self.items[-1])
+
+    @property
+    def prev_cursor(self):
+        if not (self.has_prev and self.items):
+            return None
+        return self._cursor(PREV, self.items[0])
+
+
+def keyset_range(sort_column, id_column, position):
+    """
+    (filters, order_by) selecting the rows after `position` (a decoded cursor,
+    None for the first page) in its direction, newest first for NEXT and
+    oldest first for PREV.
+    """
+
+    if position is None:
+        return [], (sort_column.desc(), id_column.desc())
+    direction, sort_value, pk = position
+    if direction == NEXT:
+        return [
+            or_(
+                sort_column < sort_value,
+                and_(sort_column == sort_value, id_column < pk)
+            )
+        ], (sort_column.desc(), id_column.desc())
+    return [
+        or_(
+            sort_column > sort_value,
+            and_(sort_column == sort_value, id_column > pk)
+        )
+    ], (sort_column.asc(), id_column.asc())
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=5, total=None):
+    """
+    Returns a KeysetPage of `query` ordered newest first by (sort_column, id_column).
+
+    query: an unordered query, filters and loader options already applied
+    cursor: value of the ?cursor= url argument (may be None)
+    total: optional precomputed row count for headers such as "N Available Room(s)"
+
+    One extra row is fetched to find out whether there is another page in the
+    direction we are moving, so no COUNT(*) is needed.
+    """
+
+    position = decode_cursor(cursor)
+    filters, order_by = keyset_range(sort_column, id_column, position)
+    rows = query.filter(*filters).order_by(*order_by).limit(per_page + 1).all()
+    if position is None:
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False, sort_column, id_column, total)
+    if position[0] == NEXT:
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True, sort_column, id_column, total)
+    items = list(reversed(rows[:per_page]))
+    return KeysetPage(items, True, len(rows) > per_page, sort_column, id_column, total)
+
+
+class CountCache:
+    """
+    Small in-process TTL cache for COUNT(*) results.
+    The room totals shown in page headers don't need to be exact to the second,
+    so they are recounted at most once every `ttl` seconds per key.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._values = {}
+        self._lock = Lock()
+
+    def get(self, key, count_fn):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(key)
+        if cached and cached[1] > now:
+            self.stats.hits += 1
+            return cached[0]
+        self.stats.misses += 1
+        value = count_fn()
+        with self._lock:
+            self._values[key] = (value, now + self.ttl)
+        return value
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._values.clear()
+            else:
+                self._values.pop(key, None)
+
+
+room_counts = CountCache()
@@ -0,0 +1,53 @@
+"""
+Per-request SQL query counter
+
+Counts every statement the request sends to the database (SQLAlchemy
+before_cursor_execute engine event) and, when QUERY_BUDGET_ENABLED is set,
+fails the request if an endpoint issues more queries than its budget in
+QUERY_BUDGETS (or QUERY_BUDGET_DEFAULT). It is switched on in TestConfig so
+that an N+1 lazy load sneaking back into a template breaks loudly.
+"""
+
+from flask import g, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a request runs more SQL queries than its endpoint allows.
+    """
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if g and 'query_count' in g:
+        g.query_count += 1
+
+
+def _reset_counter():
+    g.query_count = 0
+
+
+def _check_budget(response):
+    budgets = current_app.config['QUERY_BUDGETS']
+    budget = budgets.get(request.endpoint, current_app.config['QUERY_BUDGET_DEFAULT'])
+    count = g.pop('query_count', 0)
+    if count > budget:
+        raise QueryBudgetExceeded(
+            f"{request.endpoint} ran {count} queries, budget is {budget}"
+        )
+    return response
+
+
+def init_app(app):
+    """
+    Hooks the counter into the app when QUERY_BUDGET_ENABLED is set.
+    With it disabled nothing is registered, so there is no per-query overhead.
+    """
+
+    if not app.config.get('QUERY_BUDGET_ENABLED'):
+        return
+    if not event.contains(Engine, 'before_cursor_execute', _count_query):
+        event.listen(Engine, 'before_cursor_execute', _count_query)
+    app.before_request(_reset_counter)
+    app.after_request(_check_budget)
@@ -0,0 +1,156 @@
+"""
+Rate limiting
+
+POSTs to the endpoints in RATELIMITS are counted per rule and rejected with
+429 Too Many Requests once a rule's limit is exceeded. A rule is
+
+    (scope, limit, seconds)
+
+where scope says what the requests are counted by:
+- 'ip'        the client address
+- 'username'  the `username` form field, e.g. one account being guessed at
+              from many addresses
+- 'route'     all clients together
+
+The check runs in before_request, so a rejected request never reaches the
+view: no query, no bcrypt check. Rejected requests still count, so a client
+that keeps hammering stays blocked.
+
+Counting uses a sliding window: the count of the current fixed window plus
+the previous window's count weighted by how much of it still overlaps the
+last `seconds`. That needs two counters per key instead of a timestamp per
+request, and both backends only have to support incr/get:
+
+MemoryBackend  a dict in this process (RATELIMIT_STORAGE = 'memory')
+StoreBackend   a shared store (RATELIMIT_STORAGE = 'shared'): CACHE_STORE,
+               i.e. redis, or the LocalStore stand-in
+
+Behind a proxy, apply werkzeug's ProxyFix so request.remote_addr is the
+client rather than the proxy.
+"""
+
+import math
+import threading
+import time
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+from studyonline.cache import make_store
+
+KEY_PREFIX = 'rl'
+# methods that are never limited
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class MemoryBackend:
+    """
+    Expiring counters in a dict, for a single process.
+    """
+
+    def __init__(self, sweep_every=60):
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._sweep_every = sweep_every
+        self._next_sweep = time.time() + sweep_every
+
+    def incr(self, key, ttl, now):
+        with self._lock:
+            if now >= self._next_sweep:
+                self._counts = {k: v for k, v in self._counts.items() if v[1] > now}
+                self._next_sweep = now + self._sweep_every
+            entry = self._counts.get(key)
+            if entry is None or entry[1] <= now:
+                entry = self._counts[key] = [0, now + ttl]
+            entry[0] += 1
+            return entry[0]
+
+    def get(self, key, now):
+        entry = self._counts.get(key)
+        return entry[0] if entry is not None and entry[1] > now else 0
+
+
+class StoreBackend:
+    """
+    Counters in a shared store with redis-py's incr/expire/get.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def incr(self, key, ttl, now):
+        count = self.client.incr(key)
+        if count == 1:
+            self.client.expire(key, ttl)
+        return count
+
+    def get(self, key, now):
+        return int(self.client.get(key) or 0)
+
+
+class Limiter:
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hit(self, key, limit, seconds, now=None):
+        """
+        Counts one request for `key`. Returns 0 if it is within `limit` per
+        `seconds`, otherwise the number of seconds to wait.
+        """
+
+        now = time.time() if now is None else now
+        window = int(now // seconds)
+        current = self.backend.incr(f'{KEY_PREFIX}:{key}:{window}', seconds * 2, now)
+        if current > limit:
+            return math.ceil(seconds - now % seconds)
+        previous = self.backend.get(f'{KEY_PREFIX}:{key}:{window - 1}', now)
+        overlap = 1 - (now % seconds) / seconds
+        if previous * overlap + current <= limit:
+            return 0
+        # until enough of the previous window has slid out
+        excess = previous * overlap + current - limit
+        return max(1, math.ceil(excess / previous * seconds))
+
+
+def _identity(scope):
+    if scope == 'ip':
+        return request.remote_addr or 'unknown'
+    if scope == 'username':
+        username = request.form.get('username', '').strip().lower()
+        return username or None
+    if scope == 'route':
+        return 'all'
+    raise ValueError(f'unknown rate limit scope {scope!r}')
+
+
+def _check_limits():
+    if request.method in SAFE_METHODS:
+        return
+    rules = current_app.config['RATELIMITS'].get(request.endpoint)
+    if not rules:
+        return
+    limiter = current_app.extensions['ratelimit']
+    for scope, limit, seconds in rules:
+        identity = _identity(scope)
+        if identity is None:
+            continue
+        retry_after = limiter.hit(f'{request.endpoint}:{scope}:{identity}', limit, seconds)
+        if retry_after:
+            current_app.logger.info('rate limited %s by %s (%s)', request.endpoint, scope, identity)
+            raise TooManyRequests(retry_after=retry_after)
+
+
+def make_limiter(app):
+    if app.config['RATELIMIT_STORAGE'] == 'shared':
+        return Limiter(StoreBackend(make_store(app)))
+    return Limiter(MemoryBackend())
+
+
+def init_app(app):
+    """
+    Hooks the limiter into the app when RATELIMIT_ENABLED is set.
+    """
+
+    if not app.config.get('RATELIMIT_ENABLED'):
+        return
+    app.extensions['ratelimit'] = make_limiter(app)
+    app.before_request(_check_limits)
@@ -0,0 +1,190 @@
+"""
+ASGI application for realtime rooms.
+
+    ws://<host>/ws/room/<pk>
+
+Every connection is a coroutine on one event loop, so an idle socket costs
+a couple of small objects rather than a thread; thousands fit in a single
+process. Blocking work (resolving the Flask-Login session, saving a
+message) runs on a small shared thread pool of REALTIME_DB_WORKERS.
+
+Frames sent to the client are JSON objects with a `type`:
+    presence  {'users': [...]}   who is in the room, sent once on connect
+    join      {'user': {...}}    a user's first connection to the room
+    leave     {'user': {...}}    a user's last connection closed
+    message   {'id', 'user', 'body', 'date', ...}
+    error     {'error': '...'}
+Clients send {'body': '...'} to post a message.
+
+HTTP requests are passed to `http_app` (by default the Flask app through
+asgiref's WSGI adapter if it is installed), so one server can serve both.
+"""
+
+import asyncio
+import functools
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from studyonline.realtime.auth import authenticate, same_origin
+from studyonline.realtime.broker import make_broker
+from studyonline.realtime.messages import save_message
+
+ROOM_PATH = re.compile(r'^/ws/room/(?P<pk>\d+)$')
+
+# websocket close codes, 4000-4999 are free for applications
+CLOSE_NOT_FOUND = 4404
+CLOSE_FORBIDDEN = 4403
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_TOO_SLOW = 4408
+# standard code for a server-side failure
+CLOSE_SERVER_ERROR = 1011
+
+
+def room_channel(room_id):
+    return f'room:{room_id}'
+
+
+class RealtimeApp:
+
+    def __init__(self, flask_app, broker=None, http_app=None):
+        self.flask_app = flask_app
+        self.broker = broker if broker is not None else make_broker(flask_app)
+        self.http_app = http_app
+        self.max_body = flask_app.config['REALTIME_MESSAGE_MAX']
+        self.executor = ThreadPoolExecutor(
+            max_workers=flask_app.config['REALTIME_DB_WORKERS'],
+            thread_name_prefix='realtime-db'
+        )
+        self._started = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'websocket':
+            await self._websocket(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif self.http_app is not None:
+            await self.http_app(scope, receive, send)
+        else:
+            await send({'type': 'http.response.start', 'status': 404,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Not Found'})
+
+    async def _start(self):
+        if not self._started:
+            self._started = True
+            await self.broker.start()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            event = await receive()
+            if event['type'] == 'lifespan.startup':
+                await self._start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif event['type'] == 'lifespan.shutdown':
+                await self.broker.stop()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _with_app_context(self, fn, *args):
+        with self.flask_app.app_context():
+            return fn(*args)
+
+    async def _in_thread(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._with_app_context, fn, *args)
+        )
+
+    async def _websocket(self, scope, receive, send):
+        event = await receive()
+        if event['type'] != 'websocket.connect':
+            return
+        match = ROOM_PATH.match(scope['path'])
+        if match is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+            return
+        if not same_origin(scope):
+            await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+            return
+
+        await self._start()
+        room_id = int(match.group('pk'))
+        user = await self._in_thread(authenticate, self.flask_app, scope, room_id)
+        if user is None:
+            await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+            return
+        await send({'type': 'websocket.accept'})
+
+        channel = room_channel(room_id)
+        subscription = await self.broker.subscribe(channel)
+        sender = asyncio.ensure_future(self._send_loop(subscription, send))
+        try:
+            if await self.broker.presence_add(channel, user):
+                await self.broker.publish(channel, {'type': 'join', 'user': user})
+            subscription.put(json.dumps({'type': 'presence', 'users': await self.broker.presence(channel)}))
+            await self._receive_loop(receive, subscription, room_id, user)
+        except Exception:
+            # a failed save or broker call: tell the client rather than
+            # leaving a socket that silently stopped working
+            self.flask_app.logger.exception('realtime connection to room %s failed', room_id)
+            sender.cancel()
+            try:
+                await send({'type': 'websocket.close', 'code': CLOSE_SERVER_ERROR})
+            except Exception:
+                pass
+        finally:
+            sender.cancel()
+            await self.broker.unsubscribe(subscription)
+            if await self.broker.presence_remove(channel, user):
+                await self.broker.publish(channel, {'type': 'leave', 'user': user})
+
+    async def _send_loop(self, subscription, send):
+        try:
+            while True:
+                data = await subscription.queue.get()
+                if data is None:
+                    await send({'type': 'websocket.close', 'code': CLOSE_TOO_SLOW})
+                    return
+                await send({'type': 'websocket.send', 'text': data})
+        except Exception:
+            # the client went away mid-send; the receive loop gets the
+            # disconnect and cleans up
+            return
+
+    async def _receive_loop(self, receive, subscription, room_id, user):
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                return
+            if event['type'] != 'websocket.receive':
+                continue
+            try:
+                data = json.loads(event.get('text') or event.get('bytes') or b'')
+                body = str(data.get('body', '')).strip()
+            except (ValueError, AttributeError):
+                body = ''
+            if not body or len(body) > self.max_body:
+                subscription.put(json.dumps({
+                    'type': 'error',
+                    'error': f'messages must be 1 to {self.max_body} characters'
+                }))
+                continue
+            message = await self._in_thread(save_message, room_id, user, body)
+            await self.broker.publish(room_channel(room_id), message)
+
+
+def create_asgi_app(flask_app, broker=None):
+    """
+    RealtimeApp for `flask_app`, serving its HTTP pages as well when asgiref
+    is installed. Without it, run the Flask app under a WSGI server as usual
+    and route /ws/ to this app.
+    """
+
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError:
+        http_app = None
+    else:
+        http_app = WsgiToAsgi(flask_app)
+    return RealtimeApp(flask_app, broker=broker, http_app=http_app)
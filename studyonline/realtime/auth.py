@@ -0,0 +1,58 @@
+"""
+Websocket authentication with the regular Flask-Login session.
+
+The browser sends the same cookies on the websocket handshake as on any
+page, so the handshake headers are replayed through a Flask request context
+and Flask-Login resolves current_user exactly as it would for a view
+(session cookie, remember-me cookie, session protection). These functions
+are synchronous and touch the database; the ASGI app runs them in a worker
+thread.
+"""
+
+from urllib.parse import urlsplit
+from flask_login import current_user
+
+
+def _header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def same_origin(scope):
+    """
+    Browsers attach cookies to cross-site websocket handshakes too, so a page
+    on another site could open a socket as the logged-in user unless the
+    Origin is checked against the Host.
+    """
+
+    origin = _header(scope, b'origin')
+    if origin is None:
+        # not a browser
+        return True
+    return urlsplit(origin).netloc == _header(scope, b'host')
+
+
+def _environ_base(scope):
+    client = scope.get('client') or ('', 0)
+    return {'REMOTE_ADDR': client[0]}
+
+
+def authenticate(app, scope, room_id):
+    """
+    Returns the connecting user as a dict (id, username), or None
+    if they aren't logged in or the room doesn't exist.
+    """
+
+    from studyonline import db
+    from studyonline.models import Room
+
+    headers = [(key.decode('latin-1'), value.decode('latin-1')) for key, value in scope.get('headers', ())]
+    with app.test_request_context(scope.get('path', '/'), headers=headers,
+                                  environ_base=_environ_base(scope)):
+        if not current_user.is_authenticated:
+            return None
+        if not db.session.query(db.exists().where(Room.id == room_id)).scalar():
+            return None
+        return {'id': current_user.id, 'username': current_user.username}
@@ -0,0 +1,265 @@
+"""
+Pub/sub brokers for the realtime layer.
+
+Every broker fans a published message out to the subscribers in this
+process through one bounded asyncio.Queue per connection, and keeps room
+presence (who is connected, counting each user once however many tabs
+they have open).
+
+InProcessBroker  everything in this process's memory. Tests, benchmarks
+                 and single-process deployments.
+RedisBroker      publishes through Redis so every process sees every
+                 message; presence is a Redis hash per room. Each process
+                 holds a single pub/sub connection however many websockets
+                 it serves.
+
+REALTIME_BROKER picks one: 'memory' or a redis:// url, like CACHE_STORE.
+"""
+
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    One connection's view of a channel. `queue` holds encoded messages,
+    or None once the client fell too far behind and has to be dropped.
+    """
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, data):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # a client this far behind is gone or too slow to keep up; drop it
+            # rather than buffering without bound
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class Broker(ABC):
+    """
+    Local fan-out shared by the broker implementations.
+    """
+
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscriber_count(self, channel=None):
+        if channel is not None:
+            return len(self._subscribers.get(channel, ()))
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    async def subscribe(self, channel):
+        subscription = Subscription(channel, self.queue_size)
+        self._subscribers[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        subscribers = self._subscribers.get(subscription.channel)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.channel]
+
+    def _deliver(self, channel, data):
+        """
+        Hands one already-encoded message to every local subscriber, so a
+        broadcast is encoded once however many connections receive it.
+        """
+
+        for subscription in tuple(self._subscribers.get(channel, ())):
+            subscription.put(data)
+
+    @abstractmethod
+    async def publish(self, channel, message):
+        """
+        Sends `message` (JSON-serializable) to every subscriber of the
+        channel, in every process.
+        """
+
+    @abstractmethod
+    async def presence_add(self, channel, user):
+        """
+        Registers one connection of `user` (a dict with at least 'id').
+        Returns True if that is the user's first connection to the channel.
+        """
+
+    @abstractmethod
+    async def presence_remove(self, channel, user):
+        """
+        Returns True if that was the user's last connection to the channel.
+        """
+
+    @abstractmethod
+    async def presence(self, channel):
+        """
+        The users connected to the channel, as the dicts given to presence_add.
+        """
+
+
+class InProcessBroker(Broker):
+
+    def __init__(self, queue_size=64):
+        super().__init__(queue_size)
+        self._connections = defaultdict(Counter)
+        self._users = defaultdict(dict)
+
+    async def publish(self, channel, message):
+        self._deliver(channel, json.dumps(message))
+
+    async def presence_add(self, channel, user):
+        self._users[channel][user['id']] = user
+        self._connections[channel][user['id']] += 1
+        return self._connections[channel][user['id']] == 1
+
+    async def presence_remove(self, channel, user):
+        connections = self._connections[channel]
+        connections[user['id']] -= 1
+        if connections[user['id']] > 0:
+            return False
+        del connections[user['id']]
+        self._users[channel].pop(user['id'], None)
+        if not connections:
+            del self._connections[channel]
+            del self._users[channel]
+        return True
+
+    async def presence(self, channel):
+        return list(self._users.get(channel, {}).values())
+
+
+class RedisBroker(Broker):
+    """
+    Needs redis-py 4.2+ (redis.asyncio).
+
+    Presence counts live in the hash presence:<channel> (user id -> open
+    connections) with the user details in presence:<channel>:users. A process
+    that dies without cleaning up leaves its counts behind until the hash
+    expires, PRESENCE_TTL seconds after the channel was last touched.
+    """
+
+    PRESENCE_TTL = 3600
+    # the reader waits this long (doubling up to READER_RETRY_MAX) after an error
+    READER_RETRY = 0.5
+    READER_RETRY_MAX = 30
+
+    def __init__(self, url, queue_size=64):
+        super().__init__(queue_size)
+        self.url = url
+        self._redis = None
+        self._pubsub = None
+        self._reader = None
+
+    async def start(self):
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.Redis.from_url(self.url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
+
+    async def _read(self):
+        """
+        Delivers what arrives on the pub/sub connection until stop(). An
+        error (Redis restarting, a dropped connection) is logged and the
+        loop carries on after a pause; redis-py reconnects and subscribes
+        again to the channels on the next read, so this process doesn't go
+        deaf for the rest of its life.
+        """
+
+        delay = self.READER_RETRY
+        while True:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.05)
+                    continue
+                message = await self._pubsub.get_message(timeout=1.0)
+                delay = self.READER_RETRY
+                if message is not None:
+                    data = message['data']
+                    self._deliver(message['channel'].decode(), data.decode() if isinstance(data, bytes) else data)
+            except Exception:
+                logger.exception('realtime pub/sub reader failed, retrying in %.1fs', delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.READER_RETRY_MAX)
+
+    async def subscribe(self, channel):
+        first = not self._subscribers.get(channel)
+        subscription = await super().subscribe(channel)
+        if first:
+            await self._pubsub.subscribe(channel)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        await super().unsubscribe(subscription)
+        if not self._subscribers.get(subscription.channel):
+            await self._pubsub.unsubscribe(subscription.channel)
+
+    async def publish(self, channel, message):
+        await self._redis.publish(channel, json.dumps(message))
+
+    async def presence_add(self, channel, user):
+        key = f'presence:{channel}'
+        pipe = self._redis.pipeline()
+        pipe.hincrby(key, user['id'], 1)
+        pipe.hset(f'{key}:users', user['id'], json.dumps(user))
+        pipe.expire(key, self.PRESENCE_TTL)
+        pipe.expire(f'{key}:users', self.PRESENCE_TTL)
+        count, *_ = await pipe.execute()
+        return count == 1
+
+    async def presence_remove(self, channel, user):
+        key = f'presence:{channel}'
+        count = await self._redis.hincrby(key, user['id'], -1)
+        if count > 0:
+            return False
+        pipe = self._redis.pipeline()
+        pipe.hdel(key, user['id'])
+        pipe.hdel(f'{key}:users', user['id'])
+        await pipe.execute()
+        return True
+
+    async def presence(self, channel):
+        users = await self._redis.hvals(f'presence:{channel}:users')
+        return [json.loads(user) for user in users]
+
+
+def make_broker(app):
+    """
+    The broker configured by REALTIME_BROKER: 'memory' or a redis:// url.
+    """
+
+    url = app.config['REALTIME_BROKER']
+    queue_size = app.config['REALTIME_QUEUE_SIZE']
+    if url == 'memory':
+        return InProcessBroker(queue_size)
+    return RedisBroker(url, queue_size)
@@ -0,0 +1,69 @@
+"""
+Storing and paging room chat messages.
+
+History pages backwards by id over the (room_id, id) index: the client asks
+for messages before the oldest id it has, so every page costs the same
+however far back it goes.
+"""
+
+from datetime import datetime
+from studyonline import db
+from studyonline.models import Message, User
+
+
+def serialize(message_id, room_id, user_id, username, body, date_created):
+    return {
+        'type': 'message',
+        'id': message_id,
+        'room_id': room_id,
+        'user': {'id': user_id, 'username': username},
+        'body': body,
+        'date': date_created.isoformat() + 'Z',
+    }
+
+
+def save_message(room_id, user, body):
+    """
+    Inserts one message and returns it serialized for broadcasting.
+    """
+
+    now = datetime.utcnow()
+    result = db.session.execute(Message.__table__.insert().values(
+        room_id=room_id,
+        user_id=user['id'],
+        body=body,
+        date_created=now
+    ))
+    db.session.commit()
+    return serialize(result.inserted_primary_key[0], room_id, user['id'], user['username'], body, now)
+
+
+def history(room_id, before=None, limit=50):
+    """
+    Up to `limit` messages older than id `before` (newest if None), oldest
+    first, and the id to pass as `before` for the page before that (None at
+    the start of the room).
+    """
+
+    query = (
+        db.session.query(Message.id, Message.room_id, Message.user_id, User.username,
+                         Message.body, Message.date_created)
+        .join(User, User.id == Message.user_id)
+        .filter(Message.room_id == room_id)
+    )
+    if before is not None:
+        query = query.filter(Message.id < before)
+    rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+
+    older = len(rows) > limit
+    rows = rows[:limit]
+    messages = [serialize(*row) for row in reversed(rows)]
+    return messages, (rows[-1].id if older else None)
+
+
+def remove_room_messages(room_id):
+    """
+    Drops a room's messages, used before the room itself is deleted.
+    """
+
+    db.session.execute(Message.__table__.delete().where(Message.room_id == room_id))
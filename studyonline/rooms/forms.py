@@ -24,4 +24,12 @@ class CreateRoomForm(FlaskForm):
                     DataRequired()
                 ]
     )
-    submit = SubmitField('Create Room')
\ No newline at end of file
+    submit = SubmitField('Create Room')
+
+class MembershipForm(FlaskForm):
+    """
+    'Membership' form - only carries the CSRF token.
+    Join/leave buttons post it to rooms.join_room / rooms.leave_room.
+    """
+
+    submit = SubmitField('Join')
@@ -0,0 +1,81 @@
+"""
+Joining and leaving rooms.
+
+room_membership is the source of truth and Room.total_members a counter
+kept in step with it in the same transaction. The counter is changed with
+    UPDATE room SET total_members = total_members + 1
+so concurrent joins never lose an update, and it only moves when the
+membership row was really inserted or deleted, so a double-clicked join or
+two racing leaves can't push it out of step.
+"""
+
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from studyonline import db
+from studyonline.models import Room, room_membership
+
+
+def _bump(room_id, delta):
+    db.session.execute(
+        Room.__table__.update()
+        .where(Room.id == room_id)
+        .values(total_members=Room.total_members + delta)
+    )
+
+
+def join(room_id, user_id):
+    """
+    Returns True if the user joined, False if they already were a member.
+    """
+
+    try:
+        db.session.execute(room_membership.insert().values(
+            room_id=room_id,
+            user_id=user_id,
+            joined_at=datetime.utcnow()
+        ))
+        _bump(room_id, 1)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def leave(room_id, user_id):
+    """
+    Returns True if the user left, False if they weren't a member.
+    """
+
+    result = db.session.execute(room_membership.delete().where(
+        room_membership.c.room_id == room_id,
+        room_membership.c.user_id == user_id
+    ))
+    if result.rowcount:
+        _bump(room_id, -1)
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def joined_room_ids(user_id, room_ids):
+    """
+    Which of `room_ids` the user is a member of, from the (user_id, room_id) index.
+    """
+
+    if not room_ids:
+        return set()
+    rows = db.session.execute(
+        db.select(room_membership.c.room_id).where(
+            room_membership.c.user_id == user_id,
+            room_membership.c.room_id.in_(room_ids)
+        )
+    )
+    return {row[0] for row in rows}
+
+
+def remove_room_members(room_id):
+    """
+    Drops a room's membership rows, used before the room itself is deleted.
+    """
+
+    db.session.execute(room_membership.delete().where(room_membership.c.room_id == room_id))
@@ -1,24 +1,36 @@
-import time
-from flask import Blueprint, render_template, redirect, url_for, abort, flash, request
+from flask import Blueprint, render_template, redirect, url_for, abort, flash, request, jsonify, current_app
 from studyonline import db
+from studyonline.database import read_only
 from flask_login import current_user, login_required
-from studyonline.models import Room, User
-from studyonline.rooms.forms import CreateRoomForm
+from studyonline.models import Room, Topic, User, room_membership
+from studyonline.rooms.forms import CreateRoomForm, MembershipForm
+from studyonline.rooms import membership, topics
+from studyonline.pagination import keyset_paginate
+from studyonline.main.utils import rooms_changed
+from studyonline.users.cache import user_cache
+from studyonline import counters, timeline
+from studyonline.rooms.search import search_rooms
+from studyonline.realtime import messages
 
 
 rooms = Blueprint('rooms', __name__)
 
 @rooms.route('/room/<int:pk>')
 @login_required
+@read_only
 def room(pk):
     """
     Different rooms created by users.
     """
-    room = Room.query.get_or_404(pk)
+    room = Room.query.options(db.joinedload(Room.creator)).get_or_404(pk)
+    members = room.members.order_by(room_membership.c.joined_at).limit(50).all()
+    is_member = bool(membership.joined_room_ids(current_user.id, [room.id]))
 
-    return render_template('room.html',title='Room', room=room)
+    return render_template('room.html',title='Room', room=room, members=members,
+                           is_member=is_member, membership_form=MembershipForm())
 
 @rooms.route('/create_room', methods=['GET', 'POST'])
+@login_required
 def create_room():
     """
     This will create a new room.
@@ -26,9 +38,14 @@ def create_room():
     form= CreateRoomForm()
     if form.validate_on_submit():
         room = Room(topic=form.topic.data, description=form.description.data, creator=current_user)
+        topics.set_topic(room, room.topic)
         db.session.add(room)
+        db.session.flush()
+        timeline.fan_out(room)
+        counters.bump_user_rooms(current_user.id, 1)
         db.session.commit()
-        time.sleep(1)
+        user_cache.invalidate(current_user.id)
+        rooms_changed()
         flash('Room Created!', 'success')
         return redirect(url_for('main.home'))
         
@@ -49,8 +66,10 @@ def update_room(pk):
     form = CreateRoomForm()
     if form.validate_on_submit():
         room.topic = form.topic.data
+        topics.set_topic(room, room.topic)
         room.description = form.description.data
         db.session.commit()
+        rooms_changed()
         flash('Room Updated!', 'success')
         return redirect(url_for('main.home'))
 
@@ -71,28 +90,108 @@ def delete_room(pk):
     if room.creator != current_user:
         abort(403)
     
+    membership.remove_room_members(room.id)
+    messages.remove_room_messages(room.id)
+    timeline.remove_room(room.id)
+    topics.release(room)
     db.session.delete(room)
+    counters.bump_user_rooms(current_user.id, -1)
     db.session.commit()
-    time.sleep(1)
+    user_cache.invalidate(current_user.id)
+    rooms_changed()
     flash('Room deleted!', 'success')
     return redirect(url_for('main.home'))
 
+@rooms.route('/topic/<path:name>')
+@read_only
+def topic(name):
+    """
+    Rooms of one topic, newest first.
+    The room count comes from Topic.room_count, no COUNT(*).
+    """
+    topic = Topic.query.filter_by(name=topics.normalize(name)).first_or_404()
+    cursor = request.args.get('cursor')
+    query = Room.query.options(db.joinedload(Room.creator)).filter_by(topic_id=topic.id)
+    rooms = keyset_paginate(query, Room.date_created, Room.id, cursor=cursor, per_page=5,
+                            total=topic.room_count)
+    return render_template('topic.html', title=topic.name, topic=topic, rooms=rooms)
+
+@rooms.route('/room/<int:pk>/join', methods=['POST'])
+@login_required
+def join_room(pk):
+    """
+    Current user joins a room (not their own).
+    """
+
+    form = MembershipForm()
+    if not form.validate_on_submit():
+        abort(400)
+    room = Room.query.get_or_404(pk)
+    if room.creator == current_user:
+        flash('You host this room.', 'info')
+    elif membership.join(room.id, current_user.id):
+        rooms_changed()
+        flash('Joined the room!', 'success')
+    return redirect(request.referrer or url_for('rooms.room', pk=pk))
+
+@rooms.route('/room/<int:pk>/leave', methods=['POST'])
+@login_required
+def leave_room(pk):
+    """
+    Current user leaves a room they joined.
+    """
+
+    form = MembershipForm()
+    if not form.validate_on_submit():
+        abort(400)
+    Room.query.get_or_404(pk)
+    if membership.leave(pk, current_user.id):
+        rooms_changed()
+        flash('Left the room.', 'info')
+    return redirect(request.referrer or url_for('rooms.room', pk=pk))
+
+@rooms.route('/room/<int:pk>/messages')
+@login_required
+@read_only
+def room_messages(pk):
+    """
+    A page of chat history as JSON, oldest first. Pass the returned `before`
+    back to get the page before it.
+    """
+
+    if not db.session.query(db.exists().where(Room.id == pk)).scalar():
+        abort(404)
+    page, before = messages.history(pk, before=request.args.get('before', type=int),
+                                    limit=current_app.config['REALTIME_HISTORY_PAGE'])
+    return jsonify(messages=page, before=before)
+
 @rooms.route('/search_email',methods=['POST'])
+@read_only
 def search_email():
     """
     Lists all rooms of a user if email provided.
     """
     email = request.form.get('input-email')
 
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     user = User.query.filter_by(email=email).first()
     
     if user:
-        rooms = Room.query.filter_by(creator=user)\
-                .order_by(Room.date_created.desc())\
-                    .paginate(per_page=5, page=page)
+        # every room's creator is `user`, already in the session's identity map,
+        # so room.creator in the template resolves without another query
+        rooms = keyset_paginate(Room.query.filter_by(creator=user), Room.date_created, Room.id,
+                                cursor=cursor, per_page=5, total=user.room_count)
         return render_template('user_rooms.html', rooms=rooms, user=user)
     return render_template('common.html', message="No such email found.")
 
-    
-    
\ No newline at end of file
+@rooms.route('/search')
+@read_only
+def search():
+    """
+    Full-text search over room topics and descriptions, best match first.
+    """
+    query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    results = search_rooms(query, page=page, per_page=5)
+
+    return render_template('search.html', title='Search', query=query, results=results)
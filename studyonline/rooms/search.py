@@ -0,0 +1,139 @@
+"""
+Full-text search over Room.topic and Room.description
+
+SQLite: an external-content FTS5 table (room_fts) kept in sync with room by
+triggers and ranked with bm25().
+Postgres: a generated tsvector column on room with a GIN index, ranked with
+ts_rank().
+Any other database falls back to a LIKE scan.
+
+The DDL is attached to the room table so db.create_all() builds the index
+too; the Alembic migration carries its own copy for existing databases.
+"""
+
+import re
+from sqlalchemy import DDL, event, text
+from studyonline import db
+from studyonline.models import Room
+
+# topic hits count double compared to description hits
+TOPIC_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS room_fts USING fts5("
+    "topic, description, content='room', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS room_fts_ai AFTER INSERT ON room BEGIN "
+    "INSERT INTO room_fts(rowid, topic, description) "
+    "VALUES (new.id, new.topic, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS room_fts_ad AFTER DELETE ON room BEGIN "
+    "INSERT INTO room_fts(room_fts, rowid, topic, description) "
+    "VALUES ('delete', old.id, old.topic, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS room_fts_au AFTER UPDATE OF topic, description ON room BEGIN "
+    "INSERT INTO room_fts(room_fts, rowid, topic, description) "
+    "VALUES ('delete', old.id, old.topic, old.description); "
+    "INSERT INTO room_fts(rowid, topic, description) "
+    "VALUES (new.id, new.topic, new.description); END",
+]
+
+POSTGRES_DDL = [
+    "ALTER TABLE room ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(topic, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    ") STORED",
+    "CREATE INDEX IF NOT EXISTS ix_room_search_vector ON room USING gin (search_vector)",
+]
+
+for statement in SQLITE_DDL:
+    event.listen(Room.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(Room.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS room_fts').execute_if(dialect='sqlite'))
+for statement in POSTGRES_DDL:
+    event.listen(Room.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())[:8]
+
+
+def _fts5_query(terms):
+    """
+    Every term must match, each one as a prefix ("flas" finds "flask").
+    Terms are quoted so user input can't inject FTS5 operators.
+    """
+
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _ranked_ids(terms, limit, offset):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # every match is scored; `rank MATCH` sets this query's bm25() column
+        # weights and ORDER BY rank lets FTS5 sort by it internally
+        sql = text(
+            "SELECT rowid FROM room_fts "
+            "WHERE room_fts MATCH :match AND rank MATCH :rank "
+            "ORDER BY rank, rowid DESC "
+            "LIMIT :limit OFFSET :offset"
+        )
+        params = {'match': _fts5_query(terms), 'rank': f'bm25({TOPIC_WEIGHT}, {DESCRIPTION_WEIGHT})'}
+    elif dialect == 'postgresql':
+        sql = text(
+            "SELECT id FROM room, to_tsquery('english', :match) AS query "
+            "WHERE search_vector @@ query "
+            "ORDER BY ts_rank(search_vector, query) DESC, id DESC "
+            "LIMIT :limit OFFSET :offset"
+        )
+        params = {'match': ' & '.join(f'{term}:*' for term in terms)}
+    else:
+        return like_search_ids(terms, limit, offset)
+
+    params.update(limit=limit, offset=offset)
+    return [row[0] for row in db.session.execute(sql, params)]
+
+
+def like_search_ids(terms, limit, offset):
+    """
+    The naive scan: every term must appear somewhere in topic or description.
+    Used on databases without a full-text index, and as the benchmark baseline.
+    """
+
+    query = db.session.query(Room.id)
+    for term in terms:
+        pattern = f'%{term}%'
+        query = query.filter(db.or_(Room.topic.ilike(pattern), Room.description.ilike(pattern)))
+    return [row[0] for row in query.order_by(Room.id.desc()).limit(limit).offset(offset)]
+
+
+class SearchPage:
+    """
+    One page of ranked search results.
+    Ranked results have no stable keyset, so they page by number.
+    """
+
+    def __init__(self, items, page, has_next):
+        self.items = items
+        self.page = page
+        self.has_next = has_next
+        self.has_prev = page > 1
+
+
+def search_rooms(query, page=1, per_page=5):
+    """
+    Returns a SearchPage of rooms matching every word in `query`, best match first.
+    """
+
+    terms = _terms(query)
+    page = max(page, 1)
+    if not terms:
+        return SearchPage([], page, False)
+
+    ids = _ranked_ids(terms, per_page + 1, (page - 1) * per_page)
+    has_next = len(ids) > per_page
+    ids = ids[:per_page]
+    if not ids:
+        return SearchPage([], page, False)
+
+    rooms = Room.query.options(db.joinedload(Room.creator)).filter(Room.id.in_(ids)).all()
+    by_id = {room.id: room for room in rooms}
+    return SearchPage([by_id[pk] for pk in ids if pk in by_id], page, has_next)
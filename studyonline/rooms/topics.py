@@ -0,0 +1,114 @@
+"""
+Room topics.
+
+Topic has one row per normalized topic name and Room.topic_id points at it,
+while Room.topic keeps the name as its creator typed it. Topic.room_count is
+a counter kept in step with the rooms in the same transaction as the room
+write, with
+    UPDATE topic SET room_count = room_count + 1
+like Room.total_members (rooms/membership.py). The top topics sidebar reads
+the first rows of the (room_count, id) index instead of grouping every room
+on each page load.
+"""
+
+from collections import Counter
+from studyonline import db
+from studyonline.models import Topic
+
+
+def normalize(name):
+    """
+    The Topic.name for what a user typed, None for a blank topic.
+    """
+
+    name = (name or '').strip().lower()[:20]
+    return name or None
+
+
+def _bump(topic_id, delta):
+    db.session.execute(
+        Topic.__table__.update()
+        .where(Topic.id == topic_id)
+        .values(room_count=Topic.room_count + delta)
+    )
+
+
+def _insert_missing(names):
+    """
+    INSERT that skips names another request created in the meantime, so two
+    rooms racing to introduce the same topic don't fail on the unique name.
+    """
+
+    table = Topic.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).on_conflict_do_nothing(index_elements=['name'])
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table).on_conflict_do_nothing(index_elements=['name'])
+    else:
+        statement = table.insert().prefix_with('IGNORE')
+    db.session.execute(statement, [{'name': name, 'room_count': 0} for name in names])
+
+
+def topic_ids(names):
+    """
+    {name: Topic.id} for normalized `names`, creating the missing topics.
+    """
+
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(db.session.query(Topic.name, Topic.id).filter(Topic.name.in_(names)))
+    missing = names - ids.keys()
+    if missing:
+        _insert_missing(missing)
+        ids.update(db.session.query(Topic.name, Topic.id).filter(Topic.name.in_(missing)))
+    return ids
+
+
+def set_topic(room, name):
+    """
+    Links `room` to the topic `name` and moves the room counts, for a new
+    room as well as an edited one. The caller commits.
+    """
+
+    name = normalize(name)
+    with db.session.no_autoflush:
+        topic_id = topic_ids([name])[name] if name else None
+    if topic_id == room.topic_id:
+        return
+    if room.topic_id is not None:
+        _bump(room.topic_id, -1)
+    if topic_id is not None:
+        _bump(topic_id, 1)
+    room.topic_id = topic_id
+
+
+def release(room):
+    """
+    Takes a room that is about to be deleted off its topic's count.
+    """
+
+    if room.topic_id is not None:
+        _bump(room.topic_id, -1)
+
+
+def add_rooms(topic_ids):
+    """
+    Counts rooms inserted in bulk, one UPDATE per distinct topic.
+    """
+
+    for topic_id, count in Counter(topic_id for topic_id in topic_ids if topic_id is not None).items():
+        _bump(topic_id, count)
+
+
+def top_topics(limit=10):
+    """
+    The topics with the most rooms, read off ix_topic_room_count_id.
+    """
+
+    return (Topic.query.filter(Topic.room_count > 0)
+            .order_by(Topic.room_count.desc(), Topic.id.desc())
+            .limit(limit).all())
@@ -1,4 +1,12 @@
-function changeColorAndTest(color, a) {
-    document.getElementById('select').style.background = color;
-    document.getElementById('select').innerHTML = 'Joined';
-}
+// Flash messages are rendered by the redirect target right after a write
+// commits; fade them out in the browser instead of holding the request.
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('.flash-message').forEach(function (flash) {
+        var delay = parseInt(flash.dataset.dismissAfter, 10);
+        if (delay > 0) {
+            setTimeout(function () {
+                flash.classList.add('flash-hidden');
+            }, delay);
+        }
+    });
+});
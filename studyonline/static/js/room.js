@@ -0,0 +1,100 @@
+// Live room: who is online, chat messages and history.
+// The socket reuses the page's login cookie and reconnects with a backoff.
+(function () {
+    var chat = document.getElementById('room-chat');
+    if (!chat) {
+        return;
+    }
+    var online = document.getElementById('room-online');
+    var list = document.getElementById('room-messages');
+    var older = document.getElementById('room-older');
+    var form = document.getElementById('room-send');
+    var input = form.elements.body;
+    var users = {};
+    var before = null;
+    var socket = null;
+    var retry = 1000;
+
+    function messageItem(message) {
+        var item = document.createElement('li');
+        var who = document.createElement('strong');
+        who.textContent = '@' + message.user.username + ' ';
+        item.appendChild(who);
+        item.appendChild(document.createTextNode(message.body));
+        item.title = new Date(message.date).toLocaleString();
+        return item;
+    }
+
+    function renderOnline() {
+        online.textContent = '';
+        Object.keys(users).forEach(function (id) {
+            var item = document.createElement('li');
+            item.textContent = '@' + users[id].username;
+            online.appendChild(item);
+        });
+    }
+
+    function loadHistory() {
+        var url = chat.dataset.historyUrl + (before ? '?before=' + before : '');
+        return fetch(url, {credentials: 'same-origin'})
+            .then(function (response) { return response.json(); })
+            .then(function (page) {
+                var first = list.firstChild;
+                page.messages.forEach(function (message) {
+                    list.insertBefore(messageItem(message), first);
+                });
+                before = page.before;
+                older.hidden = !before;
+            });
+    }
+
+    function connect() {
+        var scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+        socket = new WebSocket(scheme + location.host + chat.dataset.socketPath);
+        socket.onopen = function () {
+            retry = 1000;
+            input.disabled = false;
+        };
+        socket.onmessage = function (event) {
+            var data = JSON.parse(event.data);
+            if (data.type === 'presence') {
+                users = {};
+                data.users.forEach(function (user) { users[user.id] = user; });
+                renderOnline();
+            } else if (data.type === 'join') {
+                users[data.user.id] = data.user;
+                renderOnline();
+            } else if (data.type === 'leave') {
+                delete users[data.user.id];
+                renderOnline();
+            } else if (data.type === 'message') {
+                list.appendChild(messageItem(data));
+                list.scrollTop = list.scrollHeight;
+            }
+        };
+        socket.onclose = function (event) {
+            input.disabled = true;
+            // 4401/4403/4404: not logged in, wrong origin or no such room
+            if (event.code >= 4401 && event.code <= 4404) {
+                return;
+            }
+            setTimeout(connect, retry);
+            retry = Math.min(retry * 2, 30000);
+        };
+    }
+
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        var body = input.value.trim();
+        if (body && socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({body: body}));
+            input.value = '';
+        }
+    });
+    older.addEventListener('click', loadHistory);
+
+    loadHistory().then(function () {
+        list.scrollTop = list.scrollHeight;
+    });
+    connect();
+})();
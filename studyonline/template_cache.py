@@ -0,0 +1,57 @@
+"""
+Jinja bytecode cache
+
+Jinja compiles each template to Python source and then to bytecode the first
+time a process renders it, so every fresh worker pays for layout.html,
+header.html and the page templates on its first requests. With
+TEMPLATE_BYTECODE_CACHE on, compiled templates are kept in
+TEMPLATE_CACHE_DIR (default <instance folder>/jinja_cache) and loaded from
+there by every later process. `flask compile-templates` fills the cache at
+build time so even the first worker after a deploy starts warm.
+
+Entries are keyed by template name and source checksum, so an edited
+template is recompiled rather than served stale. The bytecode is specific to
+the Python version: run the command with the interpreter the app runs on.
+
+Template auto-reload (checking every template file for changes on each
+render) stays Flask's default, on only in debug mode.
+"""
+
+import os
+import time
+from jinja2 import FileSystemBytecodeCache
+
+
+def cache_dir(app):
+    return app.config['TEMPLATE_CACHE_DIR'] or os.path.join(app.instance_path, 'jinja_cache')
+
+
+def init_app(app):
+    """
+    Must run before anything touches app.jinja_env (registering blueprints
+    with template filters does), as the environment is built from
+    app.jinja_options on first use.
+    """
+
+    if not app.config.get('TEMPLATE_BYTECODE_CACHE'):
+        return
+    directory = cache_dir(app)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as error:
+        app.logger.warning('template bytecode cache disabled, cannot create %s: %s', directory, error)
+        return
+    app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(directory)}
+
+
+def compile_all(app):
+    """
+    Loads every template once so each one is compiled into the bytecode
+    cache. Returns (template names, seconds).
+    """
+
+    started = time.perf_counter()
+    names = [name for name in app.jinja_env.list_templates() if name.endswith('.html')]
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names, time.perf_counter() - started
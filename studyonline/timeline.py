@@ -0,0 +1,257 @@
+"""
+Personal home timelines, fanned out on write
+
+Every user has a precomputed timeline: the ids of the newest rooms of the
+users they follow (and their own), in timeline_entry. When a room is
+created, fan_out() pushes it to its creator's followers in the same
+transaction, with two set-based statements however many followers there
+are:
+
+    UPDATE user SET timeline_seq = timeline_seq + 1 WHERE id IN (followers)
+    INSERT INTO timeline_entry SELECT id, timeline_seq % TIMELINE_SIZE, ...
+        FROM user WHERE id IN (followers) ON CONFLICT (user_id, slot) DO UPDATE
+
+A timeline is a ring of TIMELINE_SIZE slots, the next push overwrites the
+oldest entry, so it stays bounded without ever being trimmed. Reading a page
+is then one range scan of the (user_id, date_created, room_id) index and a
+lookup of the rooms by id, however many users are followed.
+
+Creators with more than TIMELINE_FANOUT_LIMIT followers would make room
+creation write that many rows, so their rooms are only pushed to their own
+timeline and are pulled in when a follower reads (fan-out-on-read): the
+reader's followed creators among celebrities() each contribute their newest
+rooms past the cursor from ix_room_user_id_date_created_id, merged with the
+pushed entries. Who counts as such a creator is cached for
+TIMELINE_CELEBRITY_TTL seconds, so for that long after crossing the limit
+a creator's new rooms may be missing from timelines.
+
+Rooms created outside the app (bulk imports) aren't fanned out,
+`flask rebuild-timelines` recomputes timelines from the follows.
+"""
+
+from itertools import chain
+from flask import current_app
+from studyonline import db
+from studyonline.models import Room, TimelineEntry, User, follow
+from studyonline.pagination import CountCache, KeysetPage, PREV, decode_cursor, keyset_range
+
+# creators whose rooms are pulled at read time
+stars = CountCache()
+
+
+def init_app(app):
+    stars.ttl = app.config['TIMELINE_CELEBRITY_TTL']
+
+
+def celebrities():
+    """
+    Ids of the users with more than TIMELINE_FANOUT_LIMIT followers, from the
+    (follower_count) index.
+    """
+
+    limit = current_app.config['TIMELINE_FANOUT_LIMIT']
+    return stars.get('celebrities', lambda: frozenset(
+        pk for pk, in db.session.query(User.id).filter(User.follower_count > limit)
+    ))
+
+
+def _upsert(statement):
+    """
+    Turns an INSERT into timeline_entry into one that overwrites the entry
+    already in the slot.
+    """
+
+    dialect = db.engine.dialect.name
+    columns = ('room_id', 'creator_id', 'date_created')
+    if dialect in ('postgresql', 'sqlite'):
+        return statement.on_conflict_do_update(
+            index_elements=['user_id', 'slot'],
+            set_={name: statement.excluded[name] for name in columns}
+        )
+    return statement.on_duplicate_key_update({name: statement.inserted[name] for name in columns})
+
+
+def _insert():
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.mysql import insert
+    return insert(TimelineEntry.__table__)
+
+
+def fan_out(room):
+    """
+    Pushes a new room to the timelines of its creator and, unless they have
+    more than TIMELINE_FANOUT_LIMIT followers, of their followers. The room
+    must be flushed (it needs its id and date); the caller commits.
+    """
+
+    size = current_app.config['TIMELINE_SIZE']
+    # the follower limit is checked inside the statements rather than with a
+    # query of its own; aliased so it isn't correlated with the outer user
+    creator = User.__table__.alias('creator')
+    fans_out = db.select(creator.c.id).where(
+        creator.c.id == room.user_id,
+        creator.c.follower_count <= current_app.config['TIMELINE_FANOUT_LIMIT']
+    ).exists()
+    followers = db.select(follow.c.follower_id).where(follow.c.followed_id == room.user_id)
+    targets = db.or_(User.id == room.user_id, db.and_(fans_out, User.id.in_(followers)))
+
+    db.session.execute(
+        User.__table__.update()
+        .where(targets)
+        .values(timeline_seq=User.timeline_seq + 1)
+    )
+    rows = db.select(
+        User.id,
+        User.timeline_seq % size,
+        db.literal(room.id, db.Integer),
+        db.literal(room.user_id, db.Integer),
+        db.literal(room.date_created, db.DateTime),
+    ).where(targets)
+    db.session.execute(_upsert(_insert().from_select(
+        ['user_id', 'slot', 'room_id', 'creator_id', 'date_created'], rows
+    )))
+
+
+def _push(user_id, rooms):
+    """
+    Pushes (room_id, creator_id, date_created) rows, oldest first, to one
+    user's timeline.
+    """
+
+    if not rooms:
+        return
+    size = current_app.config['TIMELINE_SIZE']
+    # a ring of `size` slots only holds the newest `size` rooms anyway
+    rooms = rooms[-size:]
+    # reserve the slots first: the UPDATE locks the user row until commit, so
+    # a concurrent push or fan_out() to this user waits and then gets the
+    # slots after ours instead of reading the same seq and overwriting them
+    db.session.execute(
+        User.__table__.update()
+        .where(User.id == user_id)
+        .values(timeline_seq=User.timeline_seq + len(rooms))
+    )
+    end = db.session.query(User.timeline_seq).filter(User.id == user_id).scalar()
+    start = end - len(rooms)
+    db.session.execute(_upsert(_insert()), [
+        {'user_id': user_id, 'slot': (start + n) % size, 'room_id': room_id,
+         'creator_id': creator_id, 'date_created': date_created}
+        for n, (room_id, creator_id, date_created) in enumerate(rooms, 1)
+    ])
+
+
+def _newest_rooms(creators, limit):
+    rows = db.session.execute(
+        db.select(Room.id, Room.user_id, Room.date_created)
+        .where(creators)
+        .order_by(Room.date_created.desc(), Room.id.desc())
+        .limit(limit)
+    ).all()
+    return [tuple(row) for row in reversed(rows)]
+
+
+def backfill(user_id, creator_id):
+    """
+    Copies the newest TIMELINE_BACKFILL rooms of a user just followed into
+    the follower's timeline (nothing for a creator whose rooms are pulled).
+    The caller commits.
+    """
+
+    if creator_id in celebrities():
+        return
+    _push(user_id, _newest_rooms(Room.user_id == creator_id, current_app.config['TIMELINE_BACKFILL']))
+
+
+def unfollowed(user_id, creator_id):
+    db.session.execute(TimelineEntry.__table__.delete().where(
+        TimelineEntry.user_id == user_id,
+        TimelineEntry.creator_id == creator_id
+    ))
+
+
+def remove_room(room_id):
+    """
+    Drops a room from every timeline, used before the room itself is deleted.
+    """
+
+    db.session.execute(TimelineEntry.__table__.delete().where(TimelineEntry.room_id == room_id))
+
+
+def rebuild(user_id):
+    """
+    Recomputes one user's timeline from whom they follow. The caller commits.
+    """
+
+    followed = db.select(follow.c.followed_id).where(
+        follow.c.follower_id == user_id,
+        follow.c.followed_id.notin_(celebrities())
+    )
+    db.session.execute(TimelineEntry.__table__.delete().where(TimelineEntry.user_id == user_id))
+    creators = db.or_(Room.user_id == user_id, Room.user_id.in_(followed))
+    _push(user_id, _newest_rooms(creators, current_app.config['TIMELINE_SIZE']))
+
+
+def _pulled(user_id, position, limit):
+    """
+    (room_id, date_created) of the newest rooms past `position` of the
+    followed creators whose rooms aren't fanned out, `limit` per creator.
+    """
+
+    others = celebrities() - {user_id}
+    if not others:
+        return []
+    followed = [pk for pk, in db.session.query(follow.c.followed_id).filter(
+        follow.c.follower_id == user_id,
+        follow.c.followed_id.in_(others)
+    )]
+    if not followed:
+        return []
+    filters, order_by = keyset_range(Room.date_created, Room.id, position)
+    parts = []
+    for creator_id in followed:
+        newest = (db.select(Room.id, Room.date_created)
+                  .where(Room.user_id == creator_id, *filters)
+                  .order_by(*order_by)
+                  .limit(limit)
+                  .subquery())
+        parts.append(db.select(newest.c.id, newest.c.date_created))
+    return db.session.execute(db.union_all(*parts) if len(parts) > 1 else parts[0]).all()
+
+
+def timeline_page(user_id, cursor=None, per_page=5):
+    """
+    A KeysetPage of Room objects (creators loaded) from the user's timeline,
+    newest first, with the same cursors as keyset_paginate().
+    """
+
+    position = decode_cursor(cursor)
+    limit = per_page + 1
+    filters, order_by = keyset_range(TimelineEntry.date_created, TimelineEntry.room_id, position)
+    pushed = db.session.execute(
+        db.select(TimelineEntry.room_id, TimelineEntry.date_created)
+        .where(TimelineEntry.user_id == user_id, *filters)
+        .order_by(*order_by)
+        .limit(limit)
+    ).all()
+
+    # each source holds its own first `limit` rows past the cursor, so the
+    # first `limit` of the merge are right; a room in both is kept once
+    dates = dict(chain(pushed, _pulled(user_id, position, limit)))
+    backwards = position is not None and position[0] == PREV
+    ordered = sorted(dates, key=lambda pk: (dates[pk], pk), reverse=not backwards)[:limit]
+    ids = ordered[:per_page]
+    more = len(ordered) > per_page
+
+    rooms = {}
+    if ids:
+        query = Room.query.options(db.joinedload(Room.creator)).filter(Room.id.in_(ids))
+        rooms = {room.id: room for room in query}
+    items = [rooms[pk] for pk in ids if pk in rooms]
+    if backwards:
+        return KeysetPage(list(reversed(items)), True, more, Room.date_created, Room.id)
+    return KeysetPage(items, more, position is not None, Room.date_created, Room.id)
@@ -0,0 +1,65 @@
+"""
+Cache for login_manager.user_loader
+
+Flask-Login reloads the logged-in user on every request. UserCache keeps the
+user's columns (never the password hash) keyed by id and rebuilds a
+session-attached User from them without a query.
+
+USER_CACHE_BACKEND = 'memory'  per-process TTL/LRU (TTLCache). Other worker
+                               processes can serve a stale entry for up to
+                               USER_CACHE_TTL seconds after a write.
+USER_CACHE_BACKEND = 'shared'  the CACHE_STORE shared by all workers, so an
+                               invalidation is seen everywhere at once.
+"""
+
+from sqlalchemy.orm import make_transient_to_detached
+from studyonline.cache import SharedCache, TTLCache, make_store
+
+# loaded lazily from the database if anything ever needs it
+_UNCACHED_COLUMNS = {'password'}
+
+
+class UserCache:
+
+    def __init__(self):
+        self.backend = TTLCache()
+
+    def init_app(self, app):
+        ttl = app.config['USER_CACHE_TTL']
+        if app.config['USER_CACHE_BACKEND'] == 'shared':
+            self.backend = SharedCache(make_store(app), 'user', ttl=ttl)
+        else:
+            self.backend = TTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=ttl)
+
+    @property
+    def stats(self):
+        return self.backend.stats
+
+    def get(self, user_id):
+        """
+        Returns the User with `user_id` attached to the current session, or None.
+        """
+
+        from studyonline import db
+        from studyonline.models import User
+
+        data = self.backend.get(user_id)
+        if data is None:
+            user = User.query.get(user_id)
+            if user is not None:
+                self.backend.set(user_id, {
+                    column.key: getattr(user, column.key)
+                    for column in User.__table__.columns
+                    if column.key not in _UNCACHED_COLUMNS
+                })
+            return user
+
+        user = User(**data)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+
+user_cache = UserCache()
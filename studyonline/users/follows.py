@@ -0,0 +1,72 @@
+"""
+Following users.
+
+follow is the source of truth and User.follower_count / following_count
+counters kept in step with it in the same transaction, moved with
+    UPDATE user SET follower_count = follower_count + 1
+only when a follow row was really inserted or deleted, like
+Room.total_members (rooms/membership.py). Following someone also copies
+their newest rooms into the follower's timeline, unfollowing removes them
+(see studyonline/timeline.py).
+"""
+
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from studyonline import db, timeline
+from studyonline.models import User, follow as follow_table
+
+
+def _bump(follower_id, followed_id, delta):
+    db.session.execute(
+        User.__table__.update()
+        .where(User.id == followed_id)
+        .values(follower_count=User.follower_count + delta)
+    )
+    db.session.execute(
+        User.__table__.update()
+        .where(User.id == follower_id)
+        .values(following_count=User.following_count + delta)
+    )
+
+
+def follow(follower_id, followed_id):
+    """
+    Returns True if the user now follows, False if they already did.
+    """
+
+    try:
+        db.session.execute(follow_table.insert().values(
+            follower_id=follower_id,
+            followed_id=followed_id,
+            created_at=datetime.utcnow()
+        ))
+        _bump(follower_id, followed_id, 1)
+        timeline.backfill(follower_id, followed_id)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def unfollow(follower_id, followed_id):
+    """
+    Returns True if the user stopped following, False if they didn't follow.
+    """
+
+    result = db.session.execute(follow_table.delete().where(
+        follow_table.c.follower_id == follower_id,
+        follow_table.c.followed_id == followed_id
+    ))
+    if result.rowcount:
+        _bump(follower_id, followed_id, -1)
+        timeline.unfollowed(follower_id, followed_id)
+    db.session.commit()
+    return bool(result.rowcount)
+
+
+def is_following(follower_id, followed_id):
+    return db.session.query(db.exists().where(
+        follow_table.c.follower_id == follower_id,
+        follow_table.c.followed_id == followed_id
+    )).scalar()
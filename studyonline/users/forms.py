@@ -2,8 +2,9 @@ from flask_wtf import FlaskForm
 from flask_login import current_user
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, SubmitField, PasswordField
+from studyonline import db
 from studyonline.models import User
-from wtforms.validators import DataRequired, Length, Email, ValidationError, EqualTo
+from wtforms.validators import DataRequired, Length, Email, EqualTo
 
 class LoginForm(FlaskForm):
     """
@@ -30,7 +31,67 @@ class LoginForm(FlaskForm):
     )
     submit = SubmitField('Sign In')
 
-class RegistrationForm(FlaskForm):
+USERNAME_TAKEN = 'Username Already taken!. Please choose another one.'
+EMAIL_TAKEN = 'Email Already taken!. Please choose another one.'
+
+class UniqueUserMixin:
+    """
+    Checks that username and email are free in a single round trip:
+        SELECT EXISTS(... username ...), EXISTS(... email ...)
+    The unique constraints on user.username and user.email stay the source of
+    truth; a concurrent signup that slips past this check is caught as an
+    IntegrityError on commit and handed to unique_violation().
+    """
+
+    def _unique_check(self):
+        """
+        Returns (username, email) values to check, None meaning skip the column.
+        """
+        return self.username.data, self.email.data
+
+    def _exclude_user_id(self):
+        return None
+
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators=extra_validators)
+        if self.username.errors or self.email.errors:
+            return False
+
+        username, email = self._unique_check()
+        if username is None and email is None:
+            return valid
+
+        filters = []
+        if self._exclude_user_id() is not None:
+            filters.append(User.id != self._exclude_user_id())
+        username_taken, email_taken = db.session.query(
+            db.exists().where(User.username == username, *filters),
+            db.exists().where(User.email == email, *filters)
+        ).one()
+
+        if username is not None and username_taken:
+            self.username.errors = list(self.username.errors) + [USERNAME_TAKEN]
+            valid = False
+        if email is not None and email_taken:
+            self.email.errors = list(self.email.errors) + [EMAIL_TAKEN]
+            valid = False
+        return valid
+
+    def unique_violation(self, error):
+        """
+        Maps an IntegrityError from the user unique constraints back onto the
+        form. Returns False if the error was about something else.
+        """
+        message = str(error.orig).lower()
+        if 'username' in message:
+            self.username.errors = list(self.username.errors) + [USERNAME_TAKEN]
+            return True
+        if 'email' in message:
+            self.email.errors = list(self.email.errors) + [EMAIL_TAKEN]
+            return True
+        return False
+
+class RegistrationForm(UniqueUserMixin, FlaskForm):
     """
     'Registration' form 
         Fields
@@ -40,9 +101,9 @@ class RegistrationForm(FlaskForm):
             confirm_password
         Button
             submit
-        Flask Validator - SQLAlchemy error
-            validate_username()
-            validate_email()
+        Uniqueness - UniqueUserMixin
+            validate()
+            unique_violation()
     """
     name = StringField(
             'Name', 
@@ -80,17 +141,7 @@ class RegistrationForm(FlaskForm):
     )  
     submit = SubmitField('Sign Up')
 
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Username Already taken!. Please choose another one.')
-    
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email Already taken!. Please choose another one.')
-
-class UpdateAccountForm(FlaskForm):
+class UpdateAccountForm(UniqueUserMixin, FlaskForm):
     """
     'UpdateAccount' form 
         Fields
@@ -99,9 +150,9 @@ class UpdateAccountForm(FlaskForm):
             picture
         Button
             submit
-        Flask Validator - SQLAlchemy error
-            validate_username()
-            validate_email()
+        Uniqueness - UniqueUserMixin
+            validate()
+            unique_violation()
     """
     name = StringField(
             'Name', 
@@ -132,14 +183,59 @@ class UpdateAccountForm(FlaskForm):
     )
     submit = SubmitField('Update')
 
-    def validate_username(self, username):
-        if username.data != current_user.username:
-            user = User.query.filter_by(username=username.data).first()
-            if user:
-                raise ValidationError('Username Already taken!. Please choose another one.')
-    
-    def validate_email(self, email):
-         if email.data != current_user.email:
-            user = User.query.filter_by(email=email.data).first()
-            if user:
-                raise ValidationError('Email Already taken!. Please choose another one.')
\ No newline at end of file
+    def _unique_check(self):
+        username = self.username.data if self.username.data != current_user.username else None
+        email = self.email.data if self.email.data != current_user.email else None
+        return username, email
+
+    def _exclude_user_id(self):
+        return current_user.id
+
+class RequestResetForm(FlaskForm):
+    """
+    'RequestReset' form 
+        Fields
+            email
+        Button
+            submit
+    """
+    email = StringField(
+            'Email', 
+            validators=[
+                DataRequired(), 
+                Email()
+            ]
+    )
+    submit = SubmitField('Request Password Reset')
+
+class ResetPasswordForm(FlaskForm):
+    """
+    'ResetPassword' form 
+        Fields
+            password
+            confirm_password
+        Button
+            submit
+    """
+    password = PasswordField(
+            'Password', 
+            validators=[
+                DataRequired()
+            ]
+    )
+    confirm_password = PasswordField(
+            'Confirm Password', 
+            validators=[
+                DataRequired(), 
+                EqualTo('password')
+            ]
+    )  
+    submit = SubmitField('Reset Password')
+
+class FollowForm(FlaskForm):
+    """
+    'Follow' form - only carries the CSRF token.
+    Follow/unfollow buttons post it to users.follow / users.unfollow.
+    """
+
+    submit = SubmitField('Follow')
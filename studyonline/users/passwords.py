@@ -0,0 +1,77 @@
+"""
+Password hashing
+
+bcrypt is deliberately slow, and at our default cost it is the most
+expensive thing the login and register endpoints do. Hashes are computed in
+a small bounded thread pool (BCRYPT_WORKERS) so that, however many requests
+are logging in at once, at most that many cores are busy hashing and the
+remaining workers keep serving I/O-bound pages. The bcrypt C extension
+releases the GIL, so the pool threads really run in parallel.
+
+The cost factor is BCRYPT_LOG_ROUNDS. Raising it doesn't invalidate existing
+hashes: users.login rehashes a password at the new cost the next time its
+owner logs in (needs_rehash()).
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from studyonline import bcrypt
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """
+    The pool is created on first use rather than at import so it never
+    exists in a pre-fork master process.
+    """
+
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=current_app.config['BCRYPT_WORKERS'],
+                thread_name_prefix='bcrypt'
+            )
+        return _pool
+
+
+def _run(fn, *args):
+    if current_app.config['BCRYPT_WORKERS'] <= 0:
+        return fn(*args)
+    return _executor().submit(fn, *args).result()
+
+
+def hash_password(password):
+    return _run(bcrypt.generate_password_hash, password).decode('utf-8')
+
+
+def check_password(pw_hash, password):
+    return _run(bcrypt.check_password_hash, pw_hash, password)
+
+
+def hash_cost(pw_hash):
+    """
+    The log2 cost stored in a bcrypt hash: $2b$<cost>$<salt+hash>
+    """
+
+    try:
+        return int(pw_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def needs_rehash(pw_hash):
+    return hash_cost(pw_hash) != current_app.config['BCRYPT_LOG_ROUNDS']
+
+
+def hash_passwords(passwords):
+    """
+    Hashes many passwords at once across the whole pool, for bulk imports.
+    """
+
+    if current_app.config['BCRYPT_WORKERS'] <= 0:
+        return [bcrypt.generate_password_hash(password).decode('utf-8') for password in passwords]
+    return [pw_hash.decode('utf-8') for pw_hash in _executor().map(bcrypt.generate_password_hash, passwords)]
@@ -0,0 +1,56 @@
+"""
+Password reset tokens
+
+Tokens are stateless: the user id signed with SECRET_KEY by itsdangerous,
+with a timestamp checked against PASSWORD_RESET_MAX_AGE. Nothing is stored
+per token. A fingerprint of the current password hash is signed in as well,
+so a token stops working once the password was changed (by this token or
+otherwise) and each link can only be used once.
+"""
+
+import hashlib
+import hmac
+from flask import current_app, render_template, url_for
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from studyonline import db
+from studyonline.mail import send_email
+from studyonline.models import User
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='password-reset')
+
+
+def _fingerprint(user):
+    return hashlib.sha256(user.password.encode()).hexdigest()[:16]
+
+
+def reset_token(user):
+    return _serializer().dumps({'id': user.id, 'pw': _fingerprint(user)})
+
+
+def verify_reset_token(token):
+    """
+    Returns the user the token was issued to, None if it is forged, expired
+    or already used. (SignatureExpired is a BadSignature.)
+    """
+
+    try:
+        data = _serializer().loads(token, max_age=current_app.config['PASSWORD_RESET_MAX_AGE'])
+    except BadSignature:
+        return None
+    user = db.session.get(User, data.get('id'))
+    if user is None or not hmac.compare_digest(data.get('pw', ''), _fingerprint(user)):
+        return None
+    return user
+
+
+def send_reset_email(user):
+    """
+    Queues the reset link in the outbox, nothing is sent from the request.
+    """
+
+    url = url_for('users.reset_token', token=reset_token(user), _external=True)
+    minutes = current_app.config['PASSWORD_RESET_MAX_AGE'] // 60
+    body = render_template('email/reset_password.txt', user=user, url=url, minutes=minutes)
+    send_email(user.email, 'StudyOnline password reset', body)
@@ -1,13 +1,23 @@
-import time
-from flask import Blueprint, url_for, redirect, render_template, flash, request
+from os import path
+from flask import Blueprint, url_for, redirect, render_template, flash, request, current_app, send_from_directory, abort
 from flask_login import current_user, login_user, login_required, logout_user
-from studyonline.users.forms import LoginForm, RegistrationForm, UpdateAccountForm
-from studyonline.users.utils import save_picture
+from sqlalchemy.exc import IntegrityError
+from studyonline.users.forms import (LoginForm, RegistrationForm, UpdateAccountForm, RequestResetForm,
+                                     ResetPasswordForm, FollowForm)
+from studyonline.users.utils import save_picture, check_picture, avatar_url, content_digest, PROFILE_PICS
 from studyonline.models import User, Room
-from studyonline import db, bcrypt
+from studyonline.pagination import keyset_paginate
+from studyonline.users.cache import user_cache
+from studyonline.main.utils import feed_cache
+from studyonline.users.passwords import hash_password, check_password, needs_rehash
+from studyonline.users.reset import send_reset_email, verify_reset_token
+from studyonline.users import follows
+from studyonline import db
+from studyonline.database import read_only
 
 
 users = Blueprint('users', __name__)
+users.add_app_template_filter(avatar_url, 'avatar')
 
 @users.route('/login', methods=['GET','POST'])
 def login():
@@ -19,7 +29,10 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        if user and check_password(user.password, form.password.data):
+            if needs_rehash(user.password):
+                user.password = hash_password(form.password.data)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else  redirect(url_for('main.home'))
@@ -34,7 +47,6 @@ def logout():
     """
 
     logout_user()
-    time.sleep(2)
     flash('Logged out! see you next time.', 'success')
     return redirect(url_for('main.home'))
 
@@ -61,14 +73,59 @@ def register():
         return redirect(url_for('main.home'))
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = hash_password(form.password.data)
         user = User(name=form.name.data,username=form.username.data,email=form.email.data, password=hashed_password)
         db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            db.session.rollback()
+            if not form.unique_violation(error):
+                raise
+        else:
+            flash('Successfully registered!', 'success')
+            return redirect(url_for('users.login'))
+    return render_template('register.html', title='Register', form=form)
+
+@users.route('/reset_password', methods=['GET','POST'])
+def reset_request():
+    """
+    Emails a reset link. The answer is the same whether or not the email
+    belongs to an account, so the form can't be used to find out who is
+    registered. The email only goes into the outbox here.
+    """
+
+    if current_user.is_authenticated:
+        return redirect(url_for('main.home'))
+    form = RequestResetForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        if user:
+            send_reset_email(user)
+        flash('If an account uses that email, a link to reset its password is on its way.', 'info')
+        return redirect(url_for('users.login'))
+    return render_template('reset_request.html', title='Reset Password', form=form)
+
+@users.route('/reset_password/<token>', methods=['GET','POST'])
+def reset_token(token):
+    """
+    Sets a new password for the user the (still valid) token was issued to.
+    """
+
+    if current_user.is_authenticated:
+        return redirect(url_for('main.home'))
+    user = verify_reset_token(token)
+    if user is None:
+        flash('That reset link is invalid or has expired.', 'warning')
+        return redirect(url_for('users.reset_request'))
+    form = ResetPasswordForm()
+    if form.validate_on_submit():
+        user.password = hash_password(form.password.data)
         db.session.commit()
-        time.sleep(1)
-        flash('Successfully registered!', 'success')
+        user_cache.invalidate(user.id)
+        flash('Your password has been updated! You can now sign in.', 'success')
         return redirect(url_for('users.login'))
-    return render_template('register.html', title='Register', form=form)
+    return render_template('reset_token.html', title='Reset Password', form=form)
 
 @users.route('/account', methods=['GET','POST'])
 @login_required
@@ -80,16 +137,34 @@ def account():
 
     form = UpdateAccountForm()
     if form.validate_on_submit():
+        picture = None
         if form.picture.data:
-            picture = save_picture(form.picture.data)
-            current_user.image_file = picture
-
+            # checked before anything is saved, a file Pillow can't read is a
+            # form error rather than a failed upload after the commit
+            picture = form.picture.data.read()
+            try:
+                check_picture(picture)
+            except ValueError as error:
+                form.picture.errors = list(form.picture.errors) + [str(error)]
+                return render_template('account.html', title="Account", form=form)
         current_user.name = form.name.data
         current_user.username = form.username.data
         current_user.email = form.email.data
-        db.session.commit()
-        time.sleep(1)
+        try:
+            db.session.commit()
+        except IntegrityError as error:
+            db.session.rollback()
+            if not form.unique_violation(error):
+                raise
+            return render_template('account.html', title="Account", form=form)
+        user_cache.invalidate(current_user.id)
+        feed_cache.invalidate()
         flash('Account Updated!', 'success')
+        if picture:
+            if save_picture(picture, current_user):
+                flash('Your new profile picture will appear in a moment.', 'info')
+            else:
+                flash('Too many uploads right now, please try your picture again shortly.', 'warning')
         return redirect(url_for('users.account'))
     if request.method == 'GET':
         form.name.data = current_user.name
@@ -100,19 +175,83 @@ def account():
 
 @users.route('/profile/<string:username>')
 @login_required
+@read_only
 def profile(username):
-    user = User.query.filter_by(username=username).first()
-    return render_template('profile.html', title='Profile', user=user)
+    user = User.query.filter_by(username=username).first_or_404()
+    following = user.id != current_user.id and follows.is_following(current_user.id, user.id)
+    return render_template('profile.html', title='Profile', user=user, following=following,
+                           follow_form=FollowForm())
+
+@users.route('/profile/<string:username>/follow', methods=['POST'])
+@login_required
+def follow(username):
+    """
+    Current user follows another user, their rooms show up in /timeline.
+    """
+
+    form = FollowForm()
+    if not form.validate_on_submit():
+        abort(400)
+    # ids and username read before the commit, which expires both users
+    user_id = User.query.filter_by(username=username).first_or_404().id
+    follower_id = current_user.id
+    if user_id == follower_id:
+        flash('You cannot follow yourself.', 'info')
+    elif follows.follow(follower_id, user_id):
+        user_cache.invalidate(follower_id)
+        user_cache.invalidate(user_id)
+        flash(f'Following @{username}!', 'success')
+    return redirect(request.referrer or url_for('users.profile', username=username))
+
+@users.route('/profile/<string:username>/unfollow', methods=['POST'])
+@login_required
+def unfollow(username):
+    """
+    Current user stops following a user.
+    """
+
+    form = FollowForm()
+    if not form.validate_on_submit():
+        abort(400)
+    user_id = User.query.filter_by(username=username).first_or_404().id
+    follower_id = current_user.id
+    if follows.unfollow(follower_id, user_id):
+        user_cache.invalidate(follower_id)
+        user_cache.invalidate(user_id)
+        flash(f'Unfollowed @{username}.', 'info')
+    return redirect(request.referrer or url_for('users.profile', username=username))
 
 @users.route('/user_rooms/<string:username>')
+@read_only
 def user_rooms(username):
     """
     Displays all rooms of a user
     """
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     user = User.query.filter_by(username=username).first_or_404()
-    rooms = Room.query.filter_by(creator=user)\
-                .order_by(Room.date_created.desc())\
-                    .paginate(per_page=5, page=page)
+    # every room's creator is `user`, already in the session's identity map,
+    # so room.creator in the template resolves without another query
+    rooms = keyset_paginate(Room.query.filter_by(creator=user), Room.date_created, Room.id,
+                            cursor=cursor, per_page=5, total=user.room_count)
     
-    return render_template('user_rooms.html', title='Rooms',rooms=rooms, user=user) 
\ No newline at end of file
+    return render_template('user_rooms.html', title='Rooms',rooms=rooms, user=user)
+
+@users.route('/avatars/<string:filename>')
+def avatar(filename):
+    """
+    Serves profile pictures.
+    Content-addressed pictures never change under their name, so browsers may
+    keep them for a year without revalidating; the content hash doubles as
+    the ETag for conditional GETs. Legacy pictures get a short max-age.
+    """
+
+    digest = content_digest(filename)
+    directory = path.join(current_app.root_path, PROFILE_PICS)
+    if digest is None:
+        return send_from_directory(directory, filename, max_age=current_app.config['AVATAR_LEGACY_MAX_AGE'])
+
+    response = send_from_directory(directory, filename, etag=digest,
+                                   max_age=current_app.config['AVATAR_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
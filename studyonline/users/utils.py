@@ -1,25 +1,308 @@
-import secrets
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from io import BytesIO
 from os import path
-from PIL import Image
-from flask import current_app
+from flask import current_app, url_for
 
-def save_picture(form_picture):
+PROFILE_PICS = 'static/profile_pics'
+DEFAULT_PICTURE = 'default.jpg'
+
+# processed pictures are stored as <name>_<size>.jpg, one file per size
+_SIZED_NAME = re.compile(r'^(?P<stem>.+)_(?P<size>\d+)(?P<ext>\.\w+)$')
+# <name> is the content hash of the largest processed size for new uploads
+_CONTENT_ADDRESSED = re.compile(r'^(?P<digest>[0-9a-f]{32})_\d+\.jpg$')
+# seconds a picture file is kept after it was last written or reused, even
+# with no user pointing at it yet
+PICTURE_GRACE = 3600
+# _write_once() and remove_picture() of this process don't interleave
+_files_lock = threading.Lock()
+
+
+def avatar_variant(image_file, size):
+    """
+    Filename of the `size` px variant of a stored picture.
+    Pictures uploaded before multi-size processing (and default.jpg) only
+    exist in one size, so they are returned unchanged.
+    """
+
+    match = _SIZED_NAME.match(image_file)
+    if not match:
+        return image_file
+    return f"{match.group('stem')}_{size}{match.group('ext')}"
+
+
+def avatar_url(image_file, size=120):
+    """
+    Jinja filter: {{ user.image_file|avatar(40) }}
+    """
+
+    return url_for('users.avatar', filename=avatar_variant(image_file, size))
+
+
+def content_digest(filename):
+    """
+    The content hash a picture is stored under, or None for legacy names.
+    Content-addressed files never change, so they can be cached forever.
+    """
+
+    match = _CONTENT_ADDRESSED.match(filename)
+    return match.group('digest') if match else None
+
+
+def picture_path(app, filename):
+    return path.join(app.root_path, PROFILE_PICS, filename)
+
+
+def _write_once(app, filename, data):
+    """
+    Writes `data` unless a file with the same content-addressed name already
+    exists, which is how identical uploads end up sharing one file on disk.
+    A reused file has its mtime bumped, so remove_picture() and
+    prune_pictures() leave it alone until the new user points at it.
+    """
+
+    target = picture_path(app, filename)
+    with _files_lock:
+        try:
+            os.utime(target)
+            return
+        except FileNotFoundError:
+            pass
+        tmp_path = f'{target}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, target)
+
+
+def check_picture(data):
+    """
+    Raises ValueError unless Pillow recognises `data` as an image. Only the
+    header and structure are read (verify()), the decoding is left to
+    process_picture(), so this is cheap enough for the request thread.
+    """
+
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(data)) as pic:
+            pic.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as error:
+        # UnidentifiedImageError is an OSError
+        raise ValueError('That file is not a picture we can read.') from error
+
+
+def process_picture(app, data):
+    """
+    Decodes an uploaded picture once and writes one JPEG per AVATAR_SIZES entry.
+    Returns the filename of the largest variant, which is what User.image_file stores.
+
+    draft() lets the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, so
+    a 12 megapixel phone photo is never fully expanded in memory. Each smaller
+    size is thumbnailed from the previous one rather than from the original.
+
+    Files are named after the hash of the largest encoded size, so uploading
+    the same picture twice (or two users picking the same one) stores it once.
+
+    Pillow is imported here rather than at the top of the module, so workers
+    that never handle an upload don't load it.
+    """
+
+    from PIL import Image, ImageOps
+
+    sizes = sorted(app.config['AVATAR_SIZES'], reverse=True)
+    pic = Image.open(BytesIO(data))
+    pic.draft('RGB', (sizes[0], sizes[0]))
+    pic = ImageOps.exif_transpose(pic).convert('RGB')
+
+    encoded = {}
+    for size in sizes:
+        pic.thumbnail((size, size))
+        out = BytesIO()
+        pic.save(out, 'JPEG', quality=85, optimize=True)
+        encoded[size] = out.getvalue()
+
+    digest = hashlib.sha256(encoded[sizes[0]]).hexdigest()[:32]
+    for size, jpeg in encoded.items():
+        _write_once(app, f'{digest}_{size}.jpg', jpeg)
+
+    return f'{digest}_{sizes[0]}.jpg'
+
+
+def picture_in_use(image_file):
+    from studyonline import db
+    from studyonline.models import User
+
+    return db.session.query(
+        db.exists().where(User.image_file == image_file)
+    ).scalar()
+
+
+def remove_picture(app, image_file):
+    """
+    Deletes every size of a stored picture once no user references it.
+    default.jpg is shared and kept.
+
+    Content-addressed files are shared, another upload of the same picture
+    may be about to point its user at them. Files written or reused in the
+    last PICTURE_GRACE seconds are therefore left for prune_pictures().
+    """
+
+    if not image_file or image_file == DEFAULT_PICTURE:
+        return
+    names = {image_file} | {avatar_variant(image_file, size) for size in app.config['AVATAR_SIZES']}
+    cutoff = time.time() - PICTURE_GRACE
+    with _files_lock:
+        if picture_in_use(image_file):
+            return
+        for name in names:
+            try:
+                if os.stat(picture_path(app, name)).st_mtime > cutoff:
+                    return
+            except FileNotFoundError:
+                pass
+        for name in names:
+            try:
+                os.remove(picture_path(app, name))
+            except FileNotFoundError:
+                pass
+
+
+def prune_pictures(app, grace=PICTURE_GRACE, dry_run=False):
+    """
+    Garbage-collects files in static/profile_pics that no User.image_file
+    references. Files younger than `grace` seconds are skipped so uploads
+    still being processed are not collected.
+
+    Returns the list of removed (or, with dry_run, removable) filenames.
+    """
+
+    from studyonline import db
+    from studyonline.models import User
+
+    keep = {DEFAULT_PICTURE}
+    for (image_file,) in db.session.query(User.image_file).distinct().yield_per(1000):
+        keep.add(image_file)
+        keep.update(avatar_variant(image_file, size) for size in app.config['AVATAR_SIZES'])
+
+    directory = path.join(app.root_path, PROFILE_PICS)
+    cutoff = time.time() - grace
+    removed = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name in keep or entry.stat().st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(entry.path)
+            removed.append(entry.name)
+    return removed
+
+
+def _replace_picture(app, user_id, old_image, data):
     """
-    This will reduce the resolution a file and then save it to a specific loaction i.e 'static/profile_pics'.
+    Background job: process the upload, then point the user at it.
 
-    random_hex : will generate a number alpha numeric numbers
-    file_ext: with help of os module, file is split to generate --> tuple(filename, extension) 
-    picture: genreated filename -> random_hex.file_ext
-    picture_path: path is created so that picutre can be saved to static/profile_pics sub directory
+    The UPDATE only matches if the user still has the picture they had when
+    they uploaded, so if two uploads race the first one to finish wins and the
+    loser's files are removed instead of being orphaned.
     """
 
-    random_hex = secrets.token_hex(8)
-    _, file_ext = path.splitext(form_picture.filename)
-    picture = random_hex + file_ext
-    picture_path = path.join(current_app.root_path, 'static/profile_pics', picture)
-    output_size = (120, 120)
-    pic = Image.open(form_picture)
-    pic.thumbnail(output_size)
-    pic.save(picture_path)
+    from studyonline import db
+    from studyonline.models import User
+    from studyonline.users.cache import user_cache
+    from studyonline.main.utils import feed_cache
+
+    new_image = process_picture(app, data)
+    result = db.session.execute(
+        User.__table__.update()
+        .where(User.id == user_id, User.image_file == old_image)
+        .values(image_file=new_image)
+    )
+    db.session.commit()
+    if result.rowcount:
+        user_cache.invalidate(user_id)
+        feed_cache.invalidate()
+        remove_picture(app, old_image)
+    else:
+        remove_picture(app, new_image)
+
+
+class ImagePipeline:
+    """
+    Bounded background pool for picture processing.
+
+    A fixed number of worker threads (IMAGE_WORKERS) drain a local job queue
+    holding at most IMAGE_QUEUE_SIZE uploads, so a burst of uploads can't
+    exhaust memory or CPU. Pillow releases the GIL while decoding and
+    resizing, so threads are enough here. Workers start on the first upload.
+    With IMAGE_PIPELINE_ASYNC off (TestConfig) jobs run inline.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self, app):
+        with self._lock:
+            if self._queue is not None:
+                return
+            self._queue = queue.Queue(maxsize=app.config['IMAGE_QUEUE_SIZE'])
+            for n in range(app.config['IMAGE_WORKERS']):
+                thread = threading.Thread(target=self._work, name=f'image-worker-{n}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            app, job, args = self._queue.get()
+            try:
+                with app.app_context():
+                    job(app, *args)
+            except Exception:
+                app.logger.exception('profile picture processing failed')
+            finally:
+                self._queue.task_done()
+
+    def submit(self, job, *args):
+        """
+        Queues job(app, *args). Returns False if the queue is full.
+        """
+
+        app = current_app._get_current_object()
+        if not app.config['IMAGE_PIPELINE_ASYNC']:
+            job(app, *args)
+            return True
+        self._start(app)
+        try:
+            self._queue.put_nowait((app, job, args))
+        except queue.Full:
+            return False
+        return True
+
+    def join(self):
+        """
+        Blocks until every queued job has finished.
+        """
+
+        if self._queue is not None:
+            self._queue.join()
+
+
+pipeline = ImagePipeline()
+
+
+def save_picture(data, user):
+    """
+    Hands the upload, read in the request thread (the stream is gone once
+    the request ends) and passed by check_picture(), to the background
+    pipeline for decoding, resizing and saving. User.image_file is swapped
+    once processing finishes.
+
+    Returns False if the pipeline is saturated and the upload was dropped.
+    """
 
-    return picture
\ No newline at end of file
+    return pipeline.submit(_replace_picture, user.id, user.image_file, data)